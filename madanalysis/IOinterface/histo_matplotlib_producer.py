@@ -30,19 +30,59 @@ import shutil
 import os
 import sys
 
+
+# Error met when setting up a worker of the plot pool
+_worker_error = None
+
+
+def _InitializeWorker(histo_path):
+    """ Worker of the plot pool: matplotlib is imported once, with Agg """
+    # An exception here would make the pool restart the worker forever
+    global _worker_error
+    import traceback
+    try:
+        import matplotlib
+        matplotlib.use('Agg',force=True)
+        import matplotlib.pyplot
+        os.chdir(histo_path)
+        sys.path.insert(0,histo_path)
+    except Exception:
+        _worker_error = traceback.format_exc()
+
+
+def _RenderPlot(name):
+    """ Runs the function of a generated plot script, which saves all the formats """
+    import importlib
+    import traceback
+    if _worker_error is not None:
+        return name, _worker_error
+    import matplotlib.pyplot as plt
+    try:
+        getattr(importlib.import_module(name),name)()
+    except Exception:
+        return name, traceback.format_exc()
+    finally:
+        plt.close('all')
+    return name, None
+
+
 class HistoMatplotlibProducer():
 
-    def __init__(self,histo_path,filenames):
+    def __init__(self,histo_path,filenames,ncores=1):
         self.filenames  = []
         for filename in filenames:
             self.filenames.append(filename+'.py')
         self.histo_path = histo_path
+        self.ncores     = ncores
 
 
     def Execute(self):
         if not self.WriteMainFile():
             return False
-        if not self.LaunchInteractiveMatplotlib():
+        if min(self.ncores,len(self.filenames))>1:
+            if not self.LaunchMatplotlibPool():
+                return False
+        elif not self.LaunchInteractiveMatplotlib():
             return False
         return True
         
@@ -84,3 +124,37 @@ class HistoMatplotlibProducer():
         return ok
 
 
+    def LaunchMatplotlibPool(self):
+        """
+        Renders the plots in a pool of new Python processes. They are not
+        forked, the current process having possibly used matplotlib with a
+        GUI backend (e.g. macosx) already. all.py is kept to reproduce the
+        plots in a single process.
+        """
+        import multiprocessing
+        names   = [item.split('/')[-1][:-3] for item in self.filenames]
+        ncores  = min(self.ncores,len(names))
+        logname = os.path.normpath(self.histo_path+'/matplotlib.log')
+        logging.getLogger('MA5').debug('Rendering '+str(len(names))+' plots on '+str(ncores)+' cores')
+        pool = multiprocessing.get_context('spawn').Pool(ncores,_InitializeWorker,(self.histo_path,))
+        try:
+            errors = dict(pool.imap_unordered(_RenderPlot,names,chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+
+        # Log file, in the order of all.py
+        with open(logname,'w') as output:
+            output.write('BEGIN-STAMP\n')
+            for name in names:
+                output.write('- Producing histo '+name+'...\n')
+                if errors[name] is not None:
+                    output.write(errors[name])
+            output.write('END-STAMP\n')
+
+        # return result
+        ok = all(x is None for x in errors.values())
+        if not ok:
+            logging.getLogger('MA5').error('impossible to execute MatPlotLib. For more details, see the log file:')
+            logging.getLogger('MA5').error(logname)
+        return ok
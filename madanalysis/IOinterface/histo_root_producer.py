@@ -31,11 +31,12 @@ import os
 
 class HistoRootProducer():
 
-    def __init__(self,histo_path,filenames):
+    def __init__(self,histo_path,filenames,ncores=1):
         self.filenames  = []
         for filename in filenames:
             self.filenames.append((filename)+'.C')
         self.histo_path = histo_path
+        self.ncores     = ncores
 
 
     def Execute(self):
@@ -109,47 +110,88 @@ class HistoRootProducer():
             logging.getLogger('MA5').error(logname)
             return False
             
-        # Commands
-        theCommands=[self.histo_path+'/goROOT']
-
-        # Log file name
-        logname=os.path.normpath(self.histo_path+'/launch_root.log')
-        
-        # Execute
-        logging.getLogger('MA5').debug('shell command: '+' '.join(theCommands))
-        ok, out= ShellCommand.ExecuteWithLog(theCommands,\
-                                             logname,\
-                                             self.histo_path,\
-                                             silent=False)
+        # Drawing the plots
+        return self.LaunchPartitions()
+
+
+    def LaunchPartitions(self):
+        """
+        Draws the plots with ncores goROOT processes, each drawing a share of
+        the plots. A plot whose drawing stops its process is reported as
+        failed, and the plots of the process that were not drawn yet are
+        drawn again in a new round. The logs are gathered in launch_root.log.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        names   = [item.split('/')[-1][:-2] for item in self.filenames]
+        pending = names[:]
+        failed  = []
+        logs    = []
+        while len(pending)!=0:
+            ncores     = max(1,min(self.ncores,len(pending)))
+            partitions = [pending[i::ncores] for i in range(ncores)]
+            logging.getLogger('MA5').debug('Drawing '+str(len(pending))+' ROOT plots with '+\
+                                           str(ncores)+' processes')
+            with ThreadPoolExecutor(max_workers=ncores) as pool:
+                results = list(pool.map(lambda x: self.LaunchPartition(x[1],len(logs)+x[0]),\
+                                        enumerate(partitions)))
+            pending = []
+            for partition, (logname, started, finished) in zip(partitions,results):
+                logs.append(logname)
+                for name in partition:
+                    if name in finished:
+                        continue
+                    # the process stopped while drawing this plot (or did not start)
+                    if name in started or len(started)==0:
+                        failed.append(name)
+                    else:
+                        pending.append(name)
+
+        # Gathering the logs
+        logname = os.path.normpath(self.histo_path+'/launch_root.log')
+        with open(logname,'w') as output:
+            for item in logs:
+                with open(item,'r') as input:
+                    output.write(input.read())
+                os.remove(item)
 
         # return result
-        if not ok:
-            logging.getLogger('MA5').error('impossible to execute ROOT. For more details, see the log file:')
+        if len(failed)!=0:
+            logging.getLogger('MA5').error('ROOT failed to draw the plot(s) '+', '.join(sorted(failed))+\
+                                           '. For more details, see the log file:')
             logging.getLogger('MA5').error(logname)
-            return ok
+            return False
+        return True
 
-        # Reading log file
-        input = open(self.histo_path+'/launch_root.log')
-        ok1 = False
-        ok2 = False
-        for line in input:
-            if line.startswith('BEGIN-STAMP'):
-                ok1 = True
-            if line.startswith('END-STAMP'):
-                ok2 = True
-        input.close()
-        if not (ok1 and ok2):
-            logging.getLogger('MA5').error('wrong behaviour of the ROOT execution. For more details, see the log file:')
-            logging.getLogger('MA5').error(logname)
-            return ok
-        
-        return ok
+
+    def LaunchPartition(self,names,index):
+        """ Draws some plots with one goROOT process: log file, plots started and drawn """
+        theCommands = [self.histo_path+'/goROOT']+names
+        logname     = os.path.normpath(self.histo_path+'/launch_root_'+str(index)+'.log')
+        logging.getLogger('MA5').debug('shell command: '+' '.join(theCommands))
+        ShellCommand.ExecuteWithLog(theCommands,logname,self.histo_path,silent=False)
+
+        # Reading the stamps of the plots
+        started  = set()
+        finished = set()
+        try:
+            with open(logname,'r') as input:
+                for line in input:
+                    if line.startswith('BEGIN-PLOT '):
+                        started.add(line.split()[1])
+                    elif line.startswith('END-PLOT '):
+                        finished.add(line.split()[1])
+        except IOError:
+            open(logname,'w').close()
+        return logname, started, finished
 
 
     def WriteMainFile(self):
         output = open(self.histo_path+'/all.C','w')
         output.write('// STL headers\n')
         output.write('#include <iostream>\n')
+        output.write('#include <map>\n')
+        output.write('#include <string>\n')
+        output.write('#include <vector>\n')
         output.write('\n')
         output.write('// ROOT headers\n')
         output.write('#include <TAxis.h>\n')
@@ -166,12 +208,28 @@ class HistoRootProducer():
         for item in self.filenames:
             output.write('#include "'+item.split('/')[-1]+'"\n')
         output.write('\n')
-        output.write('// Main program\n')
-        output.write('int main()\n')
+        output.write('// Main program: draws the plots given as arguments (all by default)\n')
+        output.write('int main(int argc, char** argv)\n')
         output.write('{\n')
-        output.write('  std::cout << "BEGIN-STAMP" << std::endl;\n')
+        output.write('  std::map<std::string, void(*)()> plots;\n')
+        for item in self.filenames:
+            name = item.split('/')[-1][:-2]
+            output.write('  plots["'+name+'"] = &'+name+';\n')
+        output.write('  std::vector<std::string> names(argv+1, argv+argc);\n')
+        output.write('  if (names.empty())\n')
+        output.write('  {\n')
         for item in self.filenames:
-            output.write('  '+item.split('/')[-1][:-2]+'();\n')
+            output.write('    names.push_back("'+item.split('/')[-1][:-2]+'");\n')
+        output.write('  }\n')
+        output.write('  std::cout << "BEGIN-STAMP" << std::endl;\n')
+        output.write('  for (unsigned int i=0; i<names.size(); i++)\n')
+        output.write('  {\n')
+        output.write('    if (plots.find(names[i])==plots.end()) continue;\n')
+        output.write('    std::cout << "BEGIN-PLOT " << names[i] << std::endl;\n')
+        output.write('    try { plots[names[i]](); }\n')
+        output.write('    catch (...) { std::cout << "FAILED-PLOT " << names[i] << std::endl; continue; }\n')
+        output.write('    std::cout << "END-PLOT " << names[i] << std::endl;\n')
+        output.write('  }\n')
         output.write('  std::cout << "END-STAMP" << std::endl;\n')
         output.write('  return 0;\n')
         output.write('}\n')
@@ -743,6 +743,7 @@ class JobWriter(object):
         if self.main.archi_info.has_root:
             options.has_root_inc = True
             options.has_root_lib = True
+        options.has_pch      = True
         #options.has_userpackage = True
         toRemove=['Log/compilation.log','Log/linking.log','Log/cleanup.log','Log/mrproper.log']
 
@@ -804,8 +805,16 @@ class JobWriter(object):
         # log file name
         logfile = folder+'/Log/compilation.log'
         
-        # shell command
+        # objects compiled previously from the same sources
+        objects = self.ObjectFingerprints()
+        nrestored = self.RestoreObjects(objects)
+        if nrestored!=0:
+            logging.getLogger('MA5').debug(str(nrestored)+' object(s) compiled in a previous run reused')
+
+        # shell command, using all the cores found at the start of the session
         commands = ['make','compile']
+        if self.main.archi_info.ncores>1:
+            commands.append('-j'+str(self.main.archi_info.ncores))
 
         # call
         result, out = ShellCommand.ExecuteWithLog(commands,logfile,folder)
@@ -814,10 +823,257 @@ class JobWriter(object):
         if not result:
             logging.getLogger('MA5').error('impossible to compile the project. For more details, see the log file:')
             logging.getLogger('MA5').error(logfile)
-            
+        else:
+            self.StoreObjects(objects)
+
         return result
 
 
+    def CompilationFingerprint(self):
+        """
+        Hash of the compilation environment of the job: the version of
+        MadAnalysis 5, the compiler and its flags, the architecture of the
+        session and the SampleAnalyzer libraries the job is linked against.
+        """
+        import hashlib
+        sha = hashlib.sha1()
+        sha.update((self.main.archi_info.ma5_version+';'+self.main.archi_info.ma5_date).encode())
+        makefile = os.path.normpath(self.path+'/Build/Makefile')
+        if os.path.isfile(makefile):
+            with open(makefile, 'r') as source:
+                for line in source:
+                    if line.startswith('CXX') or line.startswith('PCH'):
+                        sha.update(line.encode())
+        architecture = os.path.normpath(self.main.archi_info.ma5dir+'/tools/architecture.ma5')
+        if os.path.isfile(architecture):
+            with open(architecture, 'rb') as source:
+                sha.update(source.read())
+        libdir = os.path.normpath(self.main.archi_info.ma5dir+'/tools/SampleAnalyzer/Lib')
+        if os.path.isdir(libdir):
+            for name in sorted(os.listdir(libdir)):
+                stat = os.stat(os.path.join(libdir, name))
+                sha.update((name+';'+str(stat.st_size)+';'+str(stat.st_mtime)).encode())
+        return sha.hexdigest()
+
+
+    def SourceFiles(self):
+        """ Files of the job entering the build, except the Makefile """
+        build = os.path.normpath(self.path+'/Build')
+        files = []
+        for folder in ['Main', 'SampleAnalyzer/User']:
+            for root, dirs, names in os.walk(os.path.join(build, folder)):
+                dirs.sort()
+                files.extend([os.path.join(root, name) for name in sorted(names)
+                              if not name.endswith('.o')])
+        return files
+
+
+    def BuildFingerprint(self):
+        """
+        Hash of everything entering the build of the executable: the
+        compilation environment, the Makefile and the sources of the job.
+        """
+        import hashlib
+        sha = hashlib.sha1(self.CompilationFingerprint().encode())
+        build = os.path.normpath(self.path+'/Build')
+        for filename in [os.path.join(build, 'Makefile')] + self.SourceFiles():
+            sha.update(os.path.relpath(filename, build).encode())
+            with open(filename, 'rb') as source:
+                sha.update(source.read())
+        return sha.hexdigest()
+
+
+    def ObjectFingerprints(self):
+        """
+        Hash of everything entering the compilation of each source file of
+        the job: the compilation environment, the source file and the headers
+        of the job it includes. Returns a {object file: hash} dictionary.
+        """
+        import hashlib, re
+        include = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.M)
+        build   = os.path.normpath(self.path+'/Build')
+
+        def Headers(filename, found):
+            with open(filename, 'rb') as source:
+                content = source.read().decode('utf-8', 'replace')
+            for header in include.findall(content):
+                for folder in [os.path.dirname(filename), build]:
+                    candidate = os.path.normpath(os.path.join(folder, header))
+                    if os.path.isfile(candidate):
+                        if candidate not in found:
+                            found.append(candidate)
+                            Headers(candidate, found)
+                        break
+            return found
+
+        common  = self.CompilationFingerprint()
+        objects = {}
+        for filename in self.SourceFiles():
+            if not filename.endswith('.cpp'):
+                continue
+            sha = hashlib.sha1(common.encode())
+            for item in [filename] + sorted(Headers(filename, [])):
+                sha.update(os.path.relpath(item, build).encode())
+                with open(item, 'rb') as source:
+                    sha.update(source.read())
+            objects[filename[:-4]+'.o'] = sha.hexdigest()
+        return objects
+
+
+    def RestoreObjects(self, objects):
+        """
+        Copies the objects compiled previously from the same sources, if any,
+        so that make only compiles the other ones. Returns the number of
+        restored objects.
+        """
+        nrestored = 0
+        if self.main.build_cache_size==0:
+            return nrestored
+        for obj, fingerprint in objects.items():
+            cache = os.path.join(self.ObjectCacheDir(), fingerprint+'.o')
+            if os.path.isfile(obj) or not os.path.isfile(cache):
+                continue
+            try:
+                shutil.copy(cache, obj)
+                # newer than all the sources for make
+                os.utime(obj, None)
+                # most recently used entry, for the pruning of the cache
+                os.utime(cache, None)
+                nrestored += 1
+            except Exception as err:
+                logging.getLogger('MA5').debug('Impossible to restore the object '+obj+': '+str(err))
+        return nrestored
+
+
+    def StoreObjects(self, objects):
+        """ Keeps a copy of the objects for the next builds with the same sources """
+        if self.main.build_cache_size==0:
+            self.PruneBuildCache()
+            return
+        cache = self.ObjectCacheDir()
+        for obj, fingerprint in objects.items():
+            if not os.path.isfile(obj) or os.path.isfile(cache+'/'+fingerprint+'.o'):
+                continue
+            try:
+                if not os.path.isdir(cache):
+                    os.makedirs(cache)
+                shutil.copy2(obj, cache+'/'+fingerprint+'.o.'+str(os.getpid()))
+                os.rename(cache+'/'+fingerprint+'.o.'+str(os.getpid()), cache+'/'+fingerprint+'.o')
+            except Exception as err:
+                logging.getLogger('MA5').debug('Impossible to store the object '+obj+': '+str(err))
+        self.PruneBuildCache()
+
+
+    def BuildCacheDir(self):
+        """
+        Folder of the build cache: tools/BuildCache in the MadAnalysis 5
+        installation, or a per-user folder ($XDG_CACHE_HOME/madanalysis5, by
+        default ~/.cache/madanalysis5) if the installation is read-only.
+        """
+        cache = os.path.normpath(self.main.archi_info.ma5dir+'/tools/BuildCache')
+        if os.access(cache if os.path.isdir(cache) else os.path.dirname(cache), os.W_OK):
+            return cache
+        user = os.environ.get('XDG_CACHE_HOME', '') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.normpath(os.path.join(user, 'madanalysis5', 'BuildCache'))
+
+
+    def ExecutableCacheDir(self):
+        """ Folder of the build cache containing the executables """
+        return os.path.join(self.BuildCacheDir(), 'executables')
+
+
+    def ObjectCacheDir(self):
+        """ Folder of the build cache containing the objects """
+        return os.path.join(self.BuildCacheDir(), 'objects')
+
+
+    def ExecutableCache(self, fingerprint):
+        """ Folder where the executable built from the fingerprinted sources is kept """
+        return os.path.join(self.ExecutableCacheDir(), fingerprint)
+
+
+    def RestoreExecutable(self, fingerprint):
+        """ Copies an executable built previously from the same sources, if any """
+        if self.main.build_cache_size==0:
+            return False
+        cache = self.ExecutableCache(fingerprint)
+        if not os.path.isfile(cache+'/MadAnalysis5job'):
+            return False
+        try:
+            shutil.copy2(cache+'/MadAnalysis5job', self.path+'/Build/MadAnalysis5job')
+        except Exception as err:
+            logging.getLogger('MA5').debug('Impossible to restore the executable: '+str(err))
+            return False
+        # Most recently used entry, for the pruning of the cache
+        try:
+            os.utime(cache, None)
+        except OSError:
+            pass
+        logging.getLogger('MA5').debug('Executable restored from '+cache)
+        return True
+
+
+    def StoreExecutable(self, fingerprint):
+        """ Keeps a copy of the executable for the next builds with the same sources """
+        if self.main.build_cache_size==0:
+            self.PruneBuildCache()
+            return
+        cache = self.ExecutableCache(fingerprint)
+        if not os.path.isfile(self.path+'/Build/MadAnalysis5job'):
+            return
+        try:
+            if not os.path.isdir(cache):
+                os.makedirs(cache)
+            # Atomic replacement, the cache being possibly shared by several sessions
+            shutil.copy2(self.path+'/Build/MadAnalysis5job', cache+'/MadAnalysis5job.'+str(os.getpid()))
+            os.rename(cache+'/MadAnalysis5job.'+str(os.getpid()), cache+'/MadAnalysis5job')
+            os.utime(cache, None)
+        except Exception as err:
+            logging.getLogger('MA5').debug('Impossible to store the executable: '+str(err))
+        self.PruneBuildCache()
+
+
+    def PruneBuildCache(self):
+        """
+        Removes the least recently used executables and objects of the build
+        cache until it fits in main.build_cache_size MB (0 = everything is
+        removed).
+        """
+        entries = []
+        # Executables: one folder per fingerprint
+        cache = self.ExecutableCacheDir()
+        for name in (os.listdir(cache) if os.path.isdir(cache) else []):
+            folder = os.path.join(cache, name)
+            try:
+                if os.path.isdir(folder):
+                    size = sum([os.path.getsize(os.path.join(folder, item)) for item in os.listdir(folder)])
+                    entries.append((os.path.getmtime(folder), size, folder))
+            except OSError:
+                continue
+        # Objects: one file per fingerprint
+        cache = self.ObjectCacheDir()
+        for name in (os.listdir(cache) if os.path.isdir(cache) else []):
+            item = os.path.join(cache, name)
+            try:
+                if name.endswith('.o') and os.path.isfile(item):
+                    entries.append((os.path.getmtime(item), os.path.getsize(item), item))
+            except OSError:
+                continue
+        limit = self.main.build_cache_size*1024*1024
+        total = 0
+        for mtime, size, entry in sorted(entries, reverse=True):
+            total += size
+            if total > limit:
+                logging.getLogger('MA5').debug('Removing '+entry+' from the build cache')
+                if os.path.isdir(entry):
+                    shutil.rmtree(entry, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(entry)
+                    except OSError:
+                        pass
+
+
     def MrproperJob(self):
 
         # folder
@@ -913,17 +1169,59 @@ class JobWriter(object):
         file.close()    
 
 
-    def RunJob(self,dataset):
+    def CreateRunDir(self,rundir,dataset=None,files=None):
+        """
+        Creates a folder from which the compiled job can be run independently
+        of the other runs: the executable and the inputs of the job are linked,
+        and the outputs are written in rundir/Output. If files are given, the
+        list of the dataset is replaced by these files in the run folder.
+        """
+        try:
+            for folder in ['/Build','/Output/SAF']:
+                if not os.path.isdir(rundir+folder):
+                    os.makedirs(rundir+folder)
+            links = [ (self.path+'/Build/MadAnalysis5job', rundir+'/Build/MadAnalysis5job') ]
+            if files is None:
+                links.append((self.path+'/Input', rundir+'/Input'))
+            else:
+                listname = InstanceName.Get(dataset.name)+'.list'
+                if not os.path.isdir(rundir+'/Input'):
+                    os.makedirs(rundir+'/Input')
+                for item in os.listdir(self.path+'/Input'):
+                    if item!=listname:
+                        links.append((self.path+'/Input/'+item, rundir+'/Input/'+item))
+                with open(rundir+'/Input/'+listname,'w') as output:
+                    for item in files:
+                        output.write(item+'\n')
+            for source, target in links:
+                if not os.path.lexists(target):
+                    os.symlink(os.path.abspath(source), target)
+        except Exception as err:
+            logging.getLogger('MA5').error('Impossible to create the folder '+rundir+': '+str(err))
+            return False
+        return True
+
+
+    def RunJob(self,dataset,rundir=None,logfile=None,prefix=None):
+        """
+        Runs the job over a dataset, from the job folder or from a folder
+        created with CreateRunDir. If a log file is given, the output of
+        SampleAnalyzer is written there instead of the screen. If a prefix
+        is given, the output is sent to the logger, each line being tagged
+        with the prefix.
+        """
 
         # Getting the dataset name    
         name=InstanceName.Get(dataset.name)
+        if rundir is None:
+            rundir = self.path
 
         # Creating a folder specific to the dataset
-        if not os.path.isdir(self.path+"/Output/SAF/"+name):
-            os.mkdir(self.path+"/Output/SAF/"+name)
+        if not os.path.isdir(rundir+"/Output/SAF/"+name):
+            os.mkdir(rundir+"/Output/SAF/"+name)
 
         # folder where the program is launched
-        folder = self.path+'/Build/'
+        folder = rundir+'/Build/'
 
         # shell command
         commands = ['./MadAnalysis5job']
@@ -941,7 +1239,11 @@ class JobWriter(object):
         commands.append('../Input/'+name+'.list')
 
         # Running SampleAnalyzer
-        if self.main.redirectSAlogger:
+        if logfile is not None:
+            result, _ = ShellCommand.ExecuteWithLog(commands,logfile,folder)
+        elif prefix is not None:
+            result = ShellCommand.ExecuteWithMA5Logging(commands,folder,prefix=prefix)
+        elif self.main.redirectSAlogger:
             result = ShellCommand.ExecuteWithMA5Logging(commands,folder)
         else:
             result = ShellCommand.Execute(commands,folder)
@@ -949,6 +1251,62 @@ class JobWriter(object):
         return result
 
 
+    def GetNShards(self,dataset):
+        """
+        Number of SampleAnalyzer processes sharing the files of a dataset.
+        The event files written by the fast simulation or by the output
+        writers cannot be merged, so that such jobs are run in one piece.
+        """
+        if self.output!="" or self.fastsim.package in ["delphes","delphesMA5tune"]:
+            return 1
+        return max(1, min(self.main.shards, len(dataset)))
+
+
+    def RunShardedJob(self,dataset,nshards):
+        """
+        Runs the job over nshards subsets of the files of a dataset at the
+        same time, each from its own folder, and merges their SAF outputs
+        into the output of the job.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from madanalysis.IOinterface.saf_merger import SafMerger
+
+        # Splitting the list of files, keeping their order
+        name  = InstanceName.Get(dataset.name)
+        size, remainder = divmod(len(dataset), nshards)
+        rundirs = []
+        start   = 0
+        for i in range(nshards):
+            stop   = start + size + (1 if i<remainder else 0)
+            rundir = os.path.normpath(self.path+'/Shards/'+name+'_'+str(i))
+            if os.path.isdir(rundir):
+                shutil.rmtree(rundir)
+            if not self.CreateRunDir(rundir,dataset,dataset.filenames[start:stop]):
+                return False
+            rundirs.append(rundir)
+            start = stop
+
+        # Running
+        with ThreadPoolExecutor(max_workers=nshards) as pool:
+            results = list(pool.map(lambda x: self.RunJob(dataset,x,x+'/'+name+'.log'), rundirs))
+        for rundir, result in zip(rundirs, results):
+            if not result:
+                logging.getLogger('MA5').error("For more details, see the log file: "+rundir+'/'+name+'.log')
+                return False
+
+        # Merging the outputs
+        merger = SafMerger([x+'/Output/SAF/'+name for x in rundirs])
+        if not merger.Merge(self.path+'/Output/SAF/'+name):
+            logging.getLogger('MA5').error("Impossible to merge the outputs of the dataset '"+dataset.name+"'")
+            return False
+        if not self.main.developer_mode:
+            for rundir in rundirs:
+                shutil.rmtree(rundir, ignore_errors=True)
+            if len(os.listdir(self.path+'/Shards'))==0:
+                os.rmdir(self.path+'/Shards')
+        return True
+
+
     def WriteTagger(self):
         # header file
         bla
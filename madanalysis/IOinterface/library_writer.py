@@ -353,6 +353,42 @@ class LibraryWriter():
         return True
 
 
+    def BuildPrecompiledHeader(self):
+        """
+        Precompiles the SampleAnalyzer headers included by all the analyses,
+        with the compilation options of the jobs (see JobWriter.WriteMakefiles),
+        so that the jobs and the PAD do not parse them for each source file.
+        This is the only place where the shared precompiled header is written:
+        it is rebuilt from scratch with the libraries, the jobs only read it.
+        """
+        from madanalysis.build.makefile_writer import MakefileWriter
+        options=MakefileWriter.MakefileOptions()
+        options.has_commons  = True
+        options.has_process  = True
+        if self.main.archi_info.has_root:
+            options.has_root_inc = True
+            options.has_root_lib = True
+        options.has_pch      = True
+        options.build_pch    = True
+
+        # Makefile with an empty list of source files
+        folder   = self.path+'/SampleAnalyzer/Lib'
+        shutil.rmtree(folder+'/PCH', ignore_errors=True)
+        filename = folder+'/Makefile_pch'
+        if not MakefileWriter.Makefile(filename,'SampleAnalyzer precompiled header','pch','./',\
+                                       False,[],[],options,self.main.archi_info,[]):
+            return False
+
+        # Building
+        logfile = folder+'/compilation_pch.log'
+        result, out = ShellCommand.ExecuteWithLog(['make','precompile','--file=Makefile_pch'],\
+                                                  logfile,folder)
+        if not result:
+            self.logger.error('impossible to precompile the headers. For more details, see the log file:')
+            self.logger.error(logfile)
+        return result
+
+
     def Compile(self,ncores,package,folder):
 
         # number of cores
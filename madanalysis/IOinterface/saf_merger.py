@@ -0,0 +1,333 @@
+################################################################################
+#
+#  Copyright (C) 2012-2023 Jack Araz, Eric Conte & Benjamin Fuks
+#  The MadAnalysis development team, email: <ma5team@iphc.cnrs.fr>
+#
+#  This file is part of MadAnalysis 5.
+#  Official website: <https://github.com/MadAnalysis/madanalysis5>
+#
+#  MadAnalysis 5 is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MadAnalysis 5 is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with MadAnalysis 5. If not, see <http://www.gnu.org/licenses/>
+#
+################################################################################
+
+
+from __future__ import absolute_import
+import filecmp
+import logging
+import shutil
+import math
+import os
+import re
+
+
+class SafMerger():
+    """
+    Merges the SAF outputs of several SampleAnalyzer runs over disjoint
+    subsets of the files of a dataset into the output of a single run.
+    The sample information is recomputed from the per-file information,
+    and the histogram and cut-flow counters are summed.
+    """
+
+    # Blocks whose numerical lines are summed over the runs
+    additive_blocks = ['<statistics>','<data>','<initialcounter>','<counter>']
+
+    integer = re.compile(r'^[+-]?\d+$')
+
+    def __init__(self,dirs):
+        self.dirs     = dirs
+        self.logger   = logging.getLogger('MA5')
+        self.unmerged = []
+
+
+    @staticmethod
+    def Split(line):
+        """ Splits a SAF line into its words and its comment """
+        index = line.find('#')
+        if index==-1:
+            return line.split(), ''
+        return line[:index].split(), line[index:].rstrip('\n')
+
+
+    @staticmethod
+    def IsNumber(word):
+        try:
+            float(word)
+        except ValueError:
+            return False
+        return True
+
+
+    @staticmethod
+    def Sum(words):
+        """ Sums the same number written in several files, keeping its type """
+        if all(SafMerger.integer.match(word) for word in words):
+            return str(sum(int(word) for word in words))
+        return '%e' % sum(float(word) for word in words)
+
+
+    @staticmethod
+    def Indent(line):
+        return line[:len(line)-len(line.lstrip())]
+
+
+    @staticmethod
+    def Counter(i,n,label):
+        if i<2 or i>=(n-2):
+            return ' # '+label+' '+str(i+1)+' / '+str(n)
+        return ''
+
+
+    def Merge(self,output):
+        """
+        Merges the dataset folders of the runs in the folder output, the
+        analysis folders (e.g. MadAnalysis5job_0) being numbered as a single
+        run writing in output would number them.
+        """
+        reference = self.dirs[0]
+        name      = os.path.basename(os.path.normpath(reference))
+        if not os.path.isdir(output):
+            os.makedirs(output)
+        self.unmerged = []
+
+        for item in sorted(os.listdir(reference)):
+            source = os.path.join(reference,item)
+
+            # Sample information
+            if item==name+'.saf':
+                if not self.MergeGeneral([os.path.join(x,item) for x in self.dirs],
+                                         os.path.join(output,item)):
+                    return False
+                continue
+            if not os.path.isdir(source):
+                self.CopyOther([os.path.join(x,item) for x in self.dirs],
+                               os.path.join(output,item),item)
+                continue
+
+            # Analysis folders: <analysis>_<index>
+            prefix = item.rsplit('_',1)[0]
+            index  = 0
+            while os.path.isdir(os.path.join(output,prefix+'_'+str(index))):
+                index += 1
+            if not self.MergeFolder([os.path.join(x,item) for x in self.dirs],
+                                    os.path.join(output,prefix+'_'+str(index))):
+                return False
+
+        # Outputs that cannot be merged (e.g. files written by the analysis
+        # itself): the copy only holds the content of one of the runs
+        if len(self.unmerged)!=0:
+            self.logger.warning('The following outputs of the dataset '+name+' differ between the '+
+                                str(len(self.dirs))+' SampleAnalyzer runs and are not merged: '+
+                                ', '.join(self.unmerged))
+            self.logger.warning('Please set main.shards to 1 to get these outputs for the full dataset.')
+        return True
+
+
+    def MergeFolder(self,folders,output):
+        """ Sums the histograms and the cut-flows, copies the rest """
+        # Files of all the runs, a run possibly writing files the others do not
+        relfiles = set()
+        for folder in folders:
+            for root, _, files in os.walk(folder):
+                relpath = os.path.relpath(root,folder)
+                relfiles.update([os.path.normpath(os.path.join(relpath,x)) for x in files])
+
+        for relfile in sorted(relfiles):
+            target = os.path.join(output,relfile)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            sources = [os.path.join(x,relfile) for x in folders]
+            if relfile.split(os.sep)[0] in ['Histograms','Cutflows'] and relfile.endswith('.saf'):
+                if not self.MergeCounters(sources,target):
+                    return False
+            else:
+                self.CopyOther(sources,target,
+                               os.path.join(os.path.basename(os.path.normpath(folders[0])),relfile))
+        return True
+
+
+    def CopyOther(self,sources,target,label):
+        """
+        Copies a file that is not merged. If the runs did not write the same
+        file, it is recorded in self.unmerged.
+        """
+        existing = [x for x in sources if os.path.isfile(x)]
+        shutil.copy(existing[0],target)
+        if len(existing)!=len(sources) or \
+           not all(filecmp.cmp(existing[0],x,shallow=False) for x in existing[1:]):
+            self.unmerged.append(label)
+
+
+    def ReadFiles(self,filenames):
+        contents = []
+        for filename in filenames:
+            try:
+                with open(filename,'r') as stream:
+                    contents.append(stream.readlines())
+            except Exception as err:
+                self.logger.error("File called '"+filename+"' is not found")
+                self.logger.debug(str(err))
+                return None
+        return contents
+
+
+    def MergeGeneral(self,filenames,output):
+        """
+        Merges the sample information: the files and their information are
+        concatenated and the global information is recomputed from them as
+        SampleAnalyzer does.
+        """
+        contents = self.ReadFiles(filenames)
+        if contents is None:
+            return False
+
+        # Collecting the per-file information
+        titles  = {}
+        blocks  = {'<fileinfo>':[], '<sampledetailedinfo>':[]}
+        for lines in contents:
+            block = None
+            for line in lines:
+                words, comment = SafMerger.Split(line)
+                if len(words)==1 and words[0][0]=='<' and words[0][-1]=='>':
+                    block = words[0].lower() if not words[0].startswith('</') else None
+                elif block is not None and len(words)==0 and comment!='':
+                    titles.setdefault(block,line.rstrip('\n'))
+                elif block=='<fileinfo>' and len(words)>0:
+                    blocks[block].append(line[:line.rfind('"')+1].strip())
+                elif block=='<sampledetailedinfo>' and len(words)==5:
+                    blocks[block].append(words)
+
+        files   = blocks['<fileinfo>']
+        details = blocks['<sampledetailedinfo>']
+        if len(files)!=len(details):
+            self.logger.error('Inconsistent sample information in '+', '.join(filenames))
+            return False
+
+        # Global information, as in SampleAnalyzer::FillSummary
+        nevents  = sum(int(float(x[2])) for x in details)
+        xsection = 0.
+        xerror   = 0.
+        for detail in details:
+            n         = int(float(detail[2]))
+            xsection += float(detail[0])*n
+            xerror   += (float(detail[1])*n)**2
+        if nevents!=0:
+            xsection /= nevents
+            xerror    = math.sqrt(xerror)/nevents
+        else:
+            xsection, xerror = 0., 0.
+        summary = ['%e' % xsection, '%e' % xerror, str(nevents),
+                   '%e' % sum(float(x[3]) for x in details),
+                   '%e' % sum(float(x[4]) for x in details)]
+
+        def Row(words):
+            return ''.join(word.ljust(15) for word in words)
+
+        title = titles.get('<sampleglobalinfo>','')
+        try:
+            stream = open(output,'w')
+        except Exception as err:
+            self.logger.error('impossible to write the file '+output)
+            self.logger.debug(str(err))
+            return False
+        stream.write('<SAFheader>\n</SAFheader>\n\n')
+        stream.write('<SampleGlobalInfo>\n'+title+'\n'+Row(summary)+'\n</SampleGlobalInfo>\n\n')
+        stream.write('<FileInfo>\n')
+        for i, item in enumerate(files):
+            stream.write(item.ljust(40)+SafMerger.Counter(i,len(files),'file')+'\n')
+        stream.write('</FileInfo>\n\n')
+        stream.write('<SampleDetailedInfo>\n'+titles.get('<sampledetailedinfo>',title)+'\n')
+        for i, detail in enumerate(details):
+            row = ['%e' % float(detail[0]), '%e' % float(detail[1]), str(int(float(detail[2]))),
+                   '%e' % float(detail[3]), '%e' % float(detail[4])]
+            stream.write(Row(row)+SafMerger.Counter(i,len(details),'file')+'\n')
+        stream.write('</SampleDetailedInfo>\n\n')
+        stream.write('<SAFfooter>\n</SAFfooter>\n')
+        stream.close()
+        return True
+
+
+    def MergeCounters(self,filenames,output):
+        """
+        Sums the numerical lines of the statistics, data and counter blocks
+        of files with the same structure (histograms and cut-flows). The
+        frequency histograms are merged label by label.
+        """
+        contents = self.ReadFiles(filenames)
+        if contents is None:
+            return False
+
+        merged    = []
+        positions = [0]*len(contents)
+        reference = contents[0]
+        blocks    = []
+        while positions[0] < len(reference):
+            line           = reference[positions[0]]
+            words, comment = SafMerger.Split(line)
+            tag            = words[0].lower() if len(words)==1 and words[0][0]=='<' and words[0][-1]=='>' else None
+
+            # Frequency histograms: the labels depend on the events
+            if tag=='<data>' and '<histofrequency>' in blocks:
+                merged.append(line.rstrip('\n'))
+                bins = {}
+                for i, lines in enumerate(contents):
+                    positions[i] += 1
+                    while positions[i] < len(lines) and lines[positions[i]].strip().lower()!='</data>':
+                        data, _ = SafMerger.Split(lines[positions[i]])
+                        if len(data)==3:
+                            bins.setdefault(int(data[0]),[]).append(data[1:])
+                        positions[i] += 1
+                for i, label in enumerate(sorted(bins)):
+                    values = [SafMerger.Sum([x[j] for x in bins[label]]) for j in range(2)]
+                    merged.append(SafMerger.Indent(line)+'    '+str(label).ljust(15)+
+                                  ''.join(x.ljust(15) for x in values)+
+                                  SafMerger.Counter(i,len(bins),'bin'))
+                continue
+
+            # Checking that the files have the same structure
+            others = []
+            for i, lines in enumerate(contents[1:]):
+                if positions[i+1] >= len(lines):
+                    self.logger.error('Inconsistent SAF files: '+', '.join(filenames))
+                    return False
+                others.append(SafMerger.Split(lines[positions[i+1]])[0])
+
+            if tag is not None:
+                if tag.startswith('</'):
+                    if tag[:1]+tag[2:] in blocks:
+                        blocks.remove(tag[:1]+tag[2:])
+                else:
+                    blocks.append(tag)
+                merged.append(line.rstrip('\n'))
+            elif any(x in blocks for x in SafMerger.additive_blocks) and len(words)>0 and \
+                 all(SafMerger.IsNumber(x) for x in words):
+                if any(len(x)!=len(words) for x in others):
+                    self.logger.error('Inconsistent SAF files: '+', '.join(filenames))
+                    return False
+                values = [SafMerger.Sum([words[j]]+[x[j] for x in others]) for j in range(len(words))]
+                merged.append(SafMerger.Indent(line)+''.join(x.ljust(15) for x in values)+
+                              (' '+comment if comment!='' else ''))
+            else:
+                merged.append(line.rstrip('\n'))
+
+            for i in range(len(positions)):
+                positions[i] += 1
+
+        try:
+            with open(output,'w') as stream:
+                stream.write('\n'.join(merged)+'\n')
+        except Exception as err:
+            self.logger.error('impossible to write the file '+output)
+            self.logger.debug(str(err))
+            return False
+        return True
@@ -0,0 +1,387 @@
+################################################################################
+#
+#  Copyright (C) 2012-2023 Jack Araz, Eric Conte & Benjamin Fuks
+#  The MadAnalysis development team, email: <ma5team@iphc.cnrs.fr>
+#
+#  This file is part of MadAnalysis 5.
+#  Official website: <https://github.com/MadAnalysis/madanalysis5>
+#
+#  MadAnalysis 5 is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MadAnalysis 5 is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with MadAnalysis 5. If not, see <http://www.gnu.org/licenses/>
+#
+################################################################################
+
+
+from __future__ import absolute_import
+import logging
+import re
+import warnings
+import numpy
+
+
+class SafBlock():
+    """
+    Block <Tag> ... </Tag> of a SAF file: the position of its text in the
+    file and its sub-blocks. The lines of the block are only split, and its
+    numbers only converted, when they are requested.
+    """
+
+    comment = re.compile(r'#[^\n]*')
+
+    def __init__(self,tag,content,numline,parent=None):
+        self.tag      = tag        # lower case, without brackets
+        self.content  = content    # text of the whole file
+        self.numline  = numline    # line of the opening tag
+        self.parent   = parent
+        self.closed   = False
+        self.segments = []         # [(start, end, numline)] of the text outside the sub-blocks
+        self.children = []
+        self.lines    = None
+
+    def Lines(self):
+        """ Numbered lines of the block, without comments and blank lines """
+        if self.lines is None:
+            self.lines = []
+            for start, end, numline in self.segments:
+                for i, line in enumerate(self.content[start:end].split('\n')):
+                    text = line.partition('#')[0].strip()
+                    if text!='':
+                        self.lines.append((numline+i,text))
+        return self.lines
+
+    def Rows(self,ncolumns=None):
+        """ Words of the lines, optionally only of the lines with ncolumns words """
+        rows = [(numline, text.split()) for numline, text in self.Lines()]
+        if ncolumns is None:
+            return rows
+        return [x for x in rows if len(x[1])==ncolumns]
+
+    def Numbers(self,ncolumns):
+        """
+        Content of a block made of lines of ncolumns numbers as a NumPy array
+        with one row per line, converted in one go; None if some words are not
+        numbers or if the numbers do not fill complete rows.
+        """
+        text = SafBlock.comment.sub('','\n'.join(self.content[x[0]:x[1]] for x in self.segments))
+        # NumPy reports the words that are not numbers with an error or a warning
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                values = numpy.fromstring(text,sep=' ')
+        except (ValueError,DeprecationWarning):
+            return None
+        if values.size%ncolumns!=0:
+            return None
+        return values.reshape(-1,ncolumns)
+
+    def Walk(self):
+        """ The block and all its sub-blocks, in the order of the file """
+        yield self
+        for child in self.children:
+            for block in child.Walk():
+                yield block
+
+
+class SafReader():
+    """
+    Reads a SAF file into a tree of SafBlock objects, locating the tags in a
+    single pass over the file. The blocks are indexed by tag on the first
+    lookup, and the numerical content of the histograms and counters is
+    converted into NumPy arrays when it is requested.
+    """
+
+    histo_tags = ['histo','histologx','histofrequency']
+
+    tag = re.compile(r'<(/?)([^\s<>/#]+)>')
+
+    def __init__(self,filename):
+        self.filename = filename
+        self.logger   = logging.getLogger('MA5')
+        self.root     = None
+        self.index    = None
+
+
+    def Read(self):
+        try:
+            with open(self.filename,'r') as stream:
+                content = stream.read()
+        except Exception as err:
+            self.logger.error("File called '"+self.filename+"' is not found")
+            self.logger.debug(str(err))
+            return False
+
+        self.root  = SafBlock('',content,0)
+        self.index = None
+        current    = self.root
+        cursor     = (0,1)      # start of the text of the current block and its line
+        position   = 0
+        numline    = 1
+        for match in SafReader.tag.finditer(content):
+            # A tag is alone on its line, possibly with a comment
+            begin = content.rfind('\n',0,match.start())+1
+            end   = content.find('\n',match.end())
+            if end==-1:
+                end = len(content)
+            if content[begin:match.start()].strip()!='' or \
+               content[match.end():end].partition('#')[0].strip()!='':
+                continue
+            numline += content.count('\n',position,begin)
+            position = begin
+            current.segments.append((cursor[0],begin,cursor[1]))
+
+            # Opening tag
+            if match.group(1)=='':
+                block = SafBlock(match.group(2).lower(),content,numline,current)
+                current.children.append(block)
+                current = block
+
+            # Closing tag
+            else:
+                tag   = match.group(2).lower()
+                block = current
+                while block is not self.root and block.tag!=tag:
+                    block = block.parent
+                if block is self.root:
+                    self.logger.warning(self.filename+': closing tag '+match.group(0).strip()+\
+                                        ' without opening tag @ line='+str(numline))
+                else:
+                    block.closed = True
+                    current      = block.parent
+            cursor = (end,numline)
+
+        current.segments.append((cursor[0],len(content),cursor[1]))
+        return True
+
+
+    def Blocks(self,tag,within=None):
+        """ Blocks with a given tag (lower case), in the order of the file """
+        if within is not None:
+            return [x for x in within.Walk() if x.tag==tag]
+        if self.index is None:
+            self.index = {}
+            for block in self.root.Walk():
+                self.index.setdefault(block.tag,[]).append(block)
+        return self.index.get(tag,[])
+
+
+    def Block(self,tag,within=None):
+        """ First complete block with a given tag, or None """
+        for block in self.Blocks(tag,within):
+            if block.closed:
+                return block
+        return None
+
+
+    def CheckHeaderFooter(self,prefix=''):
+        if self.Block('safheader') is None:
+            self.logger.error(prefix+"SAF header <SAFheader> and </SAFheader> is not found.")
+        if self.Block('saffooter') is None:
+            self.logger.error(prefix+"SAF footer <SAFfooter> and </SAFfooter> is not found.")
+
+
+    def Histos(self,within=None):
+        """ Histograms of the file (or of a block), in the order of the file """
+        blocks = [x for x in (self.root if within is None else within).Walk() \
+                  if x.tag in SafReader.histo_tags and x.closed]
+        return [SafHisto(x,self.filename) for x in blocks]
+
+
+    def Counters(self,within=None):
+        """ Initial counter and cut counters of the file (or of a block) """
+        initial = self.Block('initialcounter',within)
+        if initial is not None:
+            initial = SafCounter(initial,self.filename)
+        counters = [SafCounter(x,self.filename) for x in self.Blocks('counter',within) if x.closed]
+        return initial, counters
+
+
+    @staticmethod
+    def ToArray(rows,filename,dtype=float,what='a float'):
+        """
+        Converts the words of (numline, words) rows with the same length into
+        a NumPy array. Invalid values are reported and set to zero.
+        """
+        if len(rows)==0:
+            return numpy.zeros((0,2),dtype=dtype)
+        ncolumns = len(rows[0][1])
+        try:
+            return numpy.array([words for _, words in rows],dtype=dtype).reshape(-1,ncolumns)
+        except ValueError:
+            pass
+        result = numpy.zeros((len(rows),ncolumns),dtype=dtype)
+        for i, (numline, words) in enumerate(rows):
+            for j, word in enumerate(words):
+                try:
+                    result[i,j] = dtype(float(word)) if dtype is int else dtype(word)
+                except ValueError:
+                    logging.getLogger('MA5').error(str(word)+' must be '+what+' value @ "'+\
+                                                   filename+'" line='+str(numline))
+        return result
+
+
+class SafHisto():
+    """
+    Typed content of a <Histo>, <HistoLogX> or <HistoFrequency> block: the
+    description, the statistics (one [positive, negative] row per counter)
+    and the bin contents as NumPy arrays.
+    """
+
+    # Statistics rows, in the order of the file, and their type
+    statistics_rows = [('nevents',int), ('sumwentries',float), ('nentries',int), ('sumw',float),
+                       ('sumw2',float), ('sumwx',float), ('sumw2x',float)]
+
+    def __init__(self,block,filename):
+        self.kind      = block.tag
+        self.name      = ''
+        self.nbins     = 0
+        self.xmin      = 0.
+        self.xmax      = 0.
+        self.regions   = []
+        self.stats     = {}
+        self.underflow = numpy.zeros(2)
+        self.overflow  = numpy.zeros(2)
+        self.data      = numpy.zeros((0,2))
+        self.labels    = numpy.zeros(0,dtype=int)
+        self.filename  = filename
+        self.logger    = logging.getLogger('MA5')
+        frequency      = (self.kind=='histofrequency')
+
+        for child in block.children:
+            if child.tag=='description':
+                self.ReadDescription(child,frequency)
+            elif child.tag=='statistics':
+                self.ReadStatistics(child,frequency)
+            elif child.tag=='data':
+                self.ReadData(child,frequency)
+
+
+    def ReadDescription(self,block,frequency):
+        for i, (numline, text) in enumerate(block.Lines()):
+            words = text.split()
+            if i==0:
+                if len(text)>1 and text[0]=='"' and text[-1]=='"':
+                    self.name = text[1:-1]
+                else:
+                    self.logger.error('invalid name for histogram @ line=' + str(numline) +' : ')
+                    self.logger.error(text)
+            elif i==1 and not frequency and len(words)==3:
+                try:
+                    self.nbins = int(words[0])
+                    self.xmin  = float(words[1])
+                    self.xmax  = float(words[2])
+                except ValueError:
+                    self.logger.error('invalid histogram description @ line=' + str(numline) +' : ')
+                    self.logger.error(text)
+            elif len(words)==1:
+                self.regions.append(words[0])
+            else:
+                self.logger.error('invalid region for a histogram @ line=' + str(numline) +' : ')
+                self.logger.error(text)
+
+
+    def ReadStatistics(self,block,frequency):
+        rows  = block.Rows(2)
+        names = SafHisto.statistics_rows[:4] if frequency else SafHisto.statistics_rows
+        for numline, words in rows[len(names):]:
+            self.logger.warning('Extra line is found: '+' '.join(words))
+        for (numline, words), (name, dtype) in zip(rows, names):
+            values = SafReader.ToArray([(numline,words)],self.filename,float)[0]
+            if dtype is int:
+                for i, value in enumerate(values):
+                    if value<0 or value!=int(value):
+                        self.logger.error(words[i]+' must be a positive integer value @ "'+\
+                                          self.filename+'" line='+str(numline))
+                        values[i] = 0
+            self.stats[name] = [dtype(values[0]),dtype(values[1])]
+
+
+    def ReadData(self,block,frequency):
+        if frequency:
+            values = block.Numbers(3)
+            if values is not None and numpy.all(values[:,0]==numpy.floor(values[:,0])):
+                self.labels = values[:,0].astype(int)
+                self.data   = values[:,1:]
+                return
+            rows = block.Rows(3)
+            if len(rows)!=0:
+                self.labels = SafReader.ToArray([(n,w[:1]) for n, w in rows],self.filename,int,'an integer')[:,0]
+                self.data   = SafReader.ToArray([(n,w[1:]) for n, w in rows],self.filename)
+            return
+        values = block.Numbers(2)
+        if values is None or len(values)!=self.nbins+2:
+            rows = block.Rows(2)
+            for numline, words in rows[self.nbins+2:]:
+                self.logger.warning('Extra line is found: '+' '.join(words))
+            values = SafReader.ToArray(rows[:self.nbins+2],self.filename)
+        if len(values)>0:
+            self.underflow = values[0]
+        self.data = values[1:self.nbins+1]
+        if len(values)>self.nbins+1:
+            self.overflow = values[self.nbins+1]
+
+
+    def Fill(self,histo):
+        """
+        Fills a histogram of the layout (Histogram, HistogramLogX or
+        HistogramFrequency), the bin contents being NumPy arrays.
+        """
+        histo.name    = self.name
+        histo.regions = self.regions[:]
+        if self.kind!='histofrequency':
+            histo.nbins = self.nbins
+            histo.xmin  = self.xmin
+            histo.xmax  = self.xmax
+            histo.positive.underflow, histo.negative.underflow = self.underflow.tolist()
+            histo.positive.overflow,  histo.negative.overflow  = self.overflow.tolist()
+        else:
+            histo.labels = self.labels.copy()
+        for name, values in self.stats.items():
+            setattr(histo.positive,name,values[0])
+            setattr(histo.negative,name,values[1])
+        histo.positive.array = self.data[:,0].copy()
+        histo.negative.array = self.data[:,1].copy()
+
+
+class SafCounter():
+    """
+    Typed content of an <InitialCounter> or a <Counter> block: the name of
+    the cut, if any, and the [positive, negative] rows of the number of
+    entries, the sum of weights and the sum of squared weights.
+    """
+
+    def __init__(self,block,filename):
+        self.name     = ''
+        self.nentries = [0.,0.]
+        self.sumw     = [0.,0.]
+        self.sumw2    = [0.,0.]
+        rows = []
+        for numline, text in block.Lines():
+            if '"' in text:
+                if self.name=='':
+                    self.name = text
+                continue
+            words = text.split()
+            if len(words)==2:
+                rows.append((numline,words))
+        for numline, words in rows[3:]:
+            logging.getLogger('MA5').warning('Extra line is found: '+' '.join(words))
+        values = SafReader.ToArray(rows[:3],filename).tolist()
+        for i, name in enumerate(['nentries','sumw','sumw2'][:len(values)]):
+            setattr(self,name,values[i])
+
+
+    def Fill(self,cut):
+        """ Fills a CutInfo (or the initial counter of a cut-flow) """
+        cut.nentries_pos, cut.nentries_neg = self.nentries
+        cut.sumw_pos,     cut.sumw_neg     = self.sumw
+        cut.sumw2_pos,    cut.sumw2_neg    = self.sumw2
@@ -186,6 +186,8 @@ class MakefileWriter():
             self.has_root_tag              = False
             self.has_root_lib              = False
             self.has_root_ma5lib           = False
+            self.has_pch                   = False
+            self.build_pch                 = False
 
 
     @staticmethod
@@ -208,11 +210,16 @@ class MakefileWriter():
         # Compilers
         file.write('# Compilers\n')
         if archi_info.has_root and archi_info.root_compiler!='':
-            file.write('CXX = '+archi_info.root_compiler+'\n')
+            compiler = archi_info.root_compiler
         else:
-            file.write('CXX = g++\n')
+            compiler = 'g++'
+        file.write('CXX = '+compiler+'\n')
         file.write('\n')
 
+        # Precompiled headers are only used with the GNU compiler
+        has_pch = options.has_pch and not archi_info.isMac and \
+                  os.path.basename(compiler).split('-')[0] in ['g++','c++']
+
         # Options for C++ compilation
         file.write('# C++ Compilation options\n')
 
@@ -456,6 +463,22 @@ class MakefileWriter():
         file.write('OBJS  = $(SRCS:.cpp=.o)\n')
         file.write('\n')
 
+        # Precompiled header, built with the SampleAnalyzer libraries only.
+        # The compiler finds it through the include path, for the sources
+        # including AnalyzerBase.h themselves, and falls back to the header
+        # if it does not match the compilation options.
+        if has_pch:
+            file.write('# Precompiled header\n')
+            file.write('PCHHDR   = SampleAnalyzer/Process/Analyzer/AnalyzerBase.h\n')
+            file.write('PCHDIR   = $(MA5_BASE)/tools/SampleAnalyzer/Lib/PCH\n')
+            if options.build_pch:
+                file.write('PCH     := $(PCHDIR)/$(PCHHDR).gch/'+\
+                           '$(firstword $(shell echo "$(CXX) $(filter-out -I%,$(CXXFLAGS))" | cksum))\n')
+            else:
+                file.write('PCHSRCS := $(shell grep -l \'^[[:space:]]*\\#[[:space:]]*include[[:space:]]*"$(PCHHDR)"\' $(SRCS) /dev/null)\n')
+                file.write('$(PCHSRCS:.cpp=.o): CXXFLAGS := -I$(PCHDIR) $(CXXFLAGS)\n')
+            file.write('\n')
+
         # Name of the library
         if isLibrary:
             file.write('# Name of the library\n')
@@ -532,9 +555,22 @@ class MakefileWriter():
 
         # Precompile
         file.write('# Precompile target\n')
-        file.write('precompile:\n')
+        if has_pch and options.build_pch:
+            file.write('precompile: $(PCH)\n')
+        else:
+            file.write('precompile:\n')
         file.write('\n')
 
+        # Precompiled header (see LibraryWriter.BuildPrecompiledHeader)
+        if has_pch and options.build_pch:
+            file.write('# Precompiled header target\n')
+            file.write('$(PCH): $(MA5_BASE)/tools/$(PCHHDR)\n')
+            file.write('\t@mkdir -p $(dir $(PCH))\n')
+            file.write('\t@ln -sf $(MA5_BASE)/tools/$(PCHHDR) $(PCHDIR)/$(PCHHDR)\n')
+            file.write('\t$(CXX) $(CXXFLAGS) -x c++-header -o $(PCHDIR)/tmp.gch $(MA5_BASE)/tools/$(PCHHDR)\n')
+            file.write('\t@mv -f $(PCHDIR)/tmp.gch $(PCH)\n')
+            file.write('\n')
+
         # Compile
         file.write('# Compile target\n')
         file.write('compile: precompile $(OBJS)\n')
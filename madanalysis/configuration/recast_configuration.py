@@ -40,7 +40,11 @@ class RecastConfiguration:
          "THerror_combination"    : ["quadratic","linear"], \
          "error_extrapolation"    : ["linear", "sqrt"],\
          "global_likelihoods"     : ["on","off"],\
-         "CLs_calculator_backend" : ["native", "pyhf"],\
+         "CLs_calculator_backend" : ["native", "asymptotic", "pyhf"],\
+         "CLs_common_random_numbers" : ["True", "False"],\
+         "CLs_ncores"             : ["1"],\
+         "CLs_s95_tolerance"      : ["0.01"],\
+         "max_parallel_jobs"      : ["1"],\
          "simplify_likelihoods"   : ["True", "False"],\
          "expectation_assumption" : ["apriori", "aposteriori"],\
          "TACO_output"            : ""
@@ -58,6 +62,10 @@ class RecastConfiguration:
         self.TACO_output                = ""
         self.global_likelihoods_switch  = True
         self.CLs_calculator_backend     = "native"
+        self.CLs_common_random_numbers  = True
+        self.CLs_ncores                 = 1
+        self.CLs_s95_tolerance          = 0.01
+        self.max_parallel_jobs          = 1
         self.simplify_likelihoods       = False
         self.expectation_assumption     = "apriori"
         self.systematics                = []
@@ -111,6 +119,10 @@ class RecastConfiguration:
             self.user_DisplayParameter("error_extrapolation")
             self.user_DisplayParameter("global_likelihoods")
             self.user_DisplayParameter("CLs_calculator_backend")
+            self.user_DisplayParameter("CLs_common_random_numbers")
+            self.user_DisplayParameter("CLs_ncores")
+            self.user_DisplayParameter("CLs_s95_tolerance")
+            self.user_DisplayParameter("max_parallel_jobs")
             self.user_DisplayParameter("simplify_likelihoods")
             self.user_DisplayParameter("expectation_assumption")
 
@@ -192,8 +204,22 @@ class RecastConfiguration:
         elif parameter=="CLs_calculator_backend":
             self.logger.info("   * Exclusion limits will be calculated with " +
                              (self.CLs_calculator_backend == "native")*' MadAnalysis 5 native calculator'+ \
+                             (self.CLs_calculator_backend == "asymptotic")*' MadAnalysis 5 asymptotic calculator'+ \
                              (self.CLs_calculator_backend == "pyhf")*' pyhf (if available)'+'.')
             return
+        elif parameter=="CLs_common_random_numbers":
+            self.logger.info("   * Common random numbers for the native toy experiments: " +
+                             str(self.CLs_common_random_numbers))
+            return
+        elif parameter=="CLs_ncores":
+            self.logger.info("   * Number of cores used for the CLs calculations: "+str(self.CLs_ncores))
+            return
+        elif parameter=="CLs_s95_tolerance":
+            self.logger.info("   * Relative precision of the cross-section upper limits: "+str(self.CLs_s95_tolerance))
+            return
+        elif parameter=="max_parallel_jobs":
+            self.logger.info("   * Number of datasets simulated in parallel: "+str(self.max_parallel_jobs))
+            return
         elif parameter=="simplify_likelihoods":
             if self.simplify_likelihoods:
                 self.logger.debug("   * Simplified profile likelihoods will be used when available.")
@@ -415,7 +441,7 @@ class RecastConfiguration:
             if self.status!="on":
                 self.logger.error("Please first set the recasting mode to 'on'.")
                 return
-            if value.lower() in ["native", "pyhf"]:
+            if value.lower() in ["native", "asymptotic", "pyhf"]:
                 if value.lower() == "pyhf":
                     # if self.session_info.has_pyhf:
                     self.CLs_calculator_backend = "pyhf"
@@ -423,12 +449,70 @@ class RecastConfiguration:
                     # else:
                     #     self.logger.error("Please install pyhf first by typing `install pyhf`")
                     #     return
+                elif value.lower() == "asymptotic":
+                    self.CLs_calculator_backend = "asymptotic"
                 else:
                     self.CLs_calculator_backend = "native"
             else:
                 self.logger.error("Unknown calculator "+str(value)+\
-                                  ". Please choose between native or pyhf")
+                                  ". Please choose between native, asymptotic or pyhf")
+                return
+
+        # Common random numbers for the toys of the native calculator
+        elif parameter == "CLs_common_random_numbers":
+            if self.status!="on":
+                self.logger.error("Please first set the recasting mode to 'on'.")
+                return
+            if value.lower() in ["true", "false"]:
+                self.CLs_common_random_numbers = (value.lower() == "true")
+            else:
+                self.logger.error("Please type either True or False.")
+                return
+
+        # Number of processes for the CLs calculations
+        elif parameter == "CLs_ncores":
+            if self.status!="on":
+                self.logger.error("Please first set the recasting mode to 'on'.")
+                return
+            try:
+                ncores = int(value)
+            except ValueError:
+                self.logger.error("The number of cores must be a positive integer.")
+                return
+            if ncores < 1:
+                self.logger.error("The number of cores must be a positive integer.")
+                return
+            self.CLs_ncores = ncores
+
+        # Relative precision of the cross-section upper limits
+        elif parameter == "CLs_s95_tolerance":
+            if self.status!="on":
+                self.logger.error("Please first set the recasting mode to 'on'.")
+                return
+            try:
+                tolerance = float(value)
+            except ValueError:
+                self.logger.error("The tolerance must be a number between 0 and 1.")
+                return
+            if tolerance <= 0. or tolerance >= 1.:
+                self.logger.error("The tolerance must be a number between 0 and 1.")
+                return
+            self.CLs_s95_tolerance = tolerance
+
+        # Number of detector simulations running at the same time
+        elif parameter == "max_parallel_jobs":
+            if self.status!="on":
+                self.logger.error("Please first set the recasting mode to 'on'.")
+                return
+            try:
+                njobs = int(value)
+            except ValueError:
+                self.logger.error("The number of parallel jobs must be a positive integer.")
+                return
+            if njobs < 1:
+                self.logger.error("The number of parallel jobs must be a positive integer.")
                 return
+            self.max_parallel_jobs = njobs
 
         #Set simplified likelihoods
         elif parameter == "simplify_likelihoods":
@@ -475,7 +559,9 @@ class RecastConfiguration:
             else:
                 table = ["CLs_numofexps", "card_path", "store_events", 'TACO_output', "add",
                          "THerror_combination", "error_extrapolation", "global_likelihoods",
-                         "CLs_calculator_backend", "expectation_assumption"]#, "simplify_likelihoods"
+                         "CLs_calculator_backend", "CLs_common_random_numbers", "CLs_ncores",
+                         "CLs_s95_tolerance", "max_parallel_jobs",
+                         "expectation_assumption"]#, "simplify_likelihoods"
         else:
            table = []
         return table
@@ -503,6 +589,14 @@ class RecastConfiguration:
                 table.extend(RecastConfiguration.userVariables["global_likelihoods"])
         elif variable =="CLs_calculator_backend":
             table.extend(RecastConfiguration.userVariables["CLs_calculator_backend"])
+        elif variable =="CLs_common_random_numbers":
+            table.extend(RecastConfiguration.userVariables["CLs_common_random_numbers"])
+        elif variable =="CLs_ncores":
+            table.extend(RecastConfiguration.userVariables["CLs_ncores"])
+        elif variable =="CLs_s95_tolerance":
+            table.extend(RecastConfiguration.userVariables["CLs_s95_tolerance"])
+        elif variable =="max_parallel_jobs":
+            table.extend(RecastConfiguration.userVariables["max_parallel_jobs"])
         elif variable =="simplify_likelihoods":
             table.extend(RecastConfiguration.userVariables["simplify_likelihoods"])
         elif variable =="expectation_assumption":
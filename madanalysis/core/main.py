@@ -46,6 +46,7 @@ from madanalysis.configuration.fom_configuration        import FomConfiguration
 from madanalysis.configuration.isolation_configuration  import IsolationConfiguration
 from madanalysis.configuration.merging_configuration    import MergingConfiguration
 from string_tools                                       import StringTools
+from profiler                                           import Profiler
 from madanalysis.system.checkup                         import CheckUp
 import logging
 import os
@@ -64,6 +65,11 @@ class Main():
         "outputfile": ['"output.lhe.gz"', '"output.lhco.gz"'],
         "recast": ["on", "off"],
         "random_seed": ["47"],
+        "shards": ["1", "4", "8"],
+        "max_parallel_datasets": ["1", "4", "8"],
+        "timing_summary": ["true", "false"],
+        "max_parallel_plots": ["0", "1", "4"],
+        "build_cache_size": ["0", "500", "2000"],
     }
 
     forced = False
@@ -92,6 +98,7 @@ class Main():
         self.logger         = logging.getLogger('MA5')
         self.redirectSAlogger = False
         self.random_seed    = None
+        self.profiler       = Profiler()
 
 
     def ResetParameters(self):
@@ -107,6 +114,11 @@ class Main():
         self.stack          = StackingMethodType.STACK
         self.isolation      = IsolationConfiguration()
         self.output         = ""
+        self.shards         = 1
+        self.max_parallel_datasets = 1
+        self.timing_summary = False
+        self.max_parallel_plots = 0
+        self.build_cache_size = 2000
         self.graphic_render = GraphicRenderType.NONE
         if self.mode==MA5RunningType.RECO:
             self.normalize = NormalizeType.NONE
@@ -135,6 +147,16 @@ class Main():
         return "The file format is unknown"
         
 
+    def GetPlotCores(self):
+        """ Number of plots rendered at the same time """
+        if self.max_parallel_plots!=0:
+            return self.max_parallel_plots
+        if self.archi_info.ncores>0:
+            return self.archi_info.ncores
+        import multiprocessing
+        return multiprocessing.cpu_count()
+
+
     def GetSampleFormat(self):
 
         # Initializing containers
@@ -215,6 +237,11 @@ class Main():
         self.user_DisplayParameter("normalize")
         self.user_DisplayParameter("lumi")
         self.user_DisplayParameter("outputfile")
+        self.user_DisplayParameter("shards")
+        self.user_DisplayParameter("max_parallel_datasets")
+        self.user_DisplayParameter("timing_summary")
+        self.user_DisplayParameter("max_parallel_plots")
+        self.user_DisplayParameter("build_cache_size")
         self.fom.Display()
         self.logger.info(" *********************************" )
         allowed, forbidden = self.GetSampleFormat()
@@ -269,6 +296,24 @@ class Main():
             else:
                 msg='"'+self.output+'"'
             self.logger.info(" output file = "+msg)
+        elif parameter=="shards":
+            self.logger.info(" number of SampleAnalyzer processes per dataset = "+str(self.shards))
+        elif parameter=="max_parallel_datasets":
+            self.logger.info(" number of datasets analyzed at the same time = "+str(self.max_parallel_datasets))
+        elif parameter=="timing_summary":
+            self.logger.info(" timing summary at the end of the jobs = "+str(self.timing_summary).lower())
+        elif parameter=="max_parallel_plots":
+            if self.max_parallel_plots==0:
+                msg="all the cores"
+            else:
+                msg=str(self.max_parallel_plots)
+            self.logger.info(" number of plots rendered at the same time = "+msg)
+        elif parameter=="build_cache_size":
+            if self.build_cache_size==0:
+                msg="disabled"
+            else:
+                msg=str(self.build_cache_size)+" MB"
+            self.logger.info(" size of the cache of the compiled executables = "+msg)
         elif parameter=="lumi":
             self.logger.info(" integrated luminosity = "+str(self.lumi)+" fb^{-1}" )
         elif parameter=="recast":
@@ -360,6 +405,71 @@ class Main():
                 self.logger.error("'lumi' is a positive float value")
                 return
 
+        # shards
+        elif (parameter=="shards"):
+            try:
+                tmp = int(value)
+            except:
+                self.logger.error("'shards' is a strictly positive integer value")
+                return False
+            if (tmp>0):
+                self.shards=tmp
+            else:
+                self.logger.error("'shards' is a strictly positive integer value")
+                return False
+
+        # max_parallel_datasets
+        elif (parameter=="max_parallel_datasets"):
+            try:
+                tmp = int(value)
+            except:
+                self.logger.error("'max_parallel_datasets' is a strictly positive integer value")
+                return False
+            if (tmp>0):
+                self.max_parallel_datasets=tmp
+            else:
+                self.logger.error("'max_parallel_datasets' is a strictly positive integer value")
+                return False
+
+        # timing_summary
+        elif (parameter=="timing_summary"):
+            if value == "true":
+                self.timing_summary=True
+            elif value == "false":
+                self.timing_summary=False
+            else:
+                self.logger.error("'timing_summary' possible values are : 'true', 'false'")
+                return False
+
+        # max_parallel_plots
+        elif (parameter=="max_parallel_plots"):
+            try:
+                tmp = int(value)
+            except:
+                self.logger.error("'max_parallel_plots' is a positive integer value (0: all the cores)")
+                return False
+            if (tmp>=0):
+                self.max_parallel_plots=tmp
+            else:
+                self.logger.error("'max_parallel_plots' is a positive integer value (0: all the cores)")
+                return False
+
+        # build_cache_size
+        elif (parameter=="build_cache_size"):
+            try:
+                tmp = int(value)
+            except:
+                self.logger.error("'build_cache_size' is a positive integer value in MB (0: no cache)")
+                return False
+            if (tmp>=0):
+                self.build_cache_size=tmp
+                # Applying the new size right away (0 = emptying the cache)
+                from madanalysis.IOinterface.job_writer import JobWriter
+                JobWriter(self,'').PruneBuildCache()
+            else:
+                self.logger.error("'build_cache_size' is a positive integer value in MB (0: no cache)")
+                return False
+
         # output
         elif (parameter=="outputfile"):
             quoteTag=False
@@ -735,6 +845,12 @@ class Main():
 
         self.logger.info("   **********************************************************")
 
+        # Precompiled header for the jobs (optional)
+        self.logger.info("   Precompiling the SampleAnalyzer headers for the jobs ...")
+        if not compiler.BuildPrecompiledHeader():
+            self.logger.warning("The jobs will be compiled without precompiled header.")
+        self.logger.info("   **********************************************************")
+
         # Chrono end
         chrono.Stop()
         self.logger.info("   Elapsed time = "+chrono.Display())
@@ -82,6 +82,7 @@ class CmdSubmit(CmdBase):
             return False
 
         self.main.lastjob_status = False
+        self.main.profiler.Reset()
 
         # Checking if new plots or cuts have been performed
         ToReAnalyze = False
@@ -129,6 +130,7 @@ class CmdSubmit(CmdBase):
             self.logger.info("   Creating the new histograms and/or applying the new cuts...")
             # Submission
             if not self.submit(self.main.lastjob_name,history):
+                self.WriteTimings(self.main.lastjob_name)
                 return
             self.logger.info("   Updating the reports...")
         else:
@@ -137,6 +139,7 @@ class CmdSubmit(CmdBase):
         # Reading info from job output
         layout = Layout(self.main)
         if not self.extract(self.main.lastjob_name,layout):
+            self.WriteTimings(self.main.lastjob_name)
             return
 
         # Status = GOOD
@@ -146,6 +149,7 @@ class CmdSubmit(CmdBase):
 
         # Creating the reports
         self.CreateReports([self.main.lastjob_name],history,layout)
+        self.WriteTimings(self.main.lastjob_name)
 
         # End of time 
         chrono.Stop()
@@ -196,13 +200,16 @@ class CmdSubmit(CmdBase):
 
         # Submission
         self.logger.debug('Launching SampleAnalyzer ...')
+        self.main.profiler.Reset()
         if not self.submit(filename,history):
+            self.WriteTimings(filename)
             return
 
         # Reading info from job output
         self.logger.debug('Go back to the Python interface ...')
         layout = Layout(self.main)
         if not self.extract(filename,layout):
+            self.WriteTimings(filename)
             return
 
         # Status = GOOD
@@ -215,6 +222,7 @@ class CmdSubmit(CmdBase):
         # Creating the reports
         if not self.main.recasting.status=="on":
             self.CreateReports(args,history,layout)
+        self.WriteTimings(filename)
 
         # End of time 
         chrono.Stop()
@@ -270,66 +278,72 @@ class CmdSubmit(CmdBase):
 
         # Draw plots
         self.logger.info("   Generating all plots ...")
-        if not layout.DoPlots(histopath,modes,output_paths):
+        with self.main.profiler.Stage('plots'):
+            ok = layout.DoPlots(histopath,modes,output_paths)
+        if not ok:
             return
 
-        # Generating the HTML report
+        # Reports to generate (LaTeX reports are compiled after their generation)
+        reports = [(ReportFormatType.HTML,htmlpath)]
         self.logger.info("   Generating the HMTL report ...")
-        layout.GenerateReport(history,htmlpath,ReportFormatType.HTML)
-        self.logger.info("     -> To open this HTML report, please type 'open'.")
-
-        # PDF report
         if self.main.session_info.has_pdflatex:
-
-            # Generating the PDF report
+            reports.append((ReportFormatType.PDFLATEX,pdfpath))
             self.logger.info("   Generating the PDF report ...")
-            layout.GenerateReport(history,pdfpath,ReportFormatType.PDFLATEX)
-            layout.CompileReport(ReportFormatType.PDFLATEX,pdfpath)
+        else:
+            self.logger.warning("pdflatex not installed -> no PDF report.")
+        if self.main.session_info.has_latex:
+            reports.append((ReportFormatType.LATEX,dvipath))
+            self.logger.info("   Generating the DVI report ...")
+        else:
+            self.logger.warning("latex not installed -> no DVI/PDF report.")
+
+        # Generating the reports at the same time
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(reports)) as pool:
+            list(pool.map(lambda x: self.CreateReport(history,layout,x[0],x[1]), reports))
 
-            # Displaying message for opening PDF
+        # Displaying messages for opening the reports
+        self.logger.info("     -> To open this HTML report, please type 'open'.")
+        if self.main.session_info.has_pdflatex:
             if self.main.currentdir in pdfpath:
                 pdfpath = pdfpath[len(self.main.currentdir):]
             if pdfpath[0]=='/':
                 pdfpath=pdfpath[1:]
             self.logger.info("     -> To open this PDF report, please type 'open " + pdfpath + "'.")
+        if self.main.session_info.has_latex and self.main.session_info.has_dvipdf:
+            pdfpath = os.path.expanduser(args[0]+'/Output/DVI/MadAnalysis5job_'+str(i))
+            if self.main.currentdir in pdfpath:
+                pdfpath = pdfpath[len(self.main.currentdir):]
+            if pdfpath[0]=='/':
+                pdfpath=pdfpath[1:]
+            self.logger.info("     -> To open the corresponding Latex file, please type 'open " + pdfpath + "'.")
 
-        else:
-            self.logger.warning("pdflatex not installed -> no PDF report.")
 
-        # DVI/PDF report
-        if self.main.session_info.has_latex:
+    def CreateReport(self,history,layout,mode,path):
+        """ Generates one report and, for the LaTeX reports, compiles it """
+        with self.main.profiler.Stage('reports'):
+            if not layout.GenerateReport(history,path,mode):
+                return False
+        if mode==ReportFormatType.HTML:
+            return True
+        with self.main.profiler.Stage('latex'):
+            return layout.CompileReport(mode,path)
 
-            # Warning message for DVI -> PDF
-            self.logger.info("   Generating the DVI report ...")
-#            if not self.main.session_info.has_dvipdf:
-#               self.logger.warning("dvipdf not installed -> the DVI report will not be converted to a PDF file.")
-
-            # Generating the DVI report
-            layout.GenerateReport(history,dvipath,ReportFormatType.LATEX)
-            layout.CompileReport(ReportFormatType.LATEX,dvipath)
-
-            # Displaying message for opening DVI
-            if self.main.session_info.has_dvipdf:
-                pdfpath = os.path.expanduser(args[0]+'/Output/DVI/MadAnalysis5job_'+str(i))
-                if self.main.currentdir in pdfpath:
-                    pdfpath = pdfpath[len(self.main.currentdir):]
-                if pdfpath[0]=='/':
-                    pdfpath=pdfpath[1:]
-                self.logger.info("     -> To open the corresponding Latex file, please type 'open " + pdfpath + "'.")
 
-        else:
-            self.logger.warning("latex not installed -> no DVI/PDF report.")
 
+    def submit(self,dirname,history):
+        with self.main.profiler.Stage('submit'):
+            return self.submit_job(dirname,history)
 
 
-    def submit(self,dirname,history):
+    def submit_job(self,dirname,history):
+        profiler = self.main.profiler
 
         # checking if delphes is needed and installing/activating it if relevant
         detector_handler = DetectorManager(self.main)
-        if not detector_handler.manage('delphes'):
-            logging.getLogger('MA5').error('Problem with the handling of delphes/delphesMA5tune')
-            return False
-        if not detector_handler.manage('delphesMA5tune'):
+        with profiler.Stage('detector setup'):
+            ok = detector_handler.manage('delphes') and detector_handler.manage('delphesMA5tune')
+        if not ok:
             logging.getLogger('MA5').error('Problem with the handling of delphes/delphesMA5tune')
             return False
 
@@ -343,102 +357,165 @@ class CmdSubmit(CmdBase):
         else:
             self.logger.info("   Checking the structure of the folder '"+\
                dirname.split('/')[-1]+"'...")
-        if not jobber.Open():
-            self.logger.error("job submission aborted.")
-            return False
-
-        if not self.resubmit:
-            if self.main.recasting.status != 'on':
-                self.logger.info("   Copying 'SampleAnalyzer' source files...")
-            if not jobber.CopyLHEAnalysis():
-                self.logger.error("   job submission aborted.")
-                return False
-            if self.main.recasting.status != 'on' and not jobber.CreateBldDir():
-                self.logger.error("   job submission aborted.")
+        with profiler.Stage('job writing'):
+            if not jobber.Open():
+                self.logger.error("job submission aborted.")
                 return False
 
+            if not self.resubmit:
+                if self.main.recasting.status != 'on':
+                    self.logger.info("   Copying 'SampleAnalyzer' source files...")
+                if not jobber.CopyLHEAnalysis():
+                    self.logger.error("   job submission aborted.")
+                    return False
+                if self.main.recasting.status != 'on' and not jobber.CreateBldDir():
+                    self.logger.error("   job submission aborted.")
+                    return False
+
         # In the case of recasting, there is no need to create a standard Job
         if self.main.recasting.status == "on":
-            Recaster = RunRecast(self.main, dirname)
-            ### Initialization
-            if not Recaster.init():
-                return False
-            self.main.recasting.delphesruns = Recaster.delphes_runcard
-            ### Executing the PAD
-            if not Recaster.execute():
-                self.logger.error("job submission aborted.")
-                return False
+            with profiler.Stage('recast'):
+                Recaster = RunRecast(self.main, dirname)
+                ### Initialization
+                if not Recaster.init():
+                    return False
+                self.main.recasting.delphesruns = Recaster.delphes_runcard
+                ### Executing the PAD
+                if not Recaster.execute():
+                    self.logger.error("job submission aborted.")
+                    return False
         # Otherwise, standard job
         else:
-            self.logger.info("   Inserting your selection into 'SampleAnalyzer'...")
-            if not jobber.WriteSelectionHeader(self.main):
-                self.logger.error("job submission aborted.")
-                return False
-            if not jobber.WriteSelectionSource(self.main):
-                self.logger.error("job submission aborted.")
-                return False
-
-        self.logger.info("   Writing the list of datasets...")
-        for item in self.main.datasets:
-            jobber.WriteDatasetList(item)
+            with profiler.Stage('job writing'):
+                self.logger.info("   Inserting your selection into 'SampleAnalyzer'...")
+                if not jobber.WriteSelectionHeader(self.main):
+                    self.logger.error("job submission aborted.")
+                    return False
+                if not jobber.WriteSelectionSource(self.main):
+                    self.logger.error("job submission aborted.")
+                    return False
 
-        self.logger.info("   Writing the command line history...")
-        jobber.WriteHistory(history,self.main.firstdir)
-        if self.main.recasting.status == "on":
-            self.main.recasting.collect_outputs(dirname,self.main.datasets)
-            self.logger.info('    -> the results can be found in:') 
-            self.logger.info('       '+ dirname + '/Output/SAF/CLs_output_summary.dat')
+        with profiler.Stage('job writing'):
+            self.logger.info("   Writing the list of datasets...")
             for item in self.main.datasets:
-                self.logger.info('       '+ dirname + '/Output/SAF/'+ item.name + '/CLs_output.dat')
-        else:
-            layouter = LayoutWriter(self.main, dirname)
-            layouter.WriteLayoutConfig()
-
-        if not self.main.recasting.status=='on' and not self.resubmit:
-            self.logger.info("   Creating Makefiles...")
-            if not jobber.WriteMakefiles():
-                self.logger.error("job submission aborted.")
-                return False
+                jobber.WriteDatasetList(item)
+
+            self.logger.info("   Writing the command line history...")
+            jobber.WriteHistory(history,self.main.firstdir)
+            if self.main.recasting.status == "on":
+                self.main.recasting.collect_outputs(dirname,self.main.datasets)
+                self.logger.info('    -> the results can be found in:') 
+                self.logger.info('       '+ dirname + '/Output/SAF/CLs_output_summary.dat')
+                for item in self.main.datasets:
+                    self.logger.info('       '+ dirname + '/Output/SAF/'+ item.name + '/CLs_output.dat')
+            else:
+                layouter = LayoutWriter(self.main, dirname)
+                layouter.WriteLayoutConfig()
+
+            if not self.main.recasting.status=='on' and not self.resubmit:
+                self.logger.info("   Creating Makefiles...")
+                if not jobber.WriteMakefiles():
+                    self.logger.error("job submission aborted.")
+                    return False
 
         # Edit & check the delphes or recasting cards
         if self.main.fastsim.package in ["delphes","delphesMA5tune"] and not self.main.recasting.status=='on':
-            delphesCheck = DelphesCardChecker(dirname,self.main)
-            if not delphesCheck.checkPresenceCard():
-                self.logger.error("job submission aborted.")
-                return False
-            if not delphesCheck.editCard():
-                self.logger.error("job submission aborted.")
-                return False
-            self.logger.info("   Checking the content of the Delphes card...")
-            if not delphesCheck.checkContentCard():
-                self.logger.error("job submission aborted.")
-                return False
+            with profiler.Stage('card editing'):
+                delphesCheck = DelphesCardChecker(dirname,self.main)
+                if not delphesCheck.checkPresenceCard():
+                    self.logger.error("job submission aborted.")
+                    return False
+                if not delphesCheck.editCard():
+                    self.logger.error("job submission aborted.")
+                    return False
+                self.logger.info("   Checking the content of the Delphes card...")
+                if not delphesCheck.checkContentCard():
+                    self.logger.error("job submission aborted.")
+                    return False
 
         if self.resubmit and not self.main.recasting.status=='on':
-            self.logger.info("   Cleaning 'SampleAnalyzer'...")
-            if not jobber.MrproperJob():
-                self.logger.error("job submission aborted.")
-                return False
+            with profiler.Stage('compilation'):
+                self.logger.info("   Cleaning 'SampleAnalyzer'...")
+                if not jobber.MrproperJob():
+                    self.logger.error("job submission aborted.")
+                    return False
 
         if not self.main.recasting.status=='on':
-            self.logger.info("   Compiling 'SampleAnalyzer'...")
-            if not jobber.CompileJob():
-                self.logger.error("job submission aborted.")
-                return False
+            fingerprint = jobber.BuildFingerprint()
+            if jobber.RestoreExecutable(fingerprint):
+                self.logger.info("   Using the 'SampleAnalyzer' executable compiled in a previous run")
+            else:
+                with profiler.Stage('compilation'):
+                    self.logger.info("   Compiling 'SampleAnalyzer'...")
+                    if not jobber.CompileJob():
+                        self.logger.error("job submission aborted.")
+                        return False
+
+                with profiler.Stage('linking'):
+                    self.logger.info("   Linking 'SampleAnalyzer'...")
+                    if not jobber.LinkJob():
+                        self.logger.error("job submission aborted.")
+                        return False
+                jobber.StoreExecutable(fingerprint)
+
+            self.run_datasets(jobber)
+        return True
 
-            self.logger.info("   Linking 'SampleAnalyzer'...")
-            if not jobber.LinkJob():
-                self.logger.error("job submission aborted.")
-                return False
 
-            for item in self.main.datasets:
-                self.logger.info("   Running 'SampleAnalyzer' over dataset '"
-                             +item.name+"'...")
-                self.logger.info("    *******************************************************")
-                if not jobber.RunJob(item):
-                    self.logger.error("run over '"+item.name+"' aborted.")
-                self.logger.info("    *******************************************************")
-        return True
+    def run_datasets(self,jobber):
+        """
+        Runs SampleAnalyzer over the datasets, main.max_parallel_datasets of
+        them at the same time. A failed run does not stop the other ones.
+        """
+        datasets = list(self.main.datasets)
+        nworkers = max(1, min(self.main.max_parallel_datasets, len(datasets)))
+        if nworkers==1:
+            for item in datasets:
+                self.run_dataset(jobber,item)
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+        self.logger.info("   Running 'SampleAnalyzer' over "+str(len(datasets))+\
+                         " datasets, "+str(nworkers)+" at a time...")
+        with ThreadPoolExecutor(max_workers=nworkers) as pool:
+            results = list(pool.map(lambda x: self.run_dataset(jobber,x,'['+x.name+'] '), datasets))
+        failed = [item.name for item, result in zip(datasets,results) if not result]
+        if len(failed)!=0:
+            self.logger.error("run over the dataset(s) '"+"', '".join(failed)+"' aborted.")
+
+
+    def run_dataset(self,jobber,item,prefix=None):
+        """
+        Runs SampleAnalyzer over one dataset. With a prefix, the output of
+        SampleAnalyzer is tagged with it so that concurrent runs can be told
+        apart.
+        """
+        with self.main.profiler.Stage('event processing',item.name):
+            return self.run_dataset_job(jobber,item,prefix)
+
+
+    def run_dataset_job(self,jobber,item,prefix=None):
+        nshards = jobber.GetNShards(item)
+        if nshards > 1:
+            self.logger.info("   Running 'SampleAnalyzer' over dataset '"
+                             +item.name+"' with "+str(nshards)+" processes...")
+            result = jobber.RunShardedJob(item,nshards)
+            if not result:
+                self.logger.error("run over '"+item.name+"' aborted.")
+            return result
+        self.logger.info("   Running 'SampleAnalyzer' over dataset '"
+                         +item.name+"'...")
+        if prefix is not None:
+            result = jobber.RunJob(item,prefix=prefix)
+            if not result:
+                self.logger.error(prefix+"run over '"+item.name+"' aborted.")
+            return result
+        self.logger.info("    *******************************************************")
+        result = jobber.RunJob(item)
+        if not result:
+            self.logger.error("run over '"+item.name+"' aborted.")
+        self.logger.info("    *******************************************************")
+        return result
 
 
     def extract(self,dirname,layout):
@@ -459,14 +536,29 @@ class CmdSubmit(CmdBase):
         if self.main.recasting.status!='on':
             self.logger.info("   Extracting data from the output files...")
             for i in range(0,len(self.main.datasets)):
-                jobber.ExtractGeneral(self.main.datasets[i])
-                jobber.ExtractHistos(self.main.datasets[i],layout.plotflow.detail[i])
-                jobber.ExtractCuts(self.main.datasets[i],layout.cutflow.detail[i])
-                if self.main.merging.enable:
-                    jobber.ExtractHistos(self.main.datasets[i],layout.merging.detail[i],merging=True)
+                with self.main.profiler.Stage('extraction',self.main.datasets[i].name):
+                    jobber.ExtractGeneral(self.main.datasets[i])
+                    jobber.ExtractHistos(self.main.datasets[i],layout.plotflow.detail[i])
+                    jobber.ExtractCuts(self.main.datasets[i],layout.cutflow.detail[i])
+                    if self.main.merging.enable:
+                        jobber.ExtractHistos(self.main.datasets[i],layout.merging.detail[i],merging=True)
         return True
 
 
+    def WriteTimings(self,dirname):
+        """
+        Writes the time spent in the stages of the job in Output/timing.json
+        and, with main.timing_summary, displays their totals.
+        """
+        if not os.path.isdir(dirname+'/Output'):
+            return
+        self.main.profiler.Write(os.path.normpath(dirname+'/Output/timing.json'))
+        if self.main.timing_summary:
+            self.logger.info("   Time spent in the stages of the job:")
+            for line in self.main.profiler.Table():
+                self.logger.info("     "+line)
+
+
     def help(self):
         if not self.resubmit:
             self.logger.info("   Syntax: submit <dirname>")
@@ -46,6 +46,8 @@ class JobMain:
         JobHeader.WriteFoot(self.file,self.main)
 
     def WriteSource(self):
+        # AnalyzerBase.h first, so that its precompiled version can be used
+        self.file.write('#include "SampleAnalyzer/Process/Analyzer/AnalyzerBase.h"\n')
         self.file.write('#include "SampleAnalyzer/User/Analyzer/user.h"\n')
         self.file.write('using namespace MA5;\n')
         self.file.write('\n')
@@ -24,6 +24,7 @@
 
 from __future__ import absolute_import
 import logging
+import numpy
 from math import sqrt
 from six.moves import range
 
@@ -49,15 +50,34 @@ class HistogramCore:
         self.overflow    = 0.
         self.nan         = 0.
         self.inf         = 0.
-        self.array       = []
+        self.array       = numpy.zeros(0)
 
 
     def ComputeIntegral(self):
-        self.integral = 0
-        for i in range(0,len(self.array)):
-            self.integral+=self.array[i]
+        self.integral  = float(numpy.sum(self.array))
         self.integral += self.overflow
         self.integral += self.underflow
+
+
+    @staticmethod
+    def Subtract(positive,negative,dataset,warnings):
+        """
+        Bin contents of the summary histogram (positive minus negative
+        weights). The negative contents are set to zero and reported with a
+        single warning for the whole histogram.
+        """
+        data  = numpy.asarray(positive,dtype=float) - numpy.asarray(negative,dtype=float)
+        bins  = numpy.flatnonzero(data<0)
+        if len(bins)!=0:
+            listed = ', '.join(str(x) for x in bins[:10].tolist())
+            if len(bins)>10:
+                listed += ', ...'
+            warnings.append('dataset='+dataset.name+\
+                            ' -> '+str(len(bins))+' bin(s) ('+listed+')'+\
+                            ' have a negative content (lowest value: '+\
+                            str(float(data[bins].min()))+'). These values are set to zero')
+            data[bins] = 0.
+        return data
         
 
     def Print(self):
@@ -24,7 +24,9 @@
 
 from __future__ import absolute_import
 from madanalysis.layout.histogram_frequency_core import HistogramFrequencyCore
+from madanalysis.layout.histogram_core           import HistogramCore
 import logging
+import numpy
 from six.moves import range
 
 class HistogramFrequency:
@@ -51,17 +53,8 @@ class HistogramFrequency:
         self.summary.entries = self.positive.entries + self.negative.entries
 
         # Data
-        data = []
-        for i in range(0,len(self.positive.array)):
-            data.append(self.positive.array[i]-self.negative.array[i])
-            if data[-1]<0:
-                self.warnings.append(\
-                    'dataset='+dataset.name+\
-                    ' -> bin '+str(i)+\
-                    ' has a negative content : '+\
-                    str(data[-1])+'. This value is set to zero')
-                data[-1]=0
-        self.summary.array = data[:] # [:] -> clone of data
+        self.summary.array = HistogramCore.Subtract(self.positive.array,self.negative.array,\
+                                                    dataset,self.warnings)
 
         # Integral
         self.positive.ComputeIntegral()
@@ -105,7 +98,7 @@ class HistogramFrequency:
         self.ymax     = []
 
         # labels
-        self.labels       = [] # int: PDG id 
+        self.labels       = numpy.zeros(0,dtype=int) # int: PDG id 
         self.stringlabels = [] # string: label
 
         # Data
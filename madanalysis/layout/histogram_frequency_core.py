@@ -24,6 +24,7 @@
 
 from __future__ import absolute_import
 import logging
+import numpy
 class HistogramFrequencyCore:
 
     def __init__(self):
@@ -34,12 +35,10 @@ class HistogramFrequencyCore:
         self.nentries  = 0
         self.overflow  = 0.
         self.underflow = 0.
-        self.array     = []
+        self.array     = numpy.zeros(0)
 
     def ComputeIntegral(self):
-        self.integral = 0
-        for value in self.array:
-            self.integral+=value
+        self.integral = float(numpy.sum(self.array))
 
     def Print(self):
 
@@ -42,6 +42,7 @@ from madanalysis.layout.cutflow                        import CutFlow
 from madanalysis.layout.plotflow                       import PlotFlow
 from madanalysis.layout.merging_plots                  import MergingPlots
 from madanalysis.selection.instance_name               import InstanceName
+from shell_command                                     import ShellCommand
 from math                                              import log10, floor, ceil, isnan, isinf
 import os
 import shutil
@@ -182,10 +183,10 @@ class Layout:
 
         # Launching ROOT
         if self.main.graphic_render==GraphicRenderType.ROOT:
-            producer=HistoRootProducer(histo_path,ListPlots)
+            producer=HistoRootProducer(histo_path,ListPlots,self.main.GetPlotCores())
             producer.Execute()
         elif self.main.graphic_render==GraphicRenderType.MATPLOTLIB:
-            producer=HistoMatplotlibProducer(histo_path,ListPlots)
+            producer=HistoMatplotlibProducer(histo_path,ListPlots,self.main.GetPlotCores())
             producer.Execute()
 
         # Ok
@@ -1280,13 +1281,49 @@ class Layout:
 
 
     @staticmethod
-    def CheckLatexLog(file):
-        if not os.path.isfile(file):
+    def LatexAuxiliaryFiles(output_path):
+        """ Contents of the files written by a LaTeX pass and read by the next one """
+        contents = []
+        for extension in ['aux','toc','out']:
+            try:
+                with open(os.path.normpath(output_path+'/main.'+extension),'rb') as stream:
+                    contents.append(stream.read())
+            except IOError:
+                contents.append(None)
+        return contents
+
+
+    def RunLatex(self,compiler,output_path):
+        """
+        Compiles main.tex, a second time only if the first pass asks for it
+        (Rerun warning) or changed the references or the table of contents.
+        The output of the passes is written in latex.log.
+        """
+        theCommands = [compiler,'-interaction=nonstopmode','main.tex']
+        logname     = os.path.normpath(output_path+'/latex.log')
+
+        # First pass
+        before = Layout.LatexAuxiliaryFiles(output_path)
+        self.logger.debug('shell command: '+' '.join(theCommands))
+        ok, out = ShellCommand.ExecuteWithLog(theCommands,logname,output_path,silent=False)
+        if out is None:
             return False
-        for line in file:
-            if line.startswith('!'):
-                return False
-        return True
+        try:
+            with open(os.path.normpath(output_path+'/main.log'),'r') as stream:
+                rerun = 'Rerun' in stream.read()
+        except IOError:
+            rerun = True
+        if not rerun and Layout.LatexAuxiliaryFiles(output_path)==before:
+            self.logger.debug('single '+compiler+' pass for '+output_path)
+            return ok
+
+        # Second pass
+        ok, out = ShellCommand.ExecuteWithLog(theCommands,os.devnull,output_path,silent=False)
+        if out is not None:
+            with open(logname,'a') as stream:
+                stream.write(out)
+        return ok
+
 
     def CompileReport(self,mode,output_path):
         
@@ -1294,49 +1331,33 @@ class Layout:
         if mode==ReportFormatType.LATEX:
 
             # Launching latex and producing DVI file
-            os.system('cd '+output_path+'; latex -interaction=nonstopmode main.tex > latex.log 2>&1;'+\
-                      ' latex -interaction=nonstopmode main.tex >> latex.log 2>&1')
+            ok = self.RunLatex('latex',output_path)
 
             name=os.path.normpath(output_path+'/main.dvi')
             if not os.path.isfile(name):
                 self.logger.error('DVI file cannot be produced')
                 self.logger.error('Please have a look to the log file '+output_path+'/latex.log')
                 return False
-            
-            # Checking latex log : are there errors
-            if not Layout.CheckLatexLog(output_path+'/latex.log'):
-                self.logger.error('some errors occured during LATEX compilation')
-                self.logger.error('for more details, have a look to the log file : '+output_path+'/latex.log')
-                return False
-
-            # Converting DVI file to PDF file
-#            if self.main.session_info.has_dvipdf:
-#                self.logger.info("     -> Converting the DVI report to a PDF report.")
-#                os.system('cd '+output_path+'; dvipdf main.dvi > dvipdf.log 2>&1')
-#                name=os.path.normpath(output_path+'/main.pdf')
-#
-#                # Checking PDF file presence
-#                if not os.path.isfile(name):
-#                    self.logger.error('PDF file cannot be produced')
-#                    self.logger.error('Please have a look to the log file '+output_path+'/dvipdf.log')
-#                    return False
 
         # ---- PDFLATEX MODE ----
         elif mode==ReportFormatType.PDFLATEX:
 
             # Launching latex and producing PDF file
-            os.system('cd '+output_path+'; pdflatex -interaction=nonstopmode main.tex > latex.log 2>&1;'+\
-                      ' pdflatex -interaction=nonstopmode main.tex >> latex.log 2>&1');
-
-            # Checking latex log : are there errors
-            if not Layout.CheckLatexLog(output_path+'/latex.log'):
-                self.logger.error('some errors occured during LATEX compilation')
-                self.logger.error('for more details, have a look to the log file : '+output_path+'/latex.log')
-                return False
+            ok = self.RunLatex('pdflatex',output_path)
 
             # Checking PDF file presence
             name=os.path.normpath(output_path+'/main.pdf')
             if not os.path.isfile(name):
                 self.logger.error('PDF file cannot be produced')
-                self.logger.error('Please have a look to the log file '+output_path+'/latex2.log')
+                self.logger.error('Please have a look to the log file '+output_path+'/latex.log')
                 return False
+
+        else:
+            return True
+
+        # Checking latex exit code : are there errors
+        if not ok:
+            self.logger.error('some errors occured during LATEX compilation')
+            self.logger.error('for more details, have a look to the log file : '+output_path+'/latex.log')
+            return False
+        return True
@@ -243,9 +243,9 @@ class MergingPlots:
             outputC.write('  // Content\n')
             outputC.write('  '+histoname+'->SetBinContent(0'+\
                           ','+str(DJRplots[ind].summary.underflow*scales[ind])+'); // underflow\n')
-            for bin in range(1,xnbin+1):
-                outputC.write('  '+histoname+'->SetBinContent('+str(bin)+\
-                              ','+str(DJRplots[ind].summary.array[bin-1]*scales[ind])+');\n')
+            values = (DJRplots[ind].summary.array[:xnbin]*scales[ind]).tolist()
+            outputC.write(''.join('  '+histoname+'->SetBinContent('+str(bin+1)+\
+                                  ','+str(value)+');\n' for bin, value in enumerate(values)))
             nentries=DJRplots[ind].summary.nentries
             outputC.write('  '+histoname+'->SetBinContent('+str(xnbin+1)+\
                           ','+str(DJRplots[ind].summary.overflow*scales[ind])+'); // overflow\n')
@@ -423,12 +423,9 @@ class MergingPlots:
             histoname=DJRplots[ind].name
             outputPy.write('    # Creating weights for histo: '+histoname+'\n')
             outputPy.write('    '+histoname+'_'+str(MergingPlots.counter)+'_weights = numpy.array([')
-            ntot=0
-            for bin in range(1,xnbin+1):
-                ntot+=DJRplots[ind].summary.array[bin-1]*scales[ind]
-                if bin!=1:
-                    outputPy.write(',')
-                outputPy.write(str(DJRplots[ind].summary.array[bin-1]*scales[ind]))
+            values = (DJRplots[ind].summary.array[:xnbin]*scales[ind]).tolist()
+            ntot   = sum(values)
+            outputPy.write(','.join(str(value) for value in values))
             outputPy.write('])\n')
 
         # Canvas
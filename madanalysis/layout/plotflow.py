@@ -33,6 +33,7 @@ from madanalysis.enumeration.stacking_method_type import StackingMethodType
 from madanalysis.layout.plotflow_for_dataset      import PlotFlowForDataset
 import madanalysis.enumeration.color_hex
 import logging
+import numpy
 import six
 from six.moves import range
 
@@ -67,57 +68,22 @@ class PlotFlow:
 
     def InitializeHistoFrequency(self,ihisto):
 
-        # New collection of labels
-        newlabels=[]
+        # New collection of labels, common to all datasets (sorted)
+        newlabels = numpy.unique(numpy.concatenate(\
+                    [numpy.asarray(histo[ihisto].labels,dtype=int) for histo in self.detail]))
 
-        # Loop over datasets
+        # Loop over datasets: moving the contents to the new labels
         for histo in self.detail:
-
-            # Loop over the label
-            for label in histo[ihisto].labels:
-
-                # Add in the collection 
-                if label not in newlabels:
-                    newlabels.append(label)
-
-        # Sorting labels (alphabetical order)
-        newlabels = sorted(newlabels)
-
-        # Loop over datasets
-        for histo in self.detail:
-
-            # New array for data
-            array_positive=[]
-            array_negative=[]
-            
-            # Loop over the new labels
-            for newlabel in newlabels:
-
-                # Loop over the old labels
-                found = False
-                value_positive = 0
-                value_negative = 0
-                for i in range(len(histo[ihisto].labels)):
-
-                    if newlabel==histo[ihisto].labels[i]:
-                        value_positive = histo[ihisto].positive.array[i]
-                        value_negative = histo[ihisto].negative.array[i]
-                        found = True
-                        break
-
-                # Fill
-                if found:
-                    array_positive.append(value_positive)
-                    array_negative.append(value_negative)
-                else:
-                    array_positive.append(0.)
-                    array_negative.append(0.)
+            index = numpy.searchsorted(newlabels,numpy.asarray(histo[ihisto].labels,dtype=int))
+            array_positive = numpy.zeros(len(newlabels))
+            array_negative = numpy.zeros(len(newlabels))
+            array_positive[index] = histo[ihisto].positive.array
+            array_negative[index] = histo[ihisto].negative.array
 
             # save result
-            # PS: [:] -> clone the arrays
-            histo[ihisto].positive.array = array_positive[:]
-            histo[ihisto].negative.array = array_negative[:]
-            histo[ihisto].labels         = newlabels[:]
+            histo[ihisto].positive.array = array_positive
+            histo[ihisto].negative.array = array_negative
+            histo[ihisto].labels         = newlabels.copy()
 
 
     @staticmethod
@@ -287,10 +253,10 @@ class PlotFlow:
             outputC.write('  // Content\n')
             outputC.write('  '+histoname+'->SetBinContent(0'+\
                           ','+str(histos[ind].summary.underflow*scales[ind])+'); // underflow\n')
-            for bin in range(1,xnbin+1):
-                ntot+= histos[ind].summary.array[bin-1]*scales[ind]
-                outputC.write('  '+histoname+'->SetBinContent('+str(bin)+\
-                              ','+str(histos[ind].summary.array[bin-1]*scales[ind])+');\n')
+            values = (histos[ind].summary.array[:xnbin]*scales[ind]).tolist()
+            ntot  += sum(values)
+            outputC.write(''.join('  '+histoname+'->SetBinContent('+str(bin+1)+\
+                                  ','+str(value)+');\n' for bin, value in enumerate(values)))
             nentries=histos[ind].summary.nentries
             outputC.write('  '+histoname+'->SetBinContent('+str(xnbin+1)+\
                           ','+str(histos[ind].summary.overflow*scales[ind])+'); // overflow\n')
@@ -630,11 +596,9 @@ class PlotFlow:
             histoname='y'+histos[ind].name+'_'+str(ind)
             outputPy.write('    # Creating weights for histo: '+histoname+'\n')
             outputPy.write('    '+histoname+'_weights = numpy.array([')
-            for bin in range(1,xnbin+1):
-                ntot+=histos[ind].summary.array[bin-1]*scales[ind]
-                if bin!=1:
-                    outputPy.write(',')
-                outputPy.write(str(histos[ind].summary.array[bin-1]*scales[ind]))
+            values = (histos[ind].summary.array[:xnbin]*scales[ind]).tolist()
+            ntot  += sum(values)
+            outputPy.write(','.join(str(value) for value in values))
             outputPy.write('])\n\n')
 
 
@@ -31,7 +31,7 @@ from madanalysis.enumeration.color_type           import ColorType
 from madanalysis.enumeration.linestyle_type       import LineStyleType
 from madanalysis.enumeration.backstyle_type       import BackStyleType
 from madanalysis.enumeration.stacking_method_type import StackingMethodType
-import copy
+import numpy
 from six.moves import range
 
 
@@ -92,82 +92,58 @@ class PlotFlowForDataset:
     # Computing scales
     def ComputeScale(self):
 
-        iplot=0
-
-        # Loop over plot
-        for iabshisto in range(0,len(self.main.selection)):
-
-
-            # Keep only histogram
-            if self.main.selection[iabshisto].__class__.__name__!="Histogram":
-                continue
-
-
-            # Reset scale
-            scale=0.
-
-
-            # Case 1: Normalization to ONE
-            if self.main.selection[iabshisto].stack==StackingMethodType.NORMALIZE2ONE or \
+        # Histograms of the selection
+        selection = [x for x in self.main.selection if x.__class__.__name__=="Histogram"]
+        histos    = self.histos[:len(selection)]
+        if len(histos)==0:
+            return
+
+        # Integrals and statistics of all the histograms
+        integral = numpy.array([x.positive.integral - x.negative.integral for x in histos],dtype=float)
+
+        # Case 1: Normalization to ONE
+        scales2one = numpy.zeros(len(histos))
+        numpy.divide(1.,integral,out=scales2one,where=integral>0.)
+
+        # Case 2: No normalization
+        if self.main.normalize == NormalizeType.NONE:
+            scales = numpy.ones(len(histos))
+
+        # Case 3 and 4 : Normalization formula depends on LUMI
+        #                or depends on WEIGHT+LUMI 
+        elif self.main.normalize in [NormalizeType.LUMI, \
+                                     NormalizeType.LUMI_WEIGHT]:
+
+            # compute efficiency : Nevent / Ntotal
+            eff = numpy.zeros(len(histos))
+            if self.dataset.measured_global.nevents!=0:
+                eff = numpy.array([x.positive.nevents + x.negative.nevents for x in histos],dtype=float) / \
+                      float(self.dataset.measured_global.nevents)
+
+            # compute the good xsection value
+            thexsection = self.xsection
+            if self.main.normalize==NormalizeType.LUMI_WEIGHT:
+                thexsection = thexsection * self.dataset.weight
+
+            # compute final entries/event ratio
+            sumw     = numpy.array([x.positive.sumw - x.negative.sumw for x in histos],dtype=float)
+            Nentries = numpy.array([x.positive.sumwentries - x.negative.sumwentries for x in histos],dtype=float)
+            entries_per_events = numpy.zeros(len(histos))
+            numpy.divide(sumw,Nentries,out=entries_per_events,where=(sumw!=0) & (Nentries!=0))
+
+            # compute the scale (no scale for empty plot)
+            scales = numpy.ones(len(histos))
+            numpy.divide(thexsection * self.main.lumi * 1000 * eff * entries_per_events,\
+                         integral,out=scales,where=integral!=0)
+
+        else:
+            scales = numpy.zeros(len(histos))
+
+        # Setting the computing scale
+        for iplot, ref in enumerate(selection):
+            if ref.stack==StackingMethodType.NORMALIZE2ONE or \
               (self.main.stack==StackingMethodType.NORMALIZE2ONE and \
-               self.main.selection[iabshisto].stack==StackingMethodType.AUTO):
-                integral=self.histos[iplot].positive.integral -\
-                         self.histos[iplot].negative.integral
-                if integral>0.:
-                    scale = 1./integral
-                else:
-                    scale = 0.
-
-
-            # Case 2: No normalization
-            elif self.main.normalize == NormalizeType.NONE:
-                scale = 1.
-
-
-            # Case 3 and 4 : Normalization formula depends on LUMI
-            #                or depends on WEIGHT+LUMI 
-            elif self.main.normalize in [NormalizeType.LUMI, \
-                                         NormalizeType.LUMI_WEIGHT]:
-
-                # integral
-                integral=self.histos[iplot].positive.integral -\
-                         self.histos[iplot].negative.integral
-
-                # compute efficiency : Nevent / Ntotal
-                if self.dataset.measured_global.nevents==0:
-                    eff = 0
-                else:
-                    eff = (self.histos[iplot].positive.nevents  + \
-                          self.histos[iplot].negative.nevents) / \
-                          float(self.dataset.measured_global.nevents)
-
-                # compute the good xsection value
-                thexsection = self.xsection
-                if self.main.normalize==NormalizeType.LUMI_WEIGHT:
-                    thexsection = thexsection * self.dataset.weight
-                
-                # compute final entries/event ratio
-                entries_per_events = 0
-                sumw = self.histos[iplot].positive.sumw - \
-                       self.histos[iplot].negative.sumw
-                Nentries = self.histos[iplot].positive.sumwentries - \
-                           self.histos[iplot].negative.sumwentries
-                if sumw!=0 and Nentries!=0:
-                    entries_per_events = sumw / Nentries
-
-                # compute the scale
-                if integral!=0:
-                    scale = thexsection * \
-                            self.main.lumi * 1000 * \
-                            eff * \
-                            entries_per_events / \
-                            integral
-                else:
-                    scale = 1 # no scale for empty plot
-
-            # Setting the computing scale
-            self.histos[iplot].scale=copy.copy(scale)
-
-            # Incrementing counter
-            iplot+=1
-
+               ref.stack==StackingMethodType.AUTO):
+                histos[iplot].scale = float(scales2one[iplot])
+            else:
+                histos[iplot].scale = float(scales[iplot])
@@ -27,6 +27,46 @@ import json, os, copy, math, logging
 from six.moves import range
 
 
+# Parsed likelihood files and derived background workspaces, shared by all the
+# HF_Background and HF_Signal instances built during a recast. The entries are
+# keyed by the file modification time so that an edited JSON file is re-read.
+# The cached objects are shared: they must be treated as read-only.
+_json_cache       = {}
+_background_cache = {}
+
+
+def read_json(filename):
+    """
+        Load a (background) likelihood JSON file, parsing it only once for a
+        given modification time of the file.
+    """
+    filename = os.path.normpath(filename)
+    key = (filename, os.path.getmtime(filename))
+    if key not in _json_cache:
+        for old_key in [x for x in _json_cache.keys() if x[0] == filename]:
+            _json_cache.pop(old_key)
+        with open(filename, 'r') as json_file:
+            _json_cache[key] = json.load(json_file)
+    return _json_cache[key]
+
+
+def channel_layout(filename):
+    """
+        Number of bins and number of samples of each channel of the likelihood
+        stored in filename, as needed for building the signal patches.
+    """
+    HF = read_json(filename)
+    return {
+        'bins'    : [len(x.get('data', [])) for x in HF.get('observations', [])],
+        'samples' : [len(x.get('samples', [])) for x in HF.get('channels', [])]
+    }
+
+
+def clear_cache():
+    _json_cache.clear()
+    _background_cache.clear()
+
+
 class HistFactory(object):
     def __init__(self,pyhf_config):
         self.pyhf_config = pyhf_config.get('SR'  , {})
@@ -138,15 +178,31 @@ class HistFactory(object):
 class HF_Background(HistFactory):
     def __init__(self, pyhf_config, expected=False):
         super(HF_Background, self).__init__(pyhf_config)
-        self.logger.debug('Reading : '+os.path.join(self.path,self.name))
-        if os.path.isfile(os.path.join(self.path,self.name)):
-            with open(os.path.join(self.path,self.name),'r') as json_file:
-                self.hf = json.load(json_file)
+        self.expected = expected
+        self.extrapolated = {}
+        filename = os.path.normpath(os.path.join(self.path,self.name))
+        self.logger.debug('Reading : '+filename)
+        if os.path.isfile(filename):
+            # The (possibly expected) workspace and its luminosity extrapolations
+            # are built once per file, lumi and expectation flag
+            key = (filename, os.path.getmtime(filename), self.lumi, expected)
+            if key not in _background_cache:
+                self.hf = read_json(filename)
+                if expected:
+                    self.hf = self.impose_expected()
+                _background_cache[key] = (self.hf, {})
+            self.hf, self.extrapolated = _background_cache[key]
         else:
-            self.logger.warning('Can not find file : '+ os.path.join(self.path,self.name))
+            self.logger.warning('Can not find file : '+ filename)
 
-        if expected:
-            self.hf = self.impose_expected()
+    def __call__(self, lumi):
+        lumi = float(lumi)
+        if lumi not in self.extrapolated:
+            self.extrapolated[lumi] = self.extrapolate(lumi)
+        return self.extrapolated[lumi]
+
+    def filename(self):
+        return os.path.normpath(os.path.join(self.path,self.name))
 
     def size(self):
         # The number of SRs in the likelihood profile
@@ -213,10 +269,8 @@ class HF_Signal(HistFactory):
         super(HF_Signal, self).__init__(pyhf_config)
         self.signal_config = {}
 
-        with open(os.path.join(self.path, self.name), 'r') as json_file:
-            tmp_bkg = json.load(json_file)
-
-        bin_sizes = [len(x.get('data', [])) for x in tmp_bkg.get('observations',[])]
+        layout    = channel_layout(os.path.join(self.path, self.name))
+        bin_sizes = layout['bins']
 
         for key, item in self.pyhf_config.items():
             if key != 'lumi':
@@ -228,7 +282,7 @@ class HF_Signal(HistFactory):
                     self.signal_config[key]['op'] = 'add'
                     self.signal_config[key]["path"] = \
                         '/channels/' + str(item['channels']) + '/samples/' + \
-                        str(len(tmp_bkg["channels"][int(item['channels'])]["samples"])-1)
+                        str(layout['samples'][int(item['channels'])]-1)
                     self.signal_config[key]["bin_size"] = \
                         bin_sizes[int(self.signal_config[key]["path"].split('/')[2])]
 
@@ -375,8 +429,7 @@ def get_HFID(file,SRname):
         Extract the location of the profiles within the JSON file.
     """
     if os.path.isfile(file):
-        with open(file, 'r') as json_file:
-            HF = json.load(json_file)
+        HF = read_json(file)
     else:
         return 'Can not find background file: '+file
     for ch in HF['channels']:
@@ -0,0 +1,372 @@
+################################################################################
+#
+#  Copyright (C) 2012-2023 Jack Araz, Eric Conte & Benjamin Fuks
+#  The MadAnalysis development team, email: <ma5team@iphc.cnrs.fr>
+#
+#  This file is part of MadAnalysis 5.
+#  Official website: <https://github.com/MadAnalysis/madanalysis5>
+#
+#  MadAnalysis 5 is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MadAnalysis 5 is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with MadAnalysis 5. If not, see <http://www.gnu.org/licenses/>
+#
+################################################################################
+
+
+from __future__ import absolute_import
+from collections import OrderedDict
+from scipy.special import ndtr, pdtr
+import hashlib
+import numpy as np
+
+
+class ToyCLs(object):
+    """
+        Native (toy Monte Carlo) CLs calculator for a single-bin counting
+        experiment with a Gaussian uncertainty on the background.
+
+        The background toys of a region only depend on the background model and
+        are therefore generated, sorted and stored once. They are drawn from a
+        generator seeded by the seed of the calculator and by the background
+        model, so that they do not depend on the order in which the regions
+        are processed. The p-values are then
+        obtained by binary search in the sorted toys. With common random numbers,
+        the signal+background toys are generated by inverse-transform sampling
+        from a fixed set of uniform numbers, so that the CLs value is a
+        deterministic and monotonic function of the signal hypothesis.
+    """
+
+    def __init__(self, seed=None, common_random_numbers=True, max_regions=32):
+        """
+        :param seed: seed of the random number generator, an integer or a
+            numpy SeedSequence (None = random)
+        :param common_random_numbers: use the same random numbers for all the
+            signal hypotheses tested in a given region
+        :param max_regions: number of background toy sets kept in memory
+        """
+        self.seed                  = seed
+        self.entropy               = seed if isinstance(seed, np.random.SeedSequence) \
+                                     else np.random.SeedSequence(seed)
+        self.rng                   = np.random.default_rng(self.entropy)
+        self.common_random_numbers = common_random_numbers
+        self.max_regions           = max_regions
+        self.toys                  = OrderedDict()
+
+    def cache_id(self):
+        """
+        Identifier of the random numbers of the calculator, for the caches of
+        its results. None if they cannot be reproduced (random seed, or new
+        signal+background toys for each call).
+        """
+        if self.seed is None or not self.common_random_numbers:
+            return None
+        return (self.entropy.entropy, tuple(self.entropy.spawn_key))
+
+    def background_toys(self, ExpectedBG, BGError, NumToyExperiments):
+        """
+        Expected backgrounds (Gaussian tail extending to negative numbers being
+        removed), sorted Poisson toys and uniform numbers for the S+B toys.
+        """
+        key = (float(ExpectedBG), float(BGError), int(NumToyExperiments))
+        if key in self.toys:
+            self.toys.move_to_end(key)
+            return self.toys[key]
+        region      = int(hashlib.sha1(repr(key).encode()).hexdigest()[:16], 16)
+        rng         = np.random.default_rng(np.random.SeedSequence(
+            self.entropy.entropy, spawn_key=tuple(self.entropy.spawn_key) + (region,)
+        ))
+        ExpectedBGs = rng.normal(ExpectedBG, BGError, int(NumToyExperiments))
+        ExpectedBGs = ExpectedBGs[ExpectedBGs > 0]
+        ToyBGs      = np.sort(rng.poisson(ExpectedBGs))
+        uniforms    = None
+        if self.common_random_numbers:
+            uniforms = rng.random(ExpectedBGs.size)
+        self.toys[key] = (ExpectedBGs, ToyBGs, uniforms)
+        while len(self.toys) > self.max_regions:
+            self.toys.popitem(last=False)
+        return self.toys[key]
+
+    def __call__(self, NumObserved, ExpectedBG, BGError, SigHypothesis, NumToyExperiments, **kwargs):
+        """
+        Returns 1-CLs for the signal hypothesis SigHypothesis. The keyword
+        arguments (CLs_exp, CLs_obs) are accepted for compatibility with the
+        other calculators; the expected limits are obtained by setting
+        NumObserved to the background.
+        """
+        ExpectedBGs, ToyBGs, uniforms = self.background_toys(ExpectedBG, BGError, NumToyExperiments)
+
+        # The probability for the background alone to fluctuate as LOW as
+        # observed = the fraction of the toy experiments with backgrounds as low
+        # as observed = p_b.
+        if ToyBGs.size == 0:
+            return 0.
+        p_b = np.searchsorted(ToyBGs, NumObserved, side='right') / float(ToyBGs.size)
+
+        # Toy MC for background+signal
+        ExpectedBGandS = ExpectedBGs + SigHypothesis
+        positive       = ExpectedBGandS > 0
+        ExpectedBGandS = ExpectedBGandS[positive]
+        if ExpectedBGandS.size == 0:
+            return 0.
+
+        # Fraction of the S+B toys that are <= the number observed, giving p_(S+B).
+        if uniforms is None:
+            ToyBplusS = self.rng.poisson(ExpectedBGandS)
+            p_SplusB  = np.count_nonzero(ToyBplusS <= NumObserved) / float(ExpectedBGandS.size)
+        else:
+            # Inverse-transform sampling: toy <= NumObserved iff u <= F(NumObserved)
+            cdf      = pdtr(np.floor(NumObserved), ExpectedBGandS)
+            p_SplusB = np.count_nonzero(uniforms[positive] <= cdf) / float(ExpectedBGandS.size)
+
+        # Divide by (1 - p_b) a la the CLs prescription.
+        if p_SplusB > p_b or p_b == 0.:
+            return 0.
+        return 1. - (p_SplusB / p_b) # 1 - CLs
+
+    def batch(self, NumObserved, ExpectedBG, BGError, SigHypothesis, NumToyExperiments, **kwargs):
+        """
+        1-CLs for a set of regions given as arrays (broadcast together). The
+        regions are processed by blocks of max_regions, whose toys are handled
+        as 2-D arrays (one row per region).
+        """
+        args  = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                      [NumObserved, ExpectedBG, BGError, SigHypothesis]])
+        flat  = [x.ravel() for x in args]
+        size  = max(int(self.max_regions), 1)
+        result = np.zeros(flat[0].size)
+        for start in range(0, flat[0].size, size):
+            block = slice(start, start + size)
+            result[block] = self.block(*[x[block] for x in flat], NumToyExperiments=NumToyExperiments)
+        return result.reshape(args[0].shape)
+
+    def block(self, NumObserved, ExpectedBG, BGError, SigHypothesis, NumToyExperiments):
+        """
+        1-CLs for a block of regions given as 1-D arrays, the toys of the
+        regions being padded to a common size. Same results as __call__.
+        """
+        toys   = [self.background_toys(nb, deltanb, NumToyExperiments)
+                  for nb, deltanb in zip(ExpectedBG, BGError)]
+        sizes  = np.array([ToyBGs.size for _, ToyBGs, _ in toys])
+        width  = max(int(sizes.max()), 1) if sizes.size > 0 else 1
+        valid  = np.arange(width) < sizes[:, None]
+        ExpectedBGs = np.zeros(valid.shape)
+        ExpectedBGs[valid] = np.concatenate([bgs for bgs, _, _ in toys] + [np.zeros(0)])
+
+        # p_b from the sorted background toys of each region
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p_b = np.array([np.searchsorted(ToyBGs, nobs, side='right')
+                            for (_, ToyBGs, _), nobs in zip(toys, NumObserved)], dtype=float) / sizes
+
+        # Toy MC for background+signal, the padding being masked
+        ExpectedBGandS = ExpectedBGs + SigHypothesis[:, None]
+        positive       = valid & (ExpectedBGandS > 0)
+        npositive      = np.count_nonzero(positive, axis=1)
+        if not self.common_random_numbers:
+            ToyBplusS = self.rng.poisson(np.where(positive, ExpectedBGandS, 0.))
+            below     = ToyBplusS <= NumObserved[:, None]
+        else:
+            # Inverse-transform sampling: toy <= NumObserved iff u <= F(NumObserved)
+            uniforms = np.ones(valid.shape)
+            uniforms[valid] = np.concatenate([u for _, _, u in toys] + [np.zeros(0)])
+            cdf      = np.zeros(valid.shape)
+            cdf[positive] = pdtr(np.broadcast_to(np.floor(NumObserved)[:, None], valid.shape)[positive],
+                                 ExpectedBGandS[positive])
+            below    = uniforms <= cdf
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p_SplusB = np.count_nonzero(below & positive, axis=1) / npositive.astype(float)
+            result   = 1. - (p_SplusB / p_b) # 1 - CLs
+        excluded = (sizes == 0) | (npositive == 0) | (p_b == 0.) | (p_SplusB > p_b)
+        return np.where(excluded, 0., result)
+
+
+class AsymptoticCLs(object):
+    """
+        CLs calculator for a single-bin counting experiment with a Gaussian
+        uncertainty on the background, relying on the asymptotic formulae for
+        the q~_mu test statistic (arXiv:1007.1727), as in CLsComputer of the
+        simplified likelihood module.
+
+        For a single bin, the nuisance parameter maximising the likelihood at
+        fixed signal is the root of a quadratic equation, and the unconditional
+        fit reproduces the observed number of events. No toy experiment and no
+        numerical minimisation are therefore needed, and all the regions of an
+        analysis can be evaluated in one array call.
+    """
+
+    @staticmethod
+    def profiled_nll(NumObserved, ExpectedBG, BGError, SigHypothesis):
+        """
+        Negative log-likelihood (up to constant terms) of the Poisson x Gaussian
+        model, with the background nuisance parameter profiled.
+        """
+        total  = ExpectedBG + SigHypothesis
+        sigma2 = BGError**2
+        # Expected number of events at the conditional maximum: root of
+        # lambda^2 + (sigma2 - total) lambda - nobs sigma2 = 0
+        lmbda  = 0.5 * ((total - sigma2) + np.sqrt((total - sigma2)**2 + 4.*NumObserved*sigma2))
+        lmbda  = np.where(sigma2 > 0., lmbda, total)
+        lmbda  = np.maximum(lmbda, 1e-30)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gaussian = np.where(sigma2 > 0., (lmbda - total)**2 / (2.*sigma2), 0.)
+            poisson  = lmbda - np.where(NumObserved > 0., NumObserved*np.log(lmbda), 0.)
+        return poisson + gaussian
+
+    def qtilde(self, NumObserved, ExpectedBG, BGError, SigHypothesis):
+        """ q~ test statistic for the signal hypothesis SigHypothesis (mu = 1). """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mu_hat = np.where(SigHypothesis > 0., (NumObserved - ExpectedBG) / SigHypothesis, 0.)
+        nll     = self.profiled_nll(NumObserved, ExpectedBG, BGError, SigHypothesis)
+        # mu_hat < 0: the background-only hypothesis is the reference
+        nll_ref = np.where(
+            mu_hat < 0.,
+            self.profiled_nll(NumObserved, ExpectedBG, BGError, 0.*SigHypothesis),
+            NumObserved - np.where(NumObserved > 0., NumObserved*np.log(np.maximum(NumObserved, 1e-30)), 0.)
+        )
+        qmu = np.maximum(2.*(nll - nll_ref), 0.)
+        return np.where(mu_hat > 1., 0., qmu)
+
+    def batch(self, NumObserved, ExpectedBG, BGError, SigHypothesis, NumToyExperiments=0, **kwargs):
+        """ 1-CLs for arrays of regions (broadcast together). """
+        NumObserved, ExpectedBG, BGError, SigHypothesis = np.broadcast_arrays(
+            *[np.asarray(x, dtype=float) for x in [NumObserved, ExpectedBG, BGError, SigHypothesis]]
+        )
+        qmu = self.qtilde(NumObserved, ExpectedBG, BGError, SigHypothesis)
+
+        # Asimov data set built from the background fitted to the observation
+        total0  = ExpectedBG
+        sigma2  = BGError**2
+        asimov  = 0.5 * ((total0 - sigma2) + np.sqrt((total0 - sigma2)**2 + 4.*NumObserved*sigma2))
+        asimov  = np.where(sigma2 > 0., asimov, total0)
+        qA  = self.qtilde(asimov, ExpectedBG, BGError, SigHypothesis)
+
+        sqmu, sqA = np.sqrt(qmu), np.sqrt(qA)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            CLsb = np.where(qA >= qmu, 1. - ndtr(sqmu), 1. - ndtr((qmu + qA)/(2.*sqA)))
+            CLb  = np.where(qA >= qmu, ndtr(sqA - sqmu), 1. - ndtr((qmu - qA)/(2.*sqA)))
+            CLsb = np.where((qA < qmu) & (qA == 0.), 1., CLsb)
+            CLb  = np.where((qA < qmu) & (qA == 0.), 1., CLb)
+            CLs  = np.where(CLb > 0., CLsb/CLb, 1.)
+        CLs = np.where(SigHypothesis > 0., CLs, 1.)
+        return 1. - np.clip(CLs, 0., 1.)
+
+    def __call__(self, NumObserved, ExpectedBG, BGError, SigHypothesis, NumToyExperiments=0, **kwargs):
+        """ 1-CLs for a single region (same signature as ToyCLs). """
+        return float(self.batch(NumObserved, ExpectedBG, BGError, SigHypothesis))
+
+
+def batch_cls(calculator, NumObserved, ExpectedBG, BGError, SigHypothesis, NumToyExperiments, **kwargs):
+    """
+        1-CLs for all the regions of an analysis given as arrays. The calculator
+        is either a ToyCLs-like object providing a batch method, or a scalar
+        function with the signature of pyhf_wrapper, called region by region.
+    """
+    if hasattr(calculator, 'batch'):
+        return calculator.batch(NumObserved, ExpectedBG, BGError, SigHypothesis, NumToyExperiments, **kwargs)
+    args = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                 [NumObserved, ExpectedBG, BGError, SigHypothesis]])
+    return np.array([float(calculator(float(nobs), float(nb), float(deltanb), float(nsig),
+                                      int(NumToyExperiments), **kwargs))
+                     for nobs, nb, deltanb, nsig in zip(*[x.ravel() for x in args])]).reshape(args[0].shape)
+
+
+def expected_limit(NumObserved, ExpectedBG, BGError):
+    """
+        Gaussian estimate of the 95% CL limit on the number of signal events
+        (1.64 standard deviations above the observed excess), bounded from
+        below by the limit of three events of a background-free search. Only
+        used to seed the root finding of the exact limits.
+    """
+    NumObserved, ExpectedBG, BGError = [np.asarray(x, dtype=float) for x in [NumObserved, ExpectedBG, BGError]]
+    excess = np.maximum(NumObserved - ExpectedBG, 0.)
+    return np.maximum(excess + 1.64*np.sqrt(np.maximum(ExpectedBG, 0.) + BGError**2), 3.)
+
+
+def batch_s95(func, size, guess=1., rtol=1e-2, maxiter=100, limits=(1e-10, 1e10)):
+    """
+        Vectorised search of the roots of `size` independent increasing functions.
+
+        The bracket of each root is obtained from the initial guess, by steps of
+        a factor of 2 and then of 10. The root is then refined by Illinois
+        (secant) iterations on the logarithm of the variable, a bisection being
+        made whenever the last two iterations have not halved the bracket.
+
+        :param func: func(x, index) returns the values of the functions of the
+            problems index (integer array) at the points x (array of same length)
+        :param guess: estimate(s) of the roots
+        :param rtol: relative tolerance on the roots
+        :param maxiter: maximal number of iterations
+
+        :returns: array with the roots, -1 for the problems whose bracket could
+            not be found.
+    """
+    index  = np.arange(size)
+    result = np.full(size, -1.)
+    if size == 0:
+        return result
+
+    ## Bracketing, starting from the guess
+    x0 = np.clip(np.broadcast_to(np.asarray(guess, dtype=float), (size,)), limits[0], limits[1])
+    f0 = np.asarray(func(x0, index), dtype=float)
+    low,  flow  = x0.copy(), f0.copy()
+    high, fhigh = x0.copy(), f0.copy()
+    result[f0 == 0.] = x0[f0 == 0.]
+    step = 2.
+    todo = (flow > 0.)
+    while todo.any():
+        high[todo], fhigh[todo] = low[todo], flow[todo]
+        low[todo]  /= step
+        flow[todo]  = func(low[todo], index[todo])
+        todo = (flow > 0.) & (low >= limits[0])
+        step = 10.
+    step = 2.
+    todo = (fhigh < 0.)
+    while todo.any():
+        low[todo], flow[todo] = high[todo], fhigh[todo]
+        high[todo] *= step
+        fhigh[todo] = func(high[todo], index[todo])
+        todo = (fhigh < 0.) & (high <= limits[1])
+        step = 10.
+
+    active = (flow * fhigh < 0.)
+    found  = active.copy()
+
+    ## Illinois iterations on log(x), all the active problems being updated at once
+    a, fa, b, fb = np.log(np.where(found, low, 1.)), flow.copy(), np.log(np.where(found, high, 1.)), fhigh.copy()
+    widths = np.abs(b - a)
+    stalls = np.zeros(size, dtype=int)
+    for _ in range(maxiter):
+        active &= (np.abs(b - a) > rtol)
+        if not active.any():
+            break
+        ia = index[active]
+        denominator = fb[ia] - fa[ia]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c = np.where(denominator != 0.,
+                         (a[ia]*fb[ia] - b[ia]*fa[ia]) / denominator,
+                         0.5*(a[ia] + b[ia]))
+        # Safety: stay strictly within the bracket, bisection if too slow
+        inside = (c > np.minimum(a[ia], b[ia])) & (c < np.maximum(a[ia], b[ia])) & (stalls[ia] < 2)
+        c = np.where(inside, c, 0.5*(a[ia] + b[ia]))
+        fc = np.asarray(func(np.exp(c), ia), dtype=float)
+        exact = (fc == 0.)
+        a[ia[exact]], b[ia[exact]] = c[exact], c[exact]
+        swap  = (fc * fb[ia] < 0.) & ~exact
+        keep  = ~swap & ~exact
+        a[ia[swap]], fa[ia[swap]] = b[ia[swap]], fb[ia[swap]]
+        fa[ia[keep]] *= 0.5
+        b[ia], fb[ia] = c, fc
+        halved = np.abs(b[ia] - a[ia]) <= 0.5*widths[ia]
+        widths[ia] = np.where(halved, np.abs(b[ia] - a[ia]), widths[ia])
+        stalls[ia] = np.where(halved, 0, stalls[ia] + 1)
+
+    result[found] = np.exp(b[found])
+    return result
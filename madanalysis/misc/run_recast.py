@@ -47,9 +47,29 @@ from madanalysis.install.detector_manager import DetectorManager
 from madanalysis.IOinterface.folder_writer import FolderWriter
 from madanalysis.IOinterface.job_writer import JobWriter
 from madanalysis.IOinterface.library_writer import LibraryWriter
+from madanalysis.IOinterface.saf_reader import SafReader
 from madanalysis.misc.histfactory_reader import (
-    HF_Background, HF_Signal,get_HFID
+    HF_Background, HF_Signal, get_HFID
 )
+from madanalysis.misc.native_cls import (
+    AsymptoticCLs, ToyCLs, batch_cls, batch_s95, expected_limit
+)
+from madanalysis.misc.s95_cache import S95Cache
+
+
+# RunRecast instance used by the forked CLs workers (see RunRecast.run_cls_tasks)
+_cls_runner = None
+
+
+def _init_cls_worker():
+    # Forgetting the stages inherited from the parent process
+    _cls_runner.main.profiler.Extract()
+
+
+def _run_cls_task(task):
+    # The stages measured in the worker are sent back with the result
+    result = _cls_runner.run_cls_task(*task)
+    return result, _cls_runner.main.profiler.Extract()
 
 
 class RunRecast():
@@ -69,8 +89,13 @@ class RunRecast():
         self.cov_config       = {}
         self.logger           = logging.getLogger('MA5')
         self.is_apriori       = True
-        self.cls_calculator   = cls
+        self.cls_calculator   = ToyCLs(
+            seed                  = self.main.random_seed,
+            common_random_numbers = self.main.recasting.CLs_common_random_numbers
+        )
         self.TACO_output      = self.main.recasting.TACO_output
+        self.s95_cache        = None
+        self.slh_sessions     = OrderedDict()
 
     def init(self):
         ### First, the analyses to take care off
@@ -91,6 +116,8 @@ class RunRecast():
     def SetCLsCalculator(self):
         if self.main.session_info.has_pyhf and self.main.recasting.CLs_calculator_backend == "pyhf":
             self.cls_calculator = pyhf_wrapper
+        elif self.main.recasting.CLs_calculator_backend == "asymptotic":
+            self.cls_calculator = AsymptoticCLs()
         elif not self.main.session_info.has_pyhf:
             self.main.recasting.CLs_calculator_backend = "native"
 
@@ -105,6 +132,19 @@ class RunRecast():
             self.logger.warning("A posteriori expectation calculation is not available, " + \
                                 "a priori limits will be calculated.")
 
+        ## Persistent cache of the single-region limits, invalidated by any
+        ## change in the settings below
+        self.s95_cache = None
+        if self.main.session_info.tmpdir != "":
+            settings = (
+                self.main.recasting.CLs_calculator_backend, self.is_apriori, self.ntoys,
+                self.main.random_seed, self.main.recasting.CLs_common_random_numbers,
+                self.main.recasting.CLs_s95_tolerance
+            )
+            self.s95_cache = S95Cache(
+                os.path.join(self.main.session_info.tmpdir, 'MA5_s95_cache.sqlite'), settings
+            )
+
     ################################################
     ### GENERAL METHODS
     ################################################
@@ -121,7 +161,9 @@ class RunRecast():
                 return False
 
             ## Running the fastsim
-            if not self.fastsim_single(version, card):
+            with self.timed('fast simulation'):
+                ok = self.fastsim_single(version, card)
+            if not ok:
                 self.main.forced=self.forced
                 return False
             self.main.fastsim.package = self.detector
@@ -135,11 +177,45 @@ class RunRecast():
             if not FolderWriter.RemoveDirectory(os.path.normpath(self.dirname+'_RecastRun')):
                 return False
 
+        ## Event files of all the cards, from the manifests of the datasets
+        for myset in self.main.datasets:
+            with self.timed('output', myset.name):
+                ok = self.write_file_info(myset.name)
+            if not ok:
+                self.main.forced=self.forced
+                return False
+
         # exit
+        self.report_timings()
         self.main.forced=self.forced
         return True
 
 
+    ## Time spent in each stage of the recast
+    def timed(self, stage, dataset=None):
+        return self.main.profiler.Stage('recast '+stage, dataset)
+
+    def report_timings(self):
+        lines = self.main.profiler.Table('recast ')
+        if len(lines)==0:
+            return
+        self.logger.info('   Time spent in the recasting stages:')
+        for line in lines:
+            self.logger.info('     '+line)
+
+
+    ## Waiting for a file written by another process, with a bounded backoff
+    def wait_for_file(self, filename, timeout=10.):
+        delay = 0.01
+        while not os.path.exists(filename):
+            if timeout <= 0.:
+                return False
+            time.sleep(delay)
+            timeout -= delay
+            delay    = min(2.*delay, 1.)
+        return True
+
+
     ## Prompt to edit the recasting card
     def edit_recasting_card(self):
         if self.forced or self.main.script:
@@ -216,22 +292,26 @@ class RunRecast():
 
         # Checking whether events have already been generated and if not, event generation
         self.logger.debug('Loop over the datasets...')
+        if self.detector=="fastjet":
+            return True
+        todo = []
         for item in self.main.datasets:
-            if self.detector=="delphesMA5tune":
-                evtfile = self.dirname+'/Output/SAF/'+item.name+'/RecoEvents/RecoEvents_v1x1_'+delphescard.replace('.tcl','')+'.root'
-            elif self.detector=="delphes":
-                evtfile = self.dirname+'/Output/SAF/'+item.name+'/RecoEvents/RecoEvents_v1x2_'+delphescard.replace('.tcl','')+'.root'
-            elif self.detector=="fastjet":
-                return True
-
+            evtfile = self.reco_events_file(item, delphescard)
             self.logger.debug('- applying fastsim and producing '+evtfile+'...')
             if not os.path.isfile(os.path.normpath(evtfile)):
-                if not self.generate_events(item,delphescard):
-                    return False
+                todo.append(item)
+        if len(todo)>0 and not self.generate_events(todo,delphescard):
+            return False
 
         # Exit
         return True
 
+    def reco_events_file(self, dataset, delphescard):
+        """ Reconstructed events of a dataset for a given Delphes card """
+        tag = 'v1x1' if self.detector=="delphesMA5tune" else 'v1x2'
+        return self.dirname+'/Output/SAF/'+dataset.name+'/RecoEvents/RecoEvents_'+tag+'_'+\
+               delphescard.replace('.tcl','')+'.root'
+
     def fastsim_header(self, version):
         ## Gettign the version dependent stuff
         to_print = False
@@ -249,61 +329,94 @@ class RunRecast():
             self.logger.info("   "+StringTools.Center(tag+' detector simulations',57))
             self.logger.info("   **********************************************************")
 
-    def run_delphes(self,dataset,card):
+    def prepare_delphes(self,card):
+        """ Writes and compiles the Delphes job, shared by all the datasets """
         # Initializing the JobWriter
         if os.path.isdir(self.dirname+'_RecastRun'):
             if not FolderWriter.RemoveDirectory(os.path.normpath(self.dirname+'_RecastRun')):
-                return False
+                return None
         jobber = JobWriter(self.main,self.dirname+'_RecastRun')
 
         # Writing process
         self.logger.info("   Creating folder '"+self.dirname.split('/')[-1]  + "_RecastRun'...")
         if not jobber.Open():
-            return False
+            return None
         self.logger.info("   Copying 'SampleAnalyzer' source files...")
         if not jobber.CopyLHEAnalysis():
-            return False
+            return None
         if not jobber.CreateBldDir():
-            return False
+            return None
         self.logger.info("   Inserting your selection into 'SampleAnalyzer'...")
         if not jobber.WriteSelectionHeader(self.main):
-            return False
+            return None
         if not jobber.WriteSelectionSource(self.main):
-            return False
-        self.logger.info("   Writing the list of datasets...")
-        jobber.WriteDatasetList(dataset)
+            return None
         self.logger.info("   Creating Makefiles...")
         if not jobber.WriteMakefiles():
-            return False
+            return None
         self.logger.debug("   Fixing the pileup path...")
         self.fix_pileup(self.dirname+'_RecastRun/Input/'+card)
 
-        # Creating executable
+        # Creating executable (unless built previously from the same sources)
+        fingerprint = jobber.BuildFingerprint()
+        if jobber.RestoreExecutable(fingerprint):
+            self.logger.info("   Using the 'SampleAnalyzer' executable compiled in a previous run")
+            return jobber
         self.logger.info("   Compiling 'SampleAnalyzer'...")
         if not jobber.CompileJob():
-            return False
+            return None
         self.logger.info("   Linking 'SampleAnalyzer'...")
         if not jobber.LinkJob():
-            return False
-
-        # Running
-        self.logger.info("   Running 'SampleAnalyzer' over dataset '" +dataset.name+"'...")
-        self.logger.info("    *******************************************************")
-        if not jobber.RunJob(dataset):
-            self.logger.error("run over '"+dataset.name+"' aborted.")
-        self.logger.info("    *******************************************************")
+            return None
+        jobber.StoreExecutable(fingerprint)
 
         # Exit
-        return True
-
+        return jobber
 
-    def run_SimplifiedFastSim(self,dataset,card,analysislist):
+    def run_delphes(self,jobber,datasets,card):
+        """
+        Runs the Delphes job over the datasets, recasting.max_parallel_jobs of
+        them at the same time, each in its own folder. The reconstructed events
+        are saved as soon as a run finishes.
         """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        ncores = max(1, min(self.main.recasting.max_parallel_jobs, len(datasets)))
+        def run(dataset):
+            rundir  = os.path.normpath(self.dirname+'_RecastRun/Runs/'+dataset.name)
+            self.logger.info("   Running 'SampleAnalyzer' over dataset '" +dataset.name+"'...")
+            if ncores > 1:
+                return rundir, jobber.RunJob(dataset, rundir, rundir+'/'+dataset.name+'.log')
+            self.logger.info("    *******************************************************")
+            result = jobber.RunJob(dataset, rundir)
+            self.logger.info("    *******************************************************")
+            return rundir, result
+
+        runs = {}
+        with ThreadPoolExecutor(max_workers=ncores) as pool:
+            for dataset in datasets:
+                jobber.WriteDatasetList(dataset)
+                if not jobber.CreateRunDir(os.path.normpath(self.dirname+'_RecastRun/Runs/'+dataset.name)):
+                    return False
+                runs[pool.submit(run, dataset)] = dataset
+            ok = True
+            for future in as_completed(runs):
+                dataset = runs[future]
+                rundir, result = future.result()
+                if not result:
+                    self.logger.error("run over '"+dataset.name+"' aborted.")
+                    if ncores > 1:
+                        self.logger.error("For more details, see the log file: "+rundir+'/'+dataset.name+'.log')
+                if not self.save_reco_events(dataset, card, rundir):
+                    ok = False
+        return ok
+
+
+    def prepare_SimplifiedFastSim(self,card,analysislist):
+        """
+        Writes and compiles the SFS job, once for all the datasets
 
         Parameters
         ----------
-        dataset : MA5 Dataset
-            one of the datasets from self.main.dataset
         card : SFS Run Card
             SFS description for the detector simulation
         analysislist : LIST of STR
@@ -311,13 +424,10 @@ class RunRecast():
 
         Returns
         -------
-        bool
-            SFS run correctly (True), there was a mistake (False)
+        JobWriter
+            writer of the compiled job, None if there was a mistake
 
         """
-        if any([(x.endswith('root')) or (x.endswith('lhco')) or (x.endswith('lhco.gz')) for x in dataset.filenames]):
-            self.logger.error("   Dataset can not contain reconstructed file type.")
-            return False
         # Load the analysis card
         from madanalysis.core.script_stack import ScriptStack
         ScriptStack.AddScript(card)
@@ -343,24 +453,22 @@ class RunRecast():
         # Writing process
         self.logger.info("   Creating folder '"+self.dirname.split('/')[-1]  + "'...")
         if not jobber.Open():
-            return False
+            return None
         self.logger.info("   Copying 'SampleAnalyzer' source files...")
         if not jobber.CopyLHEAnalysis():
-            return False
+            return None
         if not jobber.CreateBldDir(analysisName="SFSRun",outputName="SFSRun.saf"):
-            return False
+            return None
         if not jobber.WriteSelectionHeader(self.main):
-            return False
+            return None
         os.remove(self.dirname+'_SFSRun/Build/SampleAnalyzer/User/Analyzer/user.h')
         if not jobber.WriteSelectionSource(self.main):
-            return False
+            return None
         os.remove(self.dirname+'_SFSRun/Build/SampleAnalyzer/User/Analyzer/user.cpp')
         #######
-        self.logger.info("   Writing the list of datasets...")
-        jobber.WriteDatasetList(dataset)
         self.logger.info("   Creating Makefiles...")
         if not jobber.WriteMakefiles():
-            return False
+            return None
         # Copying the analysis files
         analysisList = open(self.dirname+'_SFSRun/Build/SampleAnalyzer/User/Analyzer/analysisList.h','w')
         for ana in analysislist:
@@ -386,7 +494,7 @@ class RunRecast():
             self.logger.debug(str(err))
             self.logger.error('Cannot copy the analysis: '+ana)
             self.logger.error('Please make sure that corresponding analysis downloaded propoerly.')
-            return False
+            return None
         analysisList.write('}\n')
         analysisList.close()
 
@@ -439,15 +547,48 @@ class RunRecast():
         #restore
         self.main.recasting.status = "on"
         self.main.fastsim.package  = old_fastsim
-        # Creating executable
+        # Creating executable (unless built previously from the same sources)
+        fingerprint = jobber.BuildFingerprint()
+        if jobber.RestoreExecutable(fingerprint):
+            self.logger.info("   Using the 'SampleAnalyzer' executable compiled in a previous run")
+            return jobber
         self.logger.info("   Compiling 'SampleAnalyzer'...")
         if not jobber.CompileJob():
             self.logger.error("job submission aborted.")
-            return False
+            return None
         self.logger.info("   Linking 'SampleAnalyzer'...")
         if not jobber.LinkJob():
             self.logger.error("job submission aborted.")
+            return None
+        jobber.StoreExecutable(fingerprint)
+        return jobber
+
+
+    def run_SimplifiedFastSim(self,dataset,card,analysislist,jobber):
+        """
+
+        Parameters
+        ----------
+        dataset : MA5 Dataset
+            one of the datasets from self.main.dataset
+        card : SFS Run Card
+            SFS description for the detector simulation
+        analysislist : LIST of STR
+            list of analysis names
+        jobber : JobWriter
+            writer of the compiled SFS job (see prepare_SimplifiedFastSim)
+
+        Returns
+        -------
+        bool
+            SFS run correctly (True), there was a mistake (False)
+
+        """
+        if any([(x.endswith('root')) or (x.endswith('lhco')) or (x.endswith('lhco.gz')) for x in dataset.filenames]):
+            self.logger.error("   Dataset can not contain reconstructed file type.")
             return False
+        self.logger.info("   Writing the list of datasets...")
+        jobber.WriteDatasetList(dataset)
         # Running
         self.logger.info("   Running 'SampleAnalyzer' over dataset '" +dataset.name+"'...")
         self.logger.info("    *******************************************************")
@@ -496,17 +637,10 @@ class RunRecast():
                     card.split('/')[-1].replace('ma5','') + self.TACO_output.split('.')[-1]
                 shutil.move(self.dirname+'_SFSRun/Output/'+self.TACO_output,self.dirname+'/Output/SAF/'+dataset.name+'/'+filename)
 
-        if not self.main.developer_mode:
-            # Remove the analysis folder
-            if not FolderWriter.RemoveDirectory(os.path.normpath(self.dirname+'_SFSRun')):
-                self.logger.error("Cannot remove directory: "+self.dirname+'_SFSRun')
-        else:
-            self.logger.debug("Analysis kept in "+self.dirname+'_SFSRun folder.')
+        return self.append_manifest(dataset.name, card.split('/')[-1], None, analysislist)
 
-        return True
 
-
-    def generate_events(self,dataset,card):
+    def generate_events(self,datasets,card):
         # Preparing the run
         self.main.recasting.status="off"
         self.main.fastsim.package=self.detector
@@ -519,24 +653,32 @@ class RunRecast():
             self.main.fastsim.delphesMA5tune = 0
             self.main.fastsim.delphes        = DelphesConfiguration()
             self.main.fastsim.delphes.card   = os.path.normpath("../../../../tools/PAD/Input/Cards/"+card)
-        # Execution
-        if not self.run_delphes(dataset,card):
-            self.logger.error('The '+self.detector+' problem with the running of the fastsim')
-            return False
+        # Compilation
+        jobber = self.prepare_delphes(card)
         # Restoring the run
         self.main.recasting.status="on"
         self.main.fastsim.package="none"
-        ## Saving the output
+        # Execution
+        if not jobber or not self.run_delphes(jobber,datasets,card):
+            self.logger.error('The '+self.detector+' problem with the running of the fastsim')
+            return False
+        ## Exit
+        return True
+
+    def save_reco_events(self,dataset,card,rundir):
+        """ Moves the reconstructed events of a dataset to its output folder """
         if not os.path.isdir(self.dirname+'/Output/SAF/'+dataset.name):
             os.mkdir(self.dirname+'/Output/SAF/'+dataset.name)
         if not os.path.isdir(self.dirname+'/Output/SAF/'+dataset.name+'/RecoEvents'):
             os.mkdir(self.dirname+'/Output/SAF/'+dataset.name+'/RecoEvents')
-        if self.detector=="delphesMA5tune":
-            shutil.move(self.dirname+'_RecastRun/Output/SAF/_'+dataset.name+'/RecoEvents0_0/DelphesMA5tuneEvents.root',\
-                self.dirname+'/Output/SAF/'+dataset.name+'/RecoEvents/RecoEvents_v1x1_'+card.replace('.tcl','')+'.root')
-        elif self.detector=="delphes":
-            shutil.move(self.dirname+'_RecastRun/Output/SAF/_'+dataset.name+'/RecoEvents0_0/DelphesEvents.root',\
-                self.dirname+'/Output/SAF/'+dataset.name+'/RecoEvents/RecoEvents_v1x2_'+card.replace('.tcl','')+'.root')
+        events = 'DelphesMA5tuneEvents.root' if self.detector=="delphesMA5tune" else 'DelphesEvents.root'
+        try:
+            shutil.move(rundir+'/Output/SAF/_'+dataset.name+'/RecoEvents0_0/'+events,
+                        self.reco_events_file(dataset, card))
+        except Exception as err:
+            self.logger.debug(str(err))
+            self.logger.error('The reconstructed events of '+dataset.name+' cannot be found')
+            return False
         ## Exit
         return True
 
@@ -560,14 +702,23 @@ class RunRecast():
                 analyses = [ x for x in analyses if x in ana_list]
                 break
 
+        ## Building the executable, once for all the datasets
+        if version in ['v1.1', 'v1.2']:
+            with self.timed('PAD build'):
+                ok = self.update_pad_main(analyses) and self.make_pad()
+            if not ok:
+                self.main.forced=self.forced
+                return False
+        else:
+            sfs_card = self.main.archi_info.ma5dir+'/tools/PADForSFS/Input/Cards/'+card
+            with self.timed('PAD build'):
+                jobber = self.prepare_SimplifiedFastSim(sfs_card, analyses)
+            if jobber is None:
+                return False
+
         # Executing the PAD
         for myset in self.main.datasets:
             if version in ['v1.1', 'v1.2']:
-                ## Preparing the PAD
-                self.update_pad_main(analyses)
-                if not self.make_pad():
-                    self.main.forced=self.forced
-                    return False
                 ## Getting the file name corresponding to the events
                 eventfile = os.path.normpath(self.dirname + '/Output/SAF/' + myset.name + '/RecoEvents/RecoEvents_' +\
                        version.replace('.','x')+'_' + card.replace('.tcl','')+'.root')
@@ -575,32 +726,44 @@ class RunRecast():
                     self.logger.error('The file called '+eventfile+' is not found...')
                     return False
                 ## Running the PAD
-                if not self.run_pad(eventfile):
+                with self.timed('PAD run', myset.name):
+                    ok = self.run_pad(eventfile)
+                if not ok:
                     self.main.forced=self.forced
                     return False
                 ## Saving the output and cleaning
-                if not self.save_output('\"'+eventfile+'\"', myset.name, analyses, card):
+                with self.timed('output', myset.name):
+                    ok = self.save_output('\"'+eventfile+'\"', myset.name, analyses, card)
+                if not ok:
                     self.main.forced=self.forced
                     return False
                 if not self.main.recasting.store_root:
                     os.remove(eventfile)
-                else:
-                    time.sleep(1.);
             else:
                 # Run SFS
-                if not self.run_SimplifiedFastSim(myset,self.main.archi_info.ma5dir+\
-                                                  '/tools/PADForSFS/Input/Cards/'+\
-                                                  card,analyses):
+                with self.timed('PAD run', myset.name):
+                    ok = self.run_SimplifiedFastSim(myset,sfs_card,analyses,jobber)
+                if not ok:
                     return False
                 if self.main.recasting.store_root:
                     self.logger.warning("Simplified-FastSim does not use root, hence file will not be stored.")
 
             ## Running the CLs exclusion script (if available)
             self.logger.debug('Compute CLs exclusion for '+myset.name)
-            if self.ntoys>0 and not self.compute_cls(analyses,myset):
+            with self.timed('CLs', myset.name):
+                ok = self.ntoys<=0 or self.compute_cls(analyses,myset)
+            if not ok:
                 self.main.forced=self.forced
                 return False
 
+        ## Cleaning the SFS job
+        if version not in ['v1.1', 'v1.2']:
+            if not self.main.developer_mode:
+                if not FolderWriter.RemoveDirectory(os.path.normpath(self.dirname+'_SFSRun')):
+                    self.logger.error("Cannot remove directory: "+self.dirname+'_SFSRun')
+            else:
+                self.logger.debug("Analysis kept in "+self.dirname+'_SFSRun folder.')
+
         # Exit
         return True
 
@@ -619,7 +782,7 @@ class RunRecast():
         if not os.path.isfile(self.pad+'/Build/Main/main.bak'):
             shutil.copy(self.pad+'/Build/Main/main.cpp',self.pad+'/Build/Main/main.bak')
         mainfile     = open(self.pad+"/Build/Main/main.bak",'r')
-        newfile      = open(self.dirname+"_RecastRun/Build/Main/main.cpp",'w')
+        newfile      = open(self.dirname+"_RecastRun/Build/Main/main.cpp.tmp",'w')
         # Clean the analyzer folder
         if not FolderWriter.RemoveDirectory(os.path.normpath(self.dirname+'_RecastRun/Build/SampleAnalyzer/User/Analyzer')):
             return False
@@ -679,11 +842,24 @@ class RunRecast():
 
         ## exit
         mainfile.close()
+        newfile.flush()
+        os.fsync(newfile.fileno())
         newfile.close()
-        time.sleep(1.);
+        os.rename(self.dirname+"_RecastRun/Build/Main/main.cpp.tmp",self.dirname+"_RecastRun/Build/Main/main.cpp")
         return True
 
     def make_pad(self):
+        # Executable already built from the same sources
+        jobber      = JobWriter(self.main,self.dirname+'_RecastRun')
+        fingerprint = jobber.BuildFingerprint()
+        if jobber.RestoreExecutable(fingerprint):
+            self.logger.info('   Using the PAD executable compiled in a previous run');
+            return True
+        # Analyses compiled in a previous run: only the other ones are compiled
+        objects   = jobber.ObjectFingerprints()
+        nrestored = jobber.RestoreObjects(objects)
+        if nrestored!=0:
+            self.logger.debug('   '+str(nrestored)+' PAD object(s) compiled in a previous run reused')
         # Initializing the compiler
         self.logger.info('   Compiling the PAD located in '  +self.dirname+'_RecastRun');
         compiler = LibraryWriter('lib',self.main)
@@ -696,21 +872,23 @@ class RunRecast():
             command.append(strcores)
         logfile = self.dirname+'_RecastRun/Build/Log/PADcompilation.log'
         result, out = ShellCommand.ExecuteWithLog(command,logfile,self.dirname+'_RecastRun/Build')
-        time.sleep(1.);
         # Checks and exit
-        if not result:
+        if not result or not self.wait_for_file(self.dirname+'_RecastRun/Build/MadAnalysis5job'):
             self.logger.error('Impossible to compile the PAD. For more details, see the log file:')
             self.logger.error(logfile)
             return False
+        jobber.StoreObjects(objects)
+        jobber.StoreExecutable(fingerprint)
         return True
 
     def run_pad(self,eventfile):
         ## input file
-        if os.path.isfile(self.dirname+'_RecastRun/Input/PADevents.list'):
-            os.remove(self.dirname+'_RecastRun/Input/PADevents.list')
-        infile = open(self.dirname+'_RecastRun/Input/PADevents.list','w')
+        infile = open(self.dirname+'_RecastRun/Input/PADevents.list.tmp','w')
         infile.write(eventfile)
+        infile.flush()
+        os.fsync(infile.fileno())
         infile.close()
+        os.rename(self.dirname+'_RecastRun/Input/PADevents.list.tmp',self.dirname+'_RecastRun/Input/PADevents.list')
         ## cleaning the output directory
         if os.path.isdir(os.path.normpath(self.dirname+'_RecastRun/Output/SAF/PADevents')):
             if not FolderWriter.RemoveDirectory(os.path.normpath(self.dirname+'_RecastRun/Output/SAF/PADevents')):
@@ -719,47 +897,98 @@ class RunRecast():
         command = ['./MadAnalysis5job', '../Input/PADevents.list']
         ok = ShellCommand.Execute(command,self.dirname+'_RecastRun/Build')
         ## checks
-        if not ok:
+        if not ok or not self.wait_for_file(self.dirname+'_RecastRun/Output/SAF/PADevents/PADevents.saf'):
             self.logger.error('Problem with the run of the PAD on the file: '+ eventfile)
             return False
         os.remove(self.dirname+'_RecastRun/Input/PADevents.list')
-        ## exit
-        time.sleep(1.);
         return True
 
     def save_output(self, eventfile, setname, analyses, card):
         outfile = self.dirname+'/Output/SAF/'+setname+'/'+setname+'.saf'
+        # The event files of the other cards are added to the <FileInfo> block
+        # by write_file_info, once all the cards have been run
         if not os.path.isfile(outfile):
             shutil.move(self.dirname+'_RecastRun/Output/SAF/PADevents/PADevents.saf',outfile)
-        else:
-            inp = open(outfile, 'r')
-            out = open(outfile+'.2', 'w')
-            intag  = False
-            stack  = []
-            maxl   = len(eventfile)
-            for line in inp:
-                if '<FileInfo>' in line:
-                    out.write(line)
-                    intag = True
-                elif '</FileInfo>' in line:
-                    for i in range(len(stack)):
-                        out.write(stack[i].ljust(maxl)+ ' # file ' + str(i+1) + '/' + str(len(stack)+1) + '\n')
-                    out.write(eventfile.ljust(maxl)+' # file ' + str(len(stack)+1)+'/'+str(len(stack)+1)+'\n')
-                    out.write(line)
-                    intag = False
-                elif intag:
-                    stack.append(line.strip().split('#')[0])
-                    maxl = max(maxl,len(line.strip().split('#')[0]))
-                else:
-                    out.write(line)
-            inp.close()
-            out.close()
-            shutil.move(outfile+'.2', outfile)
         for analysis in analyses:
             shutil.move(self.dirname+'_RecastRun/Output/SAF/PADevents/'+analysis+'_0',self.dirname+'/Output/SAF/'+setname+'/'+analysis)
         if self.TACO_output!='':
             filename  = '.'.join(self.TACO_output.split('.')[:-1]) + '_' + card.replace('tcl','') + self.TACO_output.split('.')[-1]
             shutil.move(self.dirname+'_RecastRun/Output/'+self.TACO_output,self.dirname+'/Output/SAF/'+setname+'/'+filename)
+        return self.append_manifest(setname, card, eventfile, analyses)
+
+    ################################################
+    ### RECAST OUTPUT MANIFEST
+    ################################################
+
+    def manifest_file(self, setname):
+        return os.path.normpath(self.dirname+'/Output/SAF/'+setname+'/'+setname+'.manifest')
+
+    def append_manifest(self, setname, card, eventfile, analyses):
+        """
+        Records the run of the analyses of a card on a dataset in the manifest
+        of the dataset (one JSON entry per line: card, event file and analysis
+        folders). Each entry is appended with a single write.
+        """
+        entry = json.dumps(OrderedDict([('card', card), ('eventfile', eventfile),
+                                        ('analyses', list(analyses))]))+'\n'
+        try:
+            fd = os.open(self.manifest_file(setname), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, entry.encode())
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except Exception as err:
+            self.logger.error('Impossible to update the manifest of the dataset '+setname)
+            self.logger.debug(str(err))
+            return False
+        return True
+
+    def read_manifest(self, setname):
+        """ Entries of the manifest of a dataset, in the order of the runs """
+        entries = []
+        if not os.path.isfile(self.manifest_file(setname)):
+            return entries
+        with open(self.manifest_file(setname), 'r') as manifest:
+            for line in manifest:
+                if line.strip()!='':
+                    entries.append(json.loads(line))
+        return entries
+
+    def write_file_info(self, setname):
+        """
+        Adds the event files of all the cards recorded in the manifest of a
+        dataset to the <FileInfo> block of its SAF file, in a single rewrite.
+        """
+        outfile = self.dirname+'/Output/SAF/'+setname+'/'+setname+'.saf'
+        if not os.path.isfile(outfile):
+            return True
+        try:
+            eventfiles = [x['eventfile'] for x in self.read_manifest(setname) if x['eventfile']]
+        except Exception as err:
+            self.logger.error('Impossible to read the manifest of the dataset '+setname)
+            self.logger.debug(str(err))
+            return False
+        with open(outfile, 'r') as inp:
+            lines = inp.readlines()
+        begin = [i for i, line in enumerate(lines) if '<FileInfo>'  in line]
+        end   = [i for i, line in enumerate(lines) if '</FileInfo>' in line]
+        if len(begin)==0 or len(end)==0:
+            return True
+        stack = [line.strip().split('#')[0].strip() for line in lines[begin[0]+1:end[0]]]
+        stack = [x for x in stack if x!='']
+        new   = [x for x in eventfiles if x not in stack]
+        if len(new)==0:
+            return True
+        stack += new
+        maxl   = max(len(x) for x in stack)
+        out = open(outfile+'.2', 'w')
+        out.writelines(lines[:begin[0]+1])
+        for i in range(len(stack)):
+            out.write(stack[i].ljust(maxl)+ ' # file ' + str(i+1) + '/' + str(len(stack)) + '\n')
+        out.writelines(lines[end[0]:])
+        out.close()
+        shutil.move(outfile+'.2', outfile)
         return True
 
     ################################################
@@ -771,6 +1000,7 @@ class RunRecast():
         ET =  self.check_xml_scipy_methods()
         if not ET:
             return False
+        self.etree = ET
 
         self.SetCLsCalculator()
         print_gl_citation = self.main.recasting.global_likelihoods_switch or (self.main.recasting.CLs_calculator_backend == "pyhf")
@@ -780,9 +1010,34 @@ class RunRecast():
             self.logger.info("\033[1m   * Using Uncertainties and Higher-Luminosity Estimates\033[0m")
             self.logger.info("\033[1m     Please cite arXiv:1910.11418 [hep-ph]\033[0m")
 
-
-        ## Running over all luminosities to extrapolate
-        for extrapolated_lumi in ['default']+self.main.recasting.extrapolated_luminosities:
+        ## Uncertainties on the rates
+        Error_dict = self.rate_uncertainties(dataset)
+        xsflag     = not (dataset.xsection > 0)
+
+        ## Limits and CLs for all luminosities and analyses. All these
+        ## calculations are independent and can be run in parallel.
+        luminosities = ['default']+self.main.recasting.extrapolated_luminosities
+        tasks = [ ('cls_single_analysis', (analysis, dataset.name, dataset.xsection, extrapolated_lumi))
+                  for extrapolated_lumi in luminosities for analysis in analyses ]
+        results = self.run_cls_tasks(tasks)
+
+        ## Computation of the uncertainties on the limits (one task per variation)
+        variations = []
+        if dataset.xsection > 0. and any([x!=0 for x in Error_dict.values()]):
+            for itask, result in enumerate(results):
+                if result is None:
+                    continue
+                for error_key, error_value in Error_dict.items():
+                    varied_xsec = max(round(dataset.xsection*(1.0+error_value),10),0.0)
+                    if varied_xsec > 0 and error_value!=0.0:
+                        variations.append((itask, error_key))
+                        tasks.append(('cls_variation', (result, varied_xsec)))
+        varied_results = self.run_cls_tasks(tasks[len(results):], stream=1)
+        for (itask, error_key), varied in zip(variations, varied_results):
+            results[itask]['errors'][error_key] = varied
+
+        ## Writing the output files, in the order of the serial calculation
+        for extrapolated_lumi in luminosities:
             self.logger.info('   Calculation of the exclusion CLs for a lumi of ' +
                              str(extrapolated_lumi))
             ## Preparing the output file and checking whether a cross section has been defined
@@ -798,15 +1053,12 @@ class RunRecast():
 
             ## running over all analysis
             for analysis in analyses:
-                self.logger.debug('Running CLs exclusion calculation for '+analysis)
-                # Getting the info file information (possibly rescaled)
-                lumi, regions, regiondata = self.parse_info_file(ET,analysis,extrapolated_lumi)
-                self.logger.debug('lumi = ' + str(lumi));
-                self.logger.debug('regions = ' + str(regions));
-                self.logger.debug('regiondata = ' + str(regiondata));
-                if lumi==-1 or regions==-1 or regiondata==-1:
-                    self.logger.warning('Info file for '+analysis+' missing or corrupted. Skipping the CLs calculation.')
+                result = results.pop(0)
+                if result is None:
+                    mysummary.close()
                     return False
+                self.cov_config  = result['cov_config']
+                self.pyhf_config = result['pyhf_config']
 
                 # Citation notifications for Global Likelihoods
                 if (self.cov_config != {} or self.pyhf_config!={}) and print_gl_citation:
@@ -831,77 +1083,20 @@ class RunRecast():
                     self.logger.info("\033[1m     For more details see https://scikit-hep.org/pyhf/\033[0m")
                     self.logger.info("\033[1m     Please cite arXiv:2206.14870 [hep-ph]\033[0m")
 
-
-            ## Reading the cutflow information
-                regiondata=self.read_cutflows(
-                    self.dirname+'/Output/SAF/'+dataset.name+'/'+analysis+'/Cutflows',
-                    regions, regiondata
-                )
-                if regiondata==-1:
-                    self.logger.warning('Info file for '+analysis+' corrupted. Skipping the CLs calculation.')
-                    return False
-
-                ## Performing the CLS calculation
-                regiondata=self.extract_sig_cls(regiondata,regions,lumi,"exp")
-                if self.cov_config != {}:
-                    regiondata=self.extract_sig_lhcls(regiondata,lumi,"exp")
-                # CLs calculation for pyhf
-                regiondata = self.pyhf_sig95Wrapper(lumi, regiondata, "exp")
-
-                if extrapolated_lumi=='default':
-                    if self.cov_config != {}:
-                        regiondata=self.extract_sig_lhcls(regiondata,lumi,"obs")
-                    regiondata = self.extract_sig_cls(regiondata,regions,lumi,"obs")
-                    regiondata = self.pyhf_sig95Wrapper(lumi,regiondata,'obs')
-                else:
-                    for reg in regions:
-                        regiondata[reg]["nobs"]=regiondata[reg]["nb"]
-                xsflag=True
-                if dataset.xsection > 0:
-                    xsflag=False
-                    regiondata=self.extract_cls(regiondata,regions,dataset.xsection,lumi)
-
-                ## Uncertainties on the rates
-                Error_dict = {}
-                if dataset.scaleup != None:
-                    Error_dict['scale_up'] =  round(dataset.scaleup,8)
-                    Error_dict['scale_dn'] = -round(dataset.scaledn,8)
-                else:
-                    Error_dict['scale_up'], Error_dict['scale_dn'] = 0., 0.
-                if dataset.pdfup != None:
-                    Error_dict['pdf_up'] =  round(dataset.pdfup,8)
-                    Error_dict['pdf_dn'] = -round(dataset.pdfdn,8)
-                else:
-                    Error_dict['pdf_up'], Error_dict['pdf_dn'] = 0., 0.
-                if self.main.recasting.THerror_combination == 'linear':
-                    Error_dict['TH_up'] = round(Error_dict['scale_up'] + Error_dict['pdf_up'],8)
-                    Error_dict['TH_dn'] = round(Error_dict['scale_dn'] + Error_dict['pdf_dn'],8)
-                else:
-                    Error_dict['TH_up'] =  round(math.sqrt(Error_dict['pdf_up']**2 + Error_dict['scale_up']**2),8)
-                    Error_dict['TH_dn'] = -round(math.sqrt(Error_dict['pdf_dn']**2 + Error_dict['scale_dn']**2),8)
-                for i in range(0,len(self.main.recasting.systematics)):
-                    for unc in self.main.recasting.systematics:
-                        Error_dict['sys'+str(i)+'_up'] =\
-                            round(math.sqrt(Error_dict['TH_up']**2+self.main.recasting.systematics[i][0]**2),8)
-                        Error_dict['sys'+str(i)+'_dn'] =\
-                           -round(math.sqrt(Error_dict['TH_dn']**2+self.main.recasting.systematics[i][1]**2),8)
-
-                ## Computation of the uncertainties on the limits
+                ## Variations with a vanishing shift are identical to the nominal results
                 regiondata_errors = {}
                 if dataset.xsection > 0. and any([x!=0 for x in Error_dict.values()]):
                     for error_key, error_value in Error_dict.items():
                         varied_xsec = max(round(dataset.xsection*(1.0+error_value),10),0.0)
                         if varied_xsec > 0:
-                            xsflag=False
-                            regiondata_errors[error_key] = copy.deepcopy(regiondata)
-                            if error_value!=0.0:
-                                regiondata_errors[error_key] = self.extract_cls(
-                                    regiondata_errors[error_key], regions, varied_xsec, lumi
-                                )
+                            regiondata_errors[error_key] = result['errors'].get(
+                                error_key, copy.deepcopy(result['regiondata'])
+                            )
 
                 ## writing the output file
                 self.write_cls_output(
-                    analysis, regions, regiondata, regiondata_errors, mysummary, xsflag, lumi
+                    analysis, result['regions'], result['regiondata'], regiondata_errors,
+                    mysummary, xsflag, result['lumi']
                 )
                 mysummary.write('\n')
 
@@ -909,6 +1104,138 @@ class RunRecast():
             mysummary.close()
         return True
 
+    def rate_uncertainties(self, dataset):
+        """ Relative theory and systematic uncertainties on the signal rate """
+        Error_dict = {}
+        if dataset.scaleup != None:
+            Error_dict['scale_up'] =  round(dataset.scaleup,8)
+            Error_dict['scale_dn'] = -round(dataset.scaledn,8)
+        else:
+            Error_dict['scale_up'], Error_dict['scale_dn'] = 0., 0.
+        if dataset.pdfup != None:
+            Error_dict['pdf_up'] =  round(dataset.pdfup,8)
+            Error_dict['pdf_dn'] = -round(dataset.pdfdn,8)
+        else:
+            Error_dict['pdf_up'], Error_dict['pdf_dn'] = 0., 0.
+        if self.main.recasting.THerror_combination == 'linear':
+            Error_dict['TH_up'] = round(Error_dict['scale_up'] + Error_dict['pdf_up'],8)
+            Error_dict['TH_dn'] = round(Error_dict['scale_dn'] + Error_dict['pdf_dn'],8)
+        else:
+            Error_dict['TH_up'] =  round(math.sqrt(Error_dict['pdf_up']**2 + Error_dict['scale_up']**2),8)
+            Error_dict['TH_dn'] = -round(math.sqrt(Error_dict['pdf_dn']**2 + Error_dict['scale_dn']**2),8)
+        for i in range(0,len(self.main.recasting.systematics)):
+            Error_dict['sys'+str(i)+'_up'] =\
+                round(math.sqrt(Error_dict['TH_up']**2+self.main.recasting.systematics[i][0]**2),8)
+            Error_dict['sys'+str(i)+'_dn'] =\
+               -round(math.sqrt(Error_dict['TH_dn']**2+self.main.recasting.systematics[i][1]**2),8)
+        return Error_dict
+
+    def run_cls_tasks(self, tasks, stream=0):
+        """
+        Runs a list of (method name, arguments) CLs tasks, in a pool of
+        recasting.CLs_ncores processes if requested. The results are returned
+        in the order of the tasks.
+
+        With the toy calculator, each task gets its own random number generator,
+        seeded from the global random seed, the stream number and the index of
+        the task. The results therefore neither depend on the number of cores
+        nor on the order in which the tasks are run.
+        """
+        seeds = np.random.SeedSequence(self.main.random_seed, spawn_key=(stream,)).spawn(len(tasks))
+        tasks = [ (method, args, seed) for (method, args), seed in zip(tasks, seeds) ]
+        ncores = min(self.main.recasting.CLs_ncores, len(tasks))
+        if ncores <= 1:
+            calculator = self.cls_calculator
+            try:
+                return [self.run_cls_task(*task) for task in tasks]
+            finally:
+                self.cls_calculator = calculator
+        # The workers are forked from the current process and inherit this object
+        global _cls_runner
+        _cls_runner = self
+        import multiprocessing
+        self.logger.debug('Running ' + str(len(tasks)) + ' CLs tasks on ' + str(ncores) + ' cores')
+        pool = multiprocessing.get_context('fork').Pool(ncores, initializer=_init_cls_worker)
+        try:
+            results = pool.map(_run_cls_task, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            _cls_runner = None
+        for _, records in results:
+            self.main.profiler.Add(records)
+        return [result for result, _ in results]
+
+    def run_cls_task(self, method, args, seed):
+        """
+        Runs a single CLs task, with a fresh toy calculator seeded by seed.
+        """
+        if isinstance(self.cls_calculator, ToyCLs):
+            self.cls_calculator = ToyCLs(
+                seed                  = seed,
+                common_random_numbers = self.cls_calculator.common_random_numbers,
+                max_regions           = self.cls_calculator.max_regions
+            )
+        with self.timed('CLs task'):
+            return getattr(self, method)(*args)
+
+    def cls_single_analysis(self, analysis, setname, xsection, extrapolated_lumi):
+        """
+        Limits (and CLs if the signal cross section is known) for one analysis
+        and one luminosity. Returns None if the calculation cannot be made.
+        """
+        self.logger.debug('Running CLs exclusion calculation for '+analysis)
+        # Getting the info file information (possibly rescaled)
+        lumi, regions, regiondata = self.parse_info_file(self.etree,analysis,extrapolated_lumi)
+        self.logger.debug('lumi = ' + str(lumi));
+        self.logger.debug('regions = ' + str(regions));
+        self.logger.debug('regiondata = ' + str(regiondata));
+        if lumi==-1 or regions==-1 or regiondata==-1:
+            self.logger.warning('Info file for '+analysis+' missing or corrupted. Skipping the CLs calculation.')
+            return None
+
+        ## Reading the cutflow information
+        regiondata=self.read_cutflows(
+            self.dirname+'/Output/SAF/'+setname+'/'+analysis+'/Cutflows',
+            regions, regiondata
+        )
+        if regiondata==-1:
+            self.logger.warning('Info file for '+analysis+' corrupted. Skipping the CLs calculation.')
+            return None
+
+        ## Performing the CLS calculation
+        regiondata=self.extract_sig_cls(regiondata,regions,lumi,"exp")
+        if self.cov_config != {}:
+            regiondata=self.extract_sig_lhcls(regiondata,lumi,"exp")
+        # CLs calculation for pyhf
+        regiondata = self.pyhf_sig95Wrapper(lumi, regiondata, "exp")
+
+        if extrapolated_lumi=='default':
+            if self.cov_config != {}:
+                regiondata=self.extract_sig_lhcls(regiondata,lumi,"obs")
+            regiondata = self.extract_sig_cls(regiondata,regions,lumi,"obs")
+            regiondata = self.pyhf_sig95Wrapper(lumi,regiondata,'obs')
+        else:
+            for reg in regions:
+                regiondata[reg]["nobs"]=regiondata[reg]["nb"]
+        if xsection > 0:
+            regiondata=self.extract_cls(regiondata,regions,xsection,lumi)
+
+        return { 'lumi'        : lumi,
+                 'regions'     : regions,
+                 'regiondata'  : regiondata,
+                 'cov_config'  : self.cov_config,
+                 'pyhf_config' : self.pyhf_config,
+                 'errors'      : {} }
+
+    def cls_variation(self, result, varied_xsec):
+        """ CLs for a varied signal cross section, from the results of cls_single_analysis """
+        self.cov_config  = result['cov_config']
+        self.pyhf_config = result['pyhf_config']
+        return self.extract_cls(
+            copy.deepcopy(result['regiondata']), result['regions'], varied_xsec, result['lumi']
+        )
+
     def check_xml_scipy_methods(self):
         ## Checking whether scipy is installed
         if not self.main.session_info.has_scipy:
@@ -1345,8 +1672,6 @@ class RunRecast():
         for reg in regions:
             regname = clean_region_name(reg)
             ## getting the initial and final number of events
-            IsInitial = False
-            IsCounter = False
             N0 = 0.
             Nf = 0.
             ## checking if regions must be combined
@@ -1358,27 +1683,16 @@ class RunRecast():
                     self.logger.warning('Cannot find a cutflow for the region '+regiontocombine+' in ' + path)
                     self.logger.warning('Skipping the CLs calculation.')
                     return -1
-                mysaffile = open(filename)
+                ## sums of weights before the cuts and after the last cut
+                reader = SafReader(filename)
                 myN0=-1
                 myNf=-1
-                for line in mysaffile:
-                    if "<InitialCounter>" in line:
-                        IsInitial = True
-                        continue
-                    elif "</InitialCounter>" in line:
-                        IsInitial = False
-                        continue
-                    elif "<Counter>" in line:
-                        IsCounter = True
-                        continue
-                    elif "</Counter>" in line:
-                        IsCounter = False
-                        continue
-                    if IsInitial and "sum of weights" in line and not '^2' in line:
-                        myN0 = float(line.split()[0])+float(line.split()[1])
-                    if IsCounter and "sum of weights" in line and not '^2' in line:
-                        myNf = float(line.split()[0])+float(line.split()[1])
-                mysaffile.close()
+                if reader.Read():
+                    initial, counters = reader.Counters()
+                    if initial is not None:
+                        myN0 = sum(initial.sumw)
+                    if len(counters)!=0:
+                        myNf = sum(counters[-1].sumw)
                 if myNf==-1 or myN0==-1:
                     self.logger.warning('Invalid cutflow for the region ' + reg +'('+regname+') in ' + path)
                     self.logger.warning('Skipping the CLs calculation.')
@@ -1398,18 +1712,25 @@ class RunRecast():
         ## computing fi a region belongs to the best expected ones, and derive the CLs in all cases
         bestreg=[]
         rMax = -1
-        for reg in regions:
-            nsignal = xsection * lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"]
-            nb      = regiondata[reg]["nb"]
-            nobs    = regiondata[reg]["nobs"]
-            deltanb = regiondata[reg]["deltanb"]
-            if nsignal<=0:
+        nsignal  = np.array([xsection * lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"] for reg in regions])
+        positive = nsignal > 0
+        allCLs   = np.zeros(len(regions))
+        if positive.any():
+            allCLs[positive] = batch_cls(
+                self.cls_calculator,
+                np.array([regiondata[reg]["nobs"]    for reg in regions])[positive],
+                np.array([regiondata[reg]["nb"]      for reg in regions])[positive],
+                np.array([regiondata[reg]["deltanb"] for reg in regions])[positive],
+                nsignal[positive], self.ntoys, CLs_obs = True
+            )
+        for ireg, reg in enumerate(regions):
+            if nsignal[ireg]<=0:
                 rSR   = -1
                 myCLs = 0
             else:
                 n95     = float(regiondata[reg]["s95exp"]) * lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"]
-                rSR     = nsignal/n95
-                myCLs   = self.cls_calculator(nobs, nb, deltanb, nsignal, self.ntoys, CLs_obs = True)
+                rSR     = float(nsignal[ireg]/n95)
+                myCLs   = float(allCLs[ireg])
             regiondata[reg]["rSR"] = rSR
             regiondata[reg]["CLs"] = myCLs
             if rSR > rMax:
@@ -1429,7 +1750,11 @@ class RunRecast():
                 if all(s <= 0. for s in [regiondata[reg]["Nf"] for reg in cov_regions]):
                     regiondata["cov_subset"][cov_subset]["CLs"]= 0.
                     continue
-                CLs = self.slhCLs(regiondata,cov_regions,xsection,lumi,covariance, ntoys = self.ntoys)
+                try:
+                    CLs = self.slh_session(regiondata,cov_regions,lumi,covariance).cls(xsection)
+                except Exception as err:
+                    self.logger.debug("slhCLs : " + str(err))
+                    CLs = 0.0
                 s95 = float(regiondata["cov_subset"][cov_subset]["s95exp"])
                 regiondata["cov_subset"][cov_subset]["CLs"] = CLs
                 if 0. < s95 < minsig95:
@@ -1451,7 +1776,7 @@ class RunRecast():
                 continue
             background = HF_Background(config)
             self.logger.debug('current pyhf Configuration = '+str(config))
-            signal = HF_Signal(config,regiondata,xsection=xsection)
+            signal = HF_Signal(config,regiondata,xsection=1.)
             is_not_extrapolated = signal.lumi == lumi
             CLs    = -1
             if signal.isAlive():
@@ -1460,7 +1785,8 @@ class RunRecast():
                 if self.main.developer_mode:
                     setattr(self, "hf_sig_test", sig_HF)
                     setattr(self, "hf_bkg_test", bkg_HF)
-                CLs = pyhf_wrapper(bkg_HF, sig_HF)
+                CLs = pyhf_wrapper(bkg_HF, sig_HF, poi_test=xsection,
+                                   cache_key=pyhf_model_key(background, sig_HF, lumi))
                 # Take observed if default lumi used, use expected if extrapolated
                 CLs_out = CLs['CLs_obs'] if is_not_extrapolated else CLs['CLs_exp'][2]
                 regiondata['pyhf'][likelihood_profile]['full_CLs_output'] = CLs
@@ -1504,48 +1830,99 @@ class RunRecast():
             return 0.0
 
 
+    def slh_session(self, regiondata, cov_regions, lumi, covariance, expected=False):
+        """
+        Simplified likelihood of a set of regions, for a signal cross section of
+        1 pb. The sessions are kept for the subsequent calculations with the
+        same yields (expected and observed limits, CLs and its variations).
+        Returns None if the regions do not contain any signal event.
+        """
+        observed    = [regiondata[reg]["nobs"] for reg in cov_regions]
+        backgrounds = [regiondata[reg]["nb"]   for reg in cov_regions]
+        nsignal     = [lumi*1000.*regiondata[reg]["Nf"]/regiondata[reg]["N0"] for reg in cov_regions]
+        key = (tuple(observed), tuple(backgrounds), tuple(nsignal), repr(covariance), expected, self.ntoys)
+        if key in self.slh_sessions:
+            self.slh_sessions.move_to_end(key)
+            return self.slh_sessions[key]
+        from madanalysis.misc.simplified_likelihood import Data, SimplifiedLikelihood
+        LHdata  = Data(observed, backgrounds, covariance, None, nsignal)
+        session = None
+        if not LHdata.zeroSignal():
+            session = SimplifiedLikelihood(LHdata, ntoys=self.ntoys, expected=expected)
+        self.slh_sessions[key] = session
+        while len(self.slh_sessions) > 16:
+            self.slh_sessions.popitem(last=False)
+        return session
+
     def extract_sig_cls(self,regiondata,regions,lumi,tag):
         self.logger.debug('Compute signal CL...')
+        ## Regions without any signal event cannot be constrained
+        active = []
         for reg in regions:
-            nb = regiondata[reg]["nb"]
-            nobs = regiondata[reg]["nobs"]
-            if tag == "exp" and self.is_apriori:
-                nobs = regiondata[reg]["nb"]
-            deltanb = regiondata[reg]["deltanb"]
-
-            def sig95(xsection):
-                if regiondata[reg]["Nf"]<=0.:
-                    return 0
-                nsignal=xsection * lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"]
-                return self.cls_calculator(
-                    nobs, nb, deltanb, nsignal, self.ntoys, **{"CLs_"+tag : True}
-                ) - 0.95
-
-            nslow = lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"]
-            nshig = lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"]
-
-            if nslow <= 0 and nshig <= 0:
+            if lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"] <= 0:
                 regiondata[reg]["s95"+tag]="-1"
-                continue
-
-            low,hig = 1., 1.
-            while self.cls_calculator(nobs,nb,deltanb,nslow,self.ntoys, **{"CLs_"+tag : True})>0.95:
-                self.logger.debug('region ' + reg + ', lower bound = ' + str(low))
-                nslow*=0.1; low  *=0.1
-            while self.cls_calculator(nobs,nb,deltanb,nshig,self.ntoys, **{"CLs_"+tag : True})<0.95:
-                self.logger.debug('region ' + reg + ', upper bound = ' + str(hig))
-                nshig*=10.; hig  *=10.
+            else:
+                active.append(reg)
+        if len(active) == 0:
+            return regiondata
 
+        ## Region yields, as arrays
+        nb      = np.array([regiondata[reg]["nb"]      for reg in active])
+        nobs    = np.array([regiondata[reg]["nobs"]    for reg in active])
+        deltanb = np.array([regiondata[reg]["deltanb"] for reg in active])
+        if tag == "exp" and self.is_apriori:
+            nobs = nb
+        nsig_1pb = np.array([lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"] for reg in active])
+
+        ## The limits are computed on the number of signal events. They do not
+        ## depend on the signal efficiencies and are taken from the cache if
+        ## the same region yields have already been processed. The toy limits
+        ## are only cached if their random numbers are reproducible, the seed
+        ## of the toys of the current CLs task being part of the key.
+        n95    = np.full(len(active), -1.)
+        keys   = [None] * len(active)
+        cached = {}
+        toys   = 'deterministic'
+        if isinstance(self.cls_calculator, ToyCLs):
+            toys = self.cls_calculator.cache_id()
+        if self.s95_cache is not None and toys is not None:
+            keys   = [self.s95_cache.key(*x, tag=(tag, toys)) for x in zip(nobs, nb, deltanb)]
+            cached = self.s95_cache.get(keys)
+        todo = []
+        for i in range(len(active)):
+            if keys[i] in cached:
+                n95[i] = cached[keys[i]]
+            else:
+                todo.append(i)
+        todo = np.array(todo, dtype=int)
+
+        def sig95(nevents, index):
+            return batch_cls(
+                self.cls_calculator, nobs[index], nb[index], deltanb[index],
+                nevents, self.ntoys, **{"CLs_"+tag : True}
+            ) - 0.95
+
+        ## All the regions are solved at once (by blocks of regions whose toys
+        ## can be kept in memory for the native calculator)
+        block = max(getattr(self.cls_calculator, 'max_regions', len(todo)), 1)
+        for start in range(0, len(todo), block):
+            index = todo[start:start+block]
             try:
-                import scipy
-                s95 = scipy.optimize.brentq(sig95,low,hig,xtol=low/100.)
-            except ImportError as err:
-                self.logger.debug("Can't import scipy"); s95=-1
+                n95[index] = batch_s95(
+                    lambda x, i: sig95(x, index[i]), len(index),
+                    guess = expected_limit(nobs[index], nb[index], deltanb[index]),
+                    rtol  = self.main.recasting.CLs_s95_tolerance
+                )
             except Exception as err:
-                self.logger.debug(str(err)); s95=-1
+                self.logger.debug(str(err))
+        if self.s95_cache is not None and toys is not None:
+            self.s95_cache.put(dict([(keys[i], n95[i]) for i in todo if n95[i] > 0.]))
 
-            self.logger.debug('region ' + reg + ', s95 = ' + str(s95) + ' pb')
-            regiondata[reg]["s95"+tag] = ("%-20.7f" % s95)
+        s95 = np.where(n95 > 0., n95 / nsig_1pb, -1.)
+
+        for reg, value in zip(active, s95):
+            self.logger.debug('region ' + reg + ', s95 = ' + str(value) + ' pb')
+            regiondata[reg]["s95"+tag] = ("%-20.7f" % value)
 
         return regiondata
 
@@ -1567,11 +1944,6 @@ class RunRecast():
         if "cov_subset" not in regiondata.keys():
             regiondata["cov_subset"] = {}
 
-        def get_s95(regs, matrix):
-            def sig95(xsection):
-                return self.slhCLs(regiondata,regs,xsection,lumi,matrix,(tag=="exp"), ntoys = self.ntoys)-0.95
-            return sig95
-
         for cov_subset in self.cov_config.keys():
             cov_regions = self.cov_config[cov_subset]["cov_regions"]
             covariance  = self.cov_config[cov_subset]["covariance" ]
@@ -1581,23 +1953,10 @@ class RunRecast():
                 regiondata["cov_subset"][cov_subset]["s95"+tag]= "-1"
                 continue
 
-            low, hig = 1., 1.
-            while self.slhCLs(regiondata,cov_regions,low,lumi,covariance,(tag=="exp"), ntoys = self.ntoys)>0.95:
-                self.logger.debug('lower bound = ' + str(low))
-                low *= 0.1
-                if low < 1e-10: break
-            while self.slhCLs(regiondata,cov_regions,hig,lumi,covariance,(tag=="exp"), ntoys = self.ntoys)<0.95:
-                self.logger.debug('upper bound = ' + str(hig))
-                hig *= 10.
-                if hig > 1e10: break
-
             try:
-                import scipy
-                sig95 = get_s95(cov_regions, covariance)
-                s95 = scipy.optimize.brentq(sig95,low,hig,xtol=low/100.)
-            except ImportError as err:
-                self.logger.debug("Can't import scipy")
-                s95=-1
+                session = self.slh_session(regiondata, cov_regions, lumi, covariance, (tag=="exp"))
+                s95 = session.s95(guess = self.s95_guess(regiondata, cov_regions, lumi, tag),
+                                  rtol  = self.main.recasting.CLs_s95_tolerance)
             except Exception as err:
                 self.logger.debug(str(err))
                 s95=-1
@@ -1608,22 +1967,36 @@ class RunRecast():
         return regiondata
 
 
+    def s95_guess(self, regiondata, regions, lumi, tag):
+        """
+        Estimate of the cross-section limit of a combination of regions, from
+        the Gaussian limit of its most sensitive region. It seeds the root
+        finding of the exact limit. If no region has any signal event, 1 pb.
+        """
+        guess = []
+        for reg in regions:
+            nsig = lumi * 1000. * regiondata[reg]["Nf"] / regiondata[reg]["N0"]
+            if nsig > 0.:
+                nobs = regiondata[reg]["nb"] if tag == "exp" else regiondata[reg]["nobs"]
+                guess.append(float(expected_limit(nobs, regiondata[reg]["nb"],
+                                                  regiondata[reg]["deltanb"])) / nsig)
+        return min(guess) if len(guess) > 0 else 1.
+
     def pyhf_sig95Wrapper(self, lumi, regiondata, tag):
         if self.pyhf_config == {}:
             return regiondata
         if 'pyhf' not in list(regiondata.keys()):
             regiondata['pyhf'] = {}
 
-        def get_pyhf_result(*args):
-            rslt = pyhf_wrapper(*args)
-            if tag == "exp" and not self.is_apriori:
-                return rslt["CLs_exp"][2]
-            return rslt['CLs_obs']
-
-        def sig95(conf, regdat, bkg):
-            def CLs(xsec):
-                signal = HF_Signal(conf, regdat, xsection=xsec)
-                return get_pyhf_result(bkg(lumi), signal(lumi))-0.95
+        # The background workspace and the signal patch for a cross section of
+        # 1 pb are built once per profile; the cross section is then scanned
+        # through the signal normfactor of the (cached) pyhf model.
+        def sig95(bkg_HF, sig_HF, key):
+            def CLs(xsec, index):
+                rslt = pyhf_wrapper(bkg_HF, sig_HF, poi_test=xsec[0], cache_key=key)
+                if tag == "exp" and not self.is_apriori:
+                    return np.array([rslt["CLs_exp"][2]-0.95])
+                return np.array([rslt['CLs_obs']-0.95])
             return CLs
 
         iterator = [] if self.pyhf_config=={} else copy.deepcopy(list(self.pyhf_config.items()))
@@ -1633,29 +2006,22 @@ class RunRecast():
                 regiondata['pyhf'][likelihood_profile] = {}
             background = HF_Background(config, expected=(tag=='exp' and self.is_apriori))
             self.logger.debug('Config : '+str(config))
-            if not HF_Signal(config, regiondata, xsection=1., background=background).isAlive():
+            signal = HF_Signal(config, regiondata, xsection=1., background=background)
+            if not signal.isAlive():
                 self.logger.debug(likelihood_profile+' has no signal event.')
                 regiondata['pyhf'][likelihood_profile]["s95"+tag] = "-1"
                 continue
+            bkg_HF = background(lumi)
+            sig_HF = signal(lumi)
+            CLs    = sig95(bkg_HF, sig_HF, pyhf_model_key(background, sig_HF, lumi))
 
-            low, hig = 1., 1.
-            while get_pyhf_result(background(lumi),\
-                                  HF_Signal(config, regiondata,xsection=low)(lumi)) > 0.95:
-                self.logger.debug(tag+': profile '+likelihood_profile+\
-                                               ', lower bound = '+str(low))
-                low *= 0.1
-                if low < 1e-10: break
-            while get_pyhf_result(background(lumi),\
-                                  HF_Signal(config, regiondata,xsection=hig)(lumi)) < 0.95:
-                self.logger.debug(tag+': profile '+likelihood_profile+\
-                                               ', higher bound = '+str(hig))
-                hig *= 10.
-                if hig > 1e10: break
+            regions = [SR for item in config.get('SR', {}).values() if item['is_included']
+                       for SR in item['data'] if SR in regiondata]
             try:
-                import scipy
-                s95 = scipy.optimize.brentq(
-                    sig95(config, regiondata, background),low,hig,xtol=low/100.
-                )
+                s95 = batch_s95(CLs, 1, guess = self.s95_guess(regiondata, regions, lumi, tag),
+                                rtol = self.main.recasting.CLs_s95_tolerance)[0]
+                if s95 < 0.:
+                    raise ValueError('no bracket found')
             except Exception as err:
                 self.logger.debug(str(err))
                 self.logger.debug('Can not calculate sig95'+tag+' for '+likelihood_profile)
@@ -1844,6 +2210,50 @@ def clean_region_name(mystr):
     return newstr
 
 
+# Compiled pyhf models (and the associated data) kept across the CLs
+# evaluations of a given likelihood profile. The keys are built by
+# pyhf_model_key and the oldest entries are dropped first.
+_pyhf_models    = OrderedDict()
+_pyhf_models_max = 8
+
+
+def pyhf_model_key(background, signal, lumi):
+    """
+    Key identifying the pyhf model built from a background likelihood
+    (HF_Background instance) and a reference signal patch at a given lumi.
+    """
+    filename = background.filename()
+    return (filename, os.path.getmtime(filename), float(lumi), background.expected,
+            json.dumps(signal, sort_keys=True))
+
+
+def pyhf_signal_model(background, signal):
+    """
+    pyhf model (and data) of a background workspace patched with a signal
+    patch. The POI is the normfactor of the signal samples (mu_SIG), so that
+    the signal strength is scanned without rebuilding the model. If the POI of
+    the measurement is another parameter, it is fixed to its nominal value.
+    Also returns the fixed parameters to use in the fits (None = default).
+    """
+    import jsonpatch
+    import pyhf
+    settings  = {'normsys': {'interpcode': 'code4'}, 'histosys': {'interpcode': 'code4p'}}
+    workspace = pyhf.Workspace(background)
+    config    = workspace.get_measurement()['config']
+    if config['poi'] == 'mu_SIG':
+        model = workspace.model(patches=[signal], modifier_settings=settings)
+        return model, workspace.data(model), None
+    spec  = jsonpatch.apply_patch(
+        {'channels': workspace['channels'], 'parameters': config['parameters']}, signal
+    )
+    model = pyhf.Model(spec, poi_name='mu_SIG', modifier_settings=settings)
+    fixed = model.config.suggested_fixed()
+    if config['poi'] in model.config.parameters:
+        for index in range(*model.config.par_slice(config['poi']).indices(len(fixed))):
+            fixed[index] = True
+    return model, workspace.data(model), fixed
+
+
 def pyhf_wrapper(*args, **kwargs):
     """
     Computes CLs values via pyhf interface
@@ -1855,6 +2265,15 @@ def pyhf_wrapper(*args, **kwargs):
             return expected values
         CLs_obs: bool
             return obs values
+        poi_test: float
+            signal strength tested for the `bkg_HF, sig_HF` input (default 1). The
+            signal patch is then a reference hypothesis that is rescaled through
+            the normfactor of the signal sample. A signal strength that is not
+            positive means that there is no signal, and the exclusion (1-CLs)
+            is then 0.
+        cache_key: hashable
+            key (see pyhf_model_key) under which the compiled model is stored and
+            reused in subsequent calls.
     """
     import pyhf
     from numpy import isnan, ndarray, warnings
@@ -1865,27 +2284,35 @@ def pyhf_wrapper(*args, **kwargs):
     pyhf.workspace.log.setLevel(logging.CRITICAL)
     mixins.log.setLevel(logging.CRITICAL)
     pyhf.set_backend('numpy', precision="64b")
+    poi_test = float(kwargs.get("poi_test", 1.))
+    if poi_test <= 0.:
+        # No signal: nothing is excluded
+        if kwargs.get("CLs_exp", False) or kwargs.get("CLs_obs", False):
+            return 0.
+        return {'CLs_obs': 0., 'CLs_exp': [0.]*5}
 
     with warnings.catch_warnings():
         warnings.filterwarnings('ignore')
         try:
             if len(args) == 2 and all([isinstance(x, (dict, list)) for x in args]):
                 background, signal = args
-                workspace = pyhf.Workspace(background)
-                model     = workspace.model(
-                    patches=[signal],
-                    modifier_settings={'normsys': {'interpcode': 'code4'},
-                                       'histosys': {'interpcode': 'code4p'}}
-                )
-
-                data = workspace.data(model)
+                key = kwargs.get("cache_key", None)
+                if key is not None and key in _pyhf_models:
+                    model, data, fixed = _pyhf_models[key]
+                else:
+                    model, data, fixed = pyhf_signal_model(background, signal)
+                    if key is not None:
+                        _pyhf_models[key] = (model, data, fixed)
+                        while len(_pyhf_models) > _pyhf_models_max:
+                            _pyhf_models.popitem(last=False)
 
             elif len(args) == 5 and all([isinstance(x, (float, int)) for x in args]):
                 NumObserved, ExpectedBG, BGError, SigHypothesis, _ = args
                 model = pyhf.simplemodels.uncorrelated_background(
                     [max(SigHypothesis, 0.0)], [ExpectedBG], [BGError]
                 )
-                data = [NumObserved] + model.config.auxdata
+                data  = [NumObserved] + model.config.auxdata
+                fixed = None
 
         except (pyhf.exceptions.InvalidSpecification, KeyError) as err:
             logging.getLogger('MA5').error("Invalid JSON file!! "+str(err))
@@ -1901,9 +2328,11 @@ def pyhf_wrapper(*args, **kwargs):
         def get_CLs(**kwargs):
             try:
                 CLs_obs, CLs_exp = pyhf.infer.hypotest(
-                    1., data, model,
+                    poi_test, data, model,
                     test_stat=kwargs.get("stats", "qtilde"),
+                    init_pars=init_pars,
                     par_bounds=kwargs.get('bounds', model.config.suggested_bounds()),
+                    fixed_params=fixed,
                     return_expected_set=True
                 )
 
@@ -1922,9 +2351,18 @@ def pyhf_wrapper(*args, **kwargs):
             }
 
 
+        # The POI range and starting point are expressed in units of the tested
+        # signal strength, so that the fit is a reparametrisation of the one
+        # performed with the signal patch rescaled by poi_test
+        poi_index = model.config.poi_index
+        init_pars = model.config.suggested_init()
+        init_pars[poi_index] = init_pars[poi_index]*poi_test
+        bounds    = model.config.suggested_bounds()
+        bounds[poi_index] = (bounds[poi_index][0]*poi_test, bounds[poi_index][1]*poi_test)
+
         #pyhf can raise an error if the poi_test bounds are too stringent
         #they need to be updated dynamically.
-        arguments = dict(bounds=model.config.suggested_bounds(), stats="qtilde")
+        arguments = dict(bounds=bounds, stats="qtilde")
         iteration_limit = 0
         while True:
             CLs = get_CLs(**arguments)
@@ -1942,7 +2380,7 @@ def pyhf_wrapper(*args, **kwargs):
                 if isnan(CLs["CLs_obs"]) or any([isnan(x) for x in CLs["CLs_exp"]]):
                     arguments["stats"] = "q"
                     arguments["bounds"][model.config.poi_index] = (
-                        arguments["bounds"][model.config.poi_index][0]-5,
+                        arguments["bounds"][model.config.poi_index][0]-5*poi_test,
                         arguments["bounds"][model.config.poi_index][1]
                     )
                     logging.getLogger("MA5").debug(
@@ -1968,42 +2406,6 @@ def pyhf_wrapper(*args, **kwargs):
     return CLs
 
 
-def cls(NumObserved, ExpectedBG, BGError, SigHypothesis, NumToyExperiments, **kwargs):
-    import scipy.stats
-
-    # generate a set of expected-number-of-background-events, one for each toy
-    # experiment, distributed according to a Gaussian with the specified mean
-    # and uncertainty
-    ExpectedBGs = scipy.stats.norm.rvs(loc=ExpectedBG, scale=BGError, size=NumToyExperiments)
-
-    # Ignore values in the tail of the Gaussian extending to negative numbers
-    ExpectedBGs = [value for value in ExpectedBGs if value > 0]
-
-    # For each toy experiment, get the actual number of background events by
-    # taking one value from a Poisson distribution created using the expected
-    # number of events.
-    ToyBGs = scipy.stats.poisson.rvs(ExpectedBGs)
-    ToyBGs = list(map(float, ToyBGs))
-
-    # The probability for the background alone to fluctutate as LOW as
-    # observed = the fraction of the toy experiments with backgrounds as low as
-    # observed = p_b.
-    # NB (1 - this p_b) corresponds to what is usually called p_b for CLs.
-    p_b = scipy.stats.percentileofscore(ToyBGs, NumObserved, kind='weak')*.01
-
-    # Toy MC for background+signal
-    ExpectedBGandS = [expectedbg + SigHypothesis for expectedbg in ExpectedBGs]
-    ExpectedBGandS = [x for x in ExpectedBGandS if x > 0]
-    if len(ExpectedBGandS)==0:
-        return 0.
-    ToyBplusS = scipy.stats.poisson.rvs(ExpectedBGandS)
-    ToyBplusS = list(map(float, ToyBplusS))
-
-    # Calculate the fraction of these that are >= the number observed,
-    # giving p_(S+B). Divide by (1 - p_b) a la the CLs prescription.
-    p_SplusB = scipy.stats.percentileofscore(ToyBplusS, NumObserved, kind='weak')*.01
-
-    if p_SplusB>p_b:
-        return 0.
-    else:
-        return 1.-(p_SplusB / p_b) # 1 - CLs
+# Module-wide native CLs calculator, kept for backward compatibility (RunRecast
+# builds its own instance configured from the recasting options)
+cls = ToyCLs()
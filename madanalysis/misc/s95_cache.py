@@ -0,0 +1,101 @@
+################################################################################
+#
+#  Copyright (C) 2012-2023 Jack Araz, Eric Conte & Benjamin Fuks
+#  The MadAnalysis development team, email: <ma5team@iphc.cnrs.fr>
+#
+#  This file is part of MadAnalysis 5.
+#  Official website: <https://github.com/MadAnalysis/madanalysis5>
+#
+#  MadAnalysis 5 is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MadAnalysis 5 is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with MadAnalysis 5. If not, see <http://www.gnu.org/licenses/>
+#
+################################################################################
+
+
+
+from __future__ import absolute_import
+import hashlib, logging, os, sqlite3
+
+
+class S95Cache(object):
+    """
+        Persistent cache of the single-region limits on the number of signal
+        events, i.e. the 95% CL limits on the cross section times the signal
+        efficiency times the luminosity.
+
+        These limits only depend on the region yields read from the info files
+        (nobs, nb, deltanb) and on the statistical settings, and not on the
+        signal efficiency. They can hence be reused across a parameter scan,
+        the cross-section limit being obtained by rescaling. The entries are
+        keyed on a hash of all these inputs, so that any change in an info file
+        or in the CLs settings leads to a new calculation.
+    """
+
+    # To be increased when the limit calculation changes
+    version = 2
+
+    def __init__(self, path, settings):
+        """
+        :param path: sqlite file (created if needed)
+        :param settings: hashable description of the CLs calculator settings
+        """
+        self.path     = path
+        self.settings = repr(settings)
+        self.logger   = logging.getLogger('MA5')
+        self.db       = None
+        self.pid      = None
+        self.enabled  = True
+
+    def connection(self):
+        # A connection cannot be shared between processes (parallel CLs runs)
+        if self.db is None or self.pid != os.getpid():
+            self.db  = sqlite3.connect(self.path, timeout=60)
+            self.pid = os.getpid()
+            self.db.execute('CREATE TABLE IF NOT EXISTS s95 (key TEXT PRIMARY KEY, value REAL)')
+        return self.db
+
+    def key(self, NumObserved, ExpectedBG, BGError, tag):
+        """ Hash of the inputs of a single-region limit calculation """
+        inputs = repr((self.version, self.settings, tag,
+                       float(NumObserved), float(ExpectedBG), float(BGError)))
+        return hashlib.sha1(inputs.encode()).hexdigest()
+
+    def get(self, keys):
+        """ Dictionary key -> limit for the keys found in the cache """
+        if not self.enabled or len(keys) == 0:
+            return {}
+        try:
+            cursor = self.connection().execute(
+                'SELECT key, value FROM s95 WHERE key IN (' + ','.join(['?']*len(keys)) + ')',
+                list(keys)
+            )
+            return dict(cursor.fetchall())
+        except sqlite3.Error as err:
+            self.disable(err)
+            return {}
+
+    def put(self, items):
+        """ Stores a dictionary key -> limit """
+        if not self.enabled or len(items) == 0:
+            return
+        try:
+            db = self.connection()
+            with db:
+                db.executemany('INSERT OR REPLACE INTO s95 (key, value) VALUES (?, ?)',
+                               [(k, float(v)) for k, v in items.items()])
+        except sqlite3.Error as err:
+            self.disable(err)
+
+    def disable(self, err):
+        self.logger.debug('The s95 cache ' + self.path + ' cannot be used: ' + str(err))
+        self.enabled = False
@@ -35,7 +35,7 @@
 
 from __future__ import print_function
 from __future__ import absolute_import
-from scipy import stats, optimize, integrate, special
+from scipy import stats, optimize, integrate, special, linalg
 from scipy import __version__ as scipy_version
 from numpy  import sqrt, exp, log, sign, array, ndarray
 from functools import reduce
@@ -79,6 +79,7 @@ class Data:
             self.third_moment = None
         self.name = name
         self.deltas_rel = deltas_rel
+        self._factors = None
         self._computeABC()
         # Checking the scip version
         v = float(scipy_version.split(".")[0])
@@ -97,6 +98,33 @@ class Data:
         return cov_tot
 
 
+    def factorizeV(self):
+        """
+        Cholesky factor, inverse and log-determinant of V. They are computed
+        once and reused for all the signal hypotheses.
+        Raises numpy.linalg.LinAlgError if V is not positive definite.
+        """
+        if self._factors is None:
+            L = NP.linalg.cholesky(self.V)
+            weight = linalg.cho_solve((L, True), NP.eye(self.n))
+            logdet = 2.*NP.sum(log(NP.diag(L)))
+            self._factors = (L, weight, logdet)
+        return self._factors
+
+    def gaussianWeight(self, nsig):
+        """
+        Inverse and log-determinant of the covariance matrix of the nuisance
+        parameters, i.e. V, or for a single dataset the total covariance
+        including the signal uncertainty for the signal hypothesis <nsig>.
+        """
+        if self.n == 1:
+            cov = self.totalCovariance(nsig)
+            if cov[0][0] <= 0.:
+                raise NP.linalg.LinAlgError("non-positive variance")
+            return 1./cov, log(cov[0][0])
+        _, weight, logdet = self.factorizeV()
+        return weight, logdet
+
     def zeroSignal(self):
         """
         Is the total number of signal events zero?
@@ -263,6 +291,7 @@ class LikelihoodComputer:
         
         self.model = data
         self.ntoys = ntoys
+        self.thetas = None
 
     def dLdMu(self, mu, signal_rel, theta_hat):
         """
@@ -389,16 +418,15 @@ class LikelihoodComputer:
             poisson = stats.poisson.pmf( self.model.observed, lmbda )
             #print ( "nonll",poisson )
         try:
-            M = [0.]*len(theta)
-            C = self.model.V
-            if self.model.n == 1:
-                C = self.model.totalCovariance(self.nsig)
+            weight, logdet = self.model.gaussianWeight(self.nsig)
+            theta = NP.asarray(theta).reshape(-1)
+            ## log of the centered multivariate normal density
+            gaussian = -.5*( NP.dot(theta, NP.dot(weight, theta)) + logdet + \
+                             len(theta)*log(2.*NP.pi) )
             if nll:
-                gaussian = stats.multivariate_normal.logpdf(theta,mean=M,cov=C)
                 ret = - gaussian - sum(poisson)
             else:
-                gaussian = stats.multivariate_normal.pdf(theta,mean=M,cov=C)
-                ret = gaussian * ( reduce(lambda x, y: x*y, poisson) )
+                ret = exp(gaussian) * ( reduce(lambda x, y: x*y, poisson) )
             return ret
         except ValueError as e:
             raise Exception("ValueError %s, %s" % ( e, self.model.totalCovariance(self.nsig) ))
@@ -451,7 +479,9 @@ class LikelihoodComputer:
             ## for now deal with variances only
             ntot = nb + nsig
             cov = NP.array(sigma2)
-            weight = NP.linalg.inv(cov)  ## weight matrix
+            weight = None
+            if max_iterations > 0:
+                weight = NP.linalg.inv(cov)  ## weight matrix
             diag_cov = NP.diag(cov)
             # first: no covariances:
             q = diag_cov * ( ntot - nobs )
@@ -516,7 +546,7 @@ class LikelihoodComputer:
                 # self.cov_tot = self.model.V + self.model.var_s(nsig)
                 # self.cov_tot = self.model.totalCovariance (nsig)
                 #self.ntot = None
-            self.weight = NP.linalg.inv(self.cov_tot)
+            self.weight = self.model.gaussianWeight(nsig)[0]
             self.ones = 1.
             if type ( self.model.observed) in [ list, ndarray ]:
                 self.ones = NP.ones ( len (self.model.observed) )
@@ -638,32 +668,33 @@ class LikelihoodComputer:
             if self.model.isLinear() and self.model.n == 1: ## 1-dimensional non-skewed llhds we can integrate analytically
                 return self.marginalizedLLHD1D ( nsig, nll )
 
-            vals=[]
             self.gammaln = special.gammaln(self.model.observed + 1)
-            thetas = stats.multivariate_normal.rvs(mean=[0.]*self.model.n,
-                          # cov=(self.model.totalCovariance(nsig)),
-                          cov=self.model.V,
-                          size=self.ntoys ) ## get ntoys values
-            for theta in thetas :
-                if self.model.isLinear():
-                    lmbda = nsig + self.model.backgrounds + theta
-                else:
-                    lmbda = nsig + self.model.A + theta + self.model.C*theta**2/self.model.B**2
-                if self.model.isScalar( lmbda ):
-                    lmbda = array([lmbda])
-                for ctr,v in enumerate( lmbda ):
-                    if v<=0.: lmbda[ctr]=1e-30
-#                    print ( "lmbda=",lmbda )
-                poisson = self.model.observed*NP.log(lmbda) - lmbda - self.gammaln
-                # poisson = NP.exp(self.model.observed*NP.log(lmbda) - lmbda - self.model.backgrounds - self.gammaln)
-                vals.append( NP.exp ( sum(poisson) ) )
-                #vals.append ( reduce(lambda x, y: x*y, poisson) )
-            mean = NP.mean( vals )
+            thetas = self.thetaSamples()
+            if self.model.isLinear():
+                lmbda = nsig + self.model.backgrounds + thetas
+            else:
+                lmbda = nsig + self.model.A + thetas + self.model.C*thetas**2/self.model.B**2
+            lmbda = NP.where(lmbda <= 0., 1e-30, lmbda)
+            poisson = NP.sum(self.model.observed*NP.log(lmbda) - lmbda - self.gammaln, axis=1)
+            ## log of the mean of the likelihoods of the toys (log-sum-exp)
+            logmean = special.logsumexp(poisson) - log(len(poisson))
             if nll:
-                if mean == 0.:
-                    mean = 1e-100
-                mean = - log ( mean )
-            return mean
+                return - logmean
+            return exp(logmean)
+
+    def thetaSamples(self):
+        """ ntoys values of the nuisance parameters, drawn once from a
+            multivariate normal distribution of covariance V and reused for
+            all the signal hypotheses """
+        if self.thetas is None:
+            try:
+                factor = self.model.factorizeV()[0]
+            except NP.linalg.LinAlgError:
+                ## V is only positive semi-definite
+                w, v = NP.linalg.eigh(self.model.V)
+                factor = v*sqrt(NP.maximum(w, 0.))
+            self.thetas = NP.random.standard_normal((self.ntoys, self.model.n)).dot(factor.T)
+        return self.thetas
 
 
     def profileLikelihood( self, nsig, nll ):
@@ -864,27 +895,43 @@ class CLsComputer:
             return None
         if toys==None:
             toys=self.ntoys
-        oldmodel = model
+        return SimplifiedLikelihood(model, toys, marginalize, expected, self.cl).cls(1.)
+
+
+class SimplifiedLikelihood:
+    """
+    Signal-independent part of CLsComputer.computeCLs for a given model. The
+    nsignal of the model defines the signal for a unit signal strength (for
+    instance a cross section of 1 pb). The best fits, the Asimov data set and
+    the reference likelihoods are computed once, so that the CLs for any
+    signal strength only requires two likelihood evaluations.
+    """
+
+    def __init__(self, model, ntoys=10000, marginalize=False, expected=False, cl=.95):
+        """
+        :param model: a Data object with a non-zero signal
+        :params ntoys: number of toys when marginalizing
+        :params marginalize: if true, marginalize nuisances, else profile them
+        :params expected: compute the expected value, not the observed.
+        :param cl: desired quantile for limits
+        """
+        self.cl = cl
         if expected:
-            model = copy.deepcopy(oldmodel)
+            model = copy.deepcopy(model)
             #model.observed = model.backgrounds
             for i,d in enumerate(model.backgrounds):
                 model.observed[i]=int(NP.round(d))
-        computer = LikelihoodComputer(model, toys)
+        self.model = model
+        computer = LikelihoodComputer(model, ntoys)
         mu_hat = computer.findMuHat(model.nsignal)
         theta_hat0,_ = computer.findThetaHat(0*model.nsignal)
-        sigma_mu = computer.getSigmaMu(model.nsignal)
 
         aModel = copy.deepcopy(model)
         aModel.observed = array([NP.round(x+y) for x,y in zip(model.backgrounds,theta_hat0)])
-        #print ( "aModeldata=", aModel.observed )
-        #aModel.observed = array ( [ round(x) for x in model.backgrounds ] )
         aModel.name = aModel.name + "A"
-        compA = LikelihoodComputer(aModel, toys)
+        compA = LikelihoodComputer(aModel, ntoys)
         ## compute
         mu_hatA = compA.findMuHat(aModel.nsignal)
-        # if mu_hat < 0.:
-            # mu_hat = 0.
         # -log L(mu_hat, theta_hat(mu_hat))
         nll0 = computer.likelihood(model.signals(mu_hat),
                                         marginalize=marginalize,
@@ -903,17 +950,21 @@ class CLsComputer:
         nll0A = compA.likelihood(aModel.signals(mu_hatA),
                                     marginalize=marginalize,
                                     nll=True)
-        
-        # nsig = model.signals(1.)
-        computer.ntot = model.backgrounds + model.nsignal
-        # -log L(mu = 1, theta(1))
-        nll = computer.likelihood(model.nsignal, marginalize=marginalize, nll=True )
-        nllA = compA.likelihood(model.nsignal, marginalize=marginalize, nll=True )
-        qmu =  2*( nll - nll0 )
+        self.computer, self.compA = computer, compA
+        self.nll0, self.nll0A = nll0, nll0A
+        self.marginalize = marginalize
+
+    def cls(self, mu):
+        """ exclusion confidence level (1-CLs) for the signal mu*nsignal """
+        nsig = self.model.signals(mu)
+        self.computer.ntot = self.model.backgrounds + nsig
+        # -log L(mu, theta(mu))
+        nll = self.computer.likelihood(nsig, marginalize=self.marginalize, nll=True )
+        nllA = self.compA.likelihood(nsig, marginalize=self.marginalize, nll=True )
+        qmu =  2*( nll - self.nll0 )
         if qmu<0.: qmu=0.
         sqmu = sqrt (qmu)
-        qA =  2*( nllA - nll0A )
-        # print ( "mu: %s, qMu: %s, qA: %s nll0A: %s nllA: %s" % ( mu, qmu, qA, nll0A, nllA ) )
+        qA =  2*( nllA - self.nll0A )
         if qA<0.:
             qA=0.
         sqA = sqrt(qA)
@@ -927,11 +978,19 @@ class CLsComputer:
             else:
                 CLsb = 1. - stats.multivariate_normal.cdf( (qmu + qA)/(2*sqA) )
                 CLb = 1. - stats.multivariate_normal.cdf( (qmu - qA)/(2*sqA) )
-        # CLs = 0.
-        # if CLb > 0.:
         CLs = CLsb/CLb if CLb > 0. else 1.
         return 1 - CLs
 
+    def s95(self, guess=1., rtol=1e-2):
+        """ signal strength excluded at the confidence level cl (-1 if not found)
+        :param guess: estimate of the limit
+        :param rtol: relative precision of the limit
+        """
+        from madanalysis.misc.native_cls import batch_s95
+        def root_func(mu, index):
+            return array([self.cls(mu[0]) - self.cl])
+        return batch_s95(root_func, 1, guess=guess, rtol=rtol)[0]
+
 
 if __name__ == "__main__":
     C = [ 18774.2, -2866.97, -5807.3, -4460.52, -2777.25, -1572.97, -846.653, -442.531,
@@ -0,0 +1,192 @@
+################################################################################
+#  
+#  Copyright (C) 2012-2023 Jack Araz, Eric Conte & Benjamin Fuks
+#  The MadAnalysis development team, email: <ma5team@iphc.cnrs.fr>
+#  
+#  This file is part of MadAnalysis 5.
+#  Official website: <https://github.com/MadAnalysis/madanalysis5>
+#  
+#  MadAnalysis 5 is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#  
+#  MadAnalysis 5 is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with MadAnalysis 5. If not, see <http://www.gnu.org/licenses/>
+#  
+################################################################################
+
+
+
+# Standard modules
+from __future__ import absolute_import
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import os
+import sys
+import threading
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class Profiler():
+    """
+    Records the wall time, the CPU time and the peak resident memory of the
+    stages of a run, optionally per dataset. The CPU times are those of the
+    MadAnalysis 5 process and of its finished child processes (SampleAnalyzer,
+    compilers, latex, ...) during the stage. The peak memories are high-water
+    marks since the start of the session.
+
+    These numbers are process-wide, so that they are only valid for the stages
+    of the main thread, which include the work of the thread pools they wait
+    for. A stage of a pool thread overlapping a stage of another pool thread
+    (e.g. datasets or reports processed at the same time) is flagged as
+    concurrent and only its wall time is recorded. Stages measured in other
+    processes (e.g. the forked CLs workers) are added with Add.
+    """
+
+    counters = ['wall_time', 'cpu_time', 'children_cpu_time']
+    peaks    = ['peak_rss_mb', 'children_peak_rss_mb']
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.Reset()
+
+    # Forgetting the stages recorded so far
+    def Reset(self):
+        with self.lock:
+            self.records = []
+            self.origin  = time.time()
+            self.running = []
+
+    # CPU times (in s) and peak resident memories (in MB) of the process
+    # and of its children
+    @staticmethod
+    def Usage():
+        if resource is None:
+            times = os.times()
+            return times[0]+times[1], times[2]+times[3], 0., 0.
+        scale = 1024.*1024. if sys.platform=='darwin' else 1024.
+        usage    = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime+usage.ru_stime, children.ru_utime+children.ru_stime, \
+               usage.ru_maxrss/scale, children.ru_maxrss/scale
+
+    # Measuring a stage: with profiler.Stage('name'): ...
+    @contextmanager
+    def Stage(self, name, dataset=None):
+        start = time.time()
+        usage = Profiler.Usage()
+
+        # Stages of the pool threads running at the same time
+        state  = {'thread': threading.current_thread().ident, 'concurrent': False}
+        worker = threading.current_thread() is not threading.main_thread()
+        if worker:
+            with self.lock:
+                for other in self.running:
+                    if other['thread']!=state['thread']:
+                        other['concurrent'] = True
+                        state['concurrent'] = True
+                self.running.append(state)
+
+        try:
+            yield
+        finally:
+            end = Profiler.Usage()
+            with self.lock:
+                if worker:
+                    self.running = [x for x in self.running if x is not state]
+                concurrent = state['concurrent']
+                Valid = lambda x: None if concurrent else x
+                self.records.append(OrderedDict([
+                    ('stage',                name),
+                    ('dataset',              dataset),
+                    ('start',                round(start-self.origin, 3)),
+                    ('wall_time',            round(time.time()-start, 3)),
+                    ('concurrent',           concurrent),
+                    ('cpu_time',             Valid(round(end[0]-usage[0], 3))),
+                    ('children_cpu_time',    Valid(round(end[1]-usage[1], 3))),
+                    ('peak_rss_mb',          Valid(round(end[2], 1))),
+                    ('children_peak_rss_mb', Valid(round(end[3], 1))),
+                ]))
+
+    # Adding stages measured in another process
+    def Add(self, records):
+        with self.lock:
+            self.records.extend(records)
+
+    # Returning and forgetting the stages recorded so far
+    def Extract(self):
+        with self.lock:
+            records, self.records = self.records, []
+        return records
+
+    # Stages in the order they started
+    def Records(self):
+        with self.lock:
+            return sorted(self.records, key=lambda x: (x['start'], -x['wall_time']))
+
+    # Totals per stage, for the stages whose name starts with prefix. The CPU
+    # times and the memories of a stage run concurrently at least once are None.
+    def Summary(self, prefix=''):
+        summary = OrderedDict()
+        for record in self.Records():
+            if not record['stage'].startswith(prefix):
+                continue
+            if record['stage'] not in summary:
+                summary[record['stage']] = OrderedDict([('calls', 0)] + \
+                    [(key, 0.) for key in Profiler.counters+Profiler.peaks])
+            item = summary[record['stage']]
+            item['calls'] += 1
+            for key in Profiler.counters:
+                if item[key] is None or record[key] is None:
+                    item[key] = None
+                else:
+                    item[key] = round(item[key]+record[key], 3)
+            for key in Profiler.peaks:
+                if item[key] is None or record[key] is None:
+                    item[key] = None
+                else:
+                    item[key] = max(item[key], record[key])
+        return summary
+
+    # Summary as a text table
+    def Table(self, prefix=''):
+        summary = self.Summary(prefix)
+        if len(summary)==0:
+            return []
+        width = max(len(x) for x in summary)
+        Format = lambda fmt, x: '-' if x is None else fmt % x
+        lines = ['stage'.ljust(width)+'calls'.rjust(7)+'wall [s]'.rjust(11)+\
+                 'cpu [s]'.rjust(11)+'child cpu [s]'.rjust(15)+'rss [MB]'.rjust(10)+\
+                 'child rss [MB]'.rjust(16)]
+        for stage, item in summary.items():
+            lines.append(stage.ljust(width)+str(item['calls']).rjust(7)+\
+                         Format('%.2f', item['wall_time']).rjust(11)+\
+                         Format('%.2f', item['cpu_time']).rjust(11)+\
+                         Format('%.2f', item['children_cpu_time']).rjust(15)+\
+                         Format('%.1f', item['peak_rss_mb']).rjust(10)+\
+                         Format('%.1f', item['children_peak_rss_mb']).rjust(16))
+        return lines
+
+    # Machine-readable output: all the stages and their totals
+    def Write(self, filename):
+        try:
+            with open(filename+'.tmp', 'w') as output:
+                json.dump(OrderedDict([('stages', self.Records()), ('summary', self.Summary())]),
+                          output, indent=2)
+            os.rename(filename+'.tmp', filename)
+        except Exception as err:
+            logging.getLogger('MA5').warning('Impossible to write the timing file '+filename)
+            logging.getLogger('MA5').debug(str(err))
+            return False
+        return True
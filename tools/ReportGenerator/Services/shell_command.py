@@ -86,7 +86,7 @@ class ShellCommand():
 
 
     @staticmethod
-    def ExecuteWithMA5Logging(theCommands,path,silent=False):
+    def ExecuteWithMA5Logging(theCommands,path,silent=False,prefix=''):
         logging.getLogger('MA5')
         # Launching the commands
         try:
@@ -95,7 +95,7 @@ class ShellCommand():
             if not silent:
                 logging.getLogger('MA5').error('impossible to execute the commands: '+' '.join(theCommands))
             logging.getLogger('MA5').debug(str(err))
-            return False, None
+            return False
 
         while True:
             my_out = result.stdout.readline()
@@ -104,7 +104,7 @@ class ShellCommand():
             if my_out == '' and result.poll() is not None:
                 break
             if my_out and not 'progress' in my_out:
-                logging.getLogger('MA5').info('    '+my_out.strip())
+                logging.getLogger('MA5').info('    '+prefix+my_out.strip())
         result.poll()
 
         # Return results
@@ -122,6 +122,7 @@ class AnalyzerManager:
     def WriteSource(self):
         
         file = open(self.currentdir + "/User/Analyzer/" + self.name + ".cpp","w")
+        file.write('#include "SampleAnalyzer/Process/Analyzer/AnalyzerBase.h"\n')
         file.write('#include "SampleAnalyzer/User/Analyzer/'+self.name+'.h"\n')
         file.write('using namespace MA5;\n')
         file.write('using namespace std;\n')